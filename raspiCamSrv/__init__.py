@@ -4,7 +4,8 @@ from flask import Flask
 import logging
 from flask.logging import default_handler
 from picamera2 import Picamera2
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, FrameRing
+from raspiCamSrv.metrics import Metrics
 from raspiCamSrv.motionDetector import MotionDetector
 from raspiCamSrv.triggerHandler import TriggerHandler
 import json
@@ -58,6 +59,17 @@ def create_app(test_config=None):
         logging.getLogger("raspiCamSrv.sun"),
         logging.getLogger("raspiCamSrv.api"),
         logging.getLogger("raspiCamSrv.stereoCam"),
+        logging.getLogger("raspiCamSrv.asyncStreamer"),
+        logging.getLogger("raspiCamSrv.metrics"),
+        logging.getLogger("raspiCamSrv.motionWorker"),
+        logging.getLogger("raspiCamSrv.eventWriter"),
+        logging.getLogger("raspiCamSrv.eventCleanup"),
+        logging.getLogger("raspiCamSrv.mediaIndex"),
+        logging.getLogger("raspiCamSrv.thumbnails"),
+        logging.getLogger("raspiCamSrv.zipStream"),
+        logging.getLogger("raspiCamSrv.media"),
+        logging.getLogger("raspiCamSrv.retention"),
+        logging.getLogger("raspiCamSrv.usbCircular"),
     ):
         logger.setLevel(logging.ERROR)
 
@@ -83,9 +95,20 @@ def create_app(test_config=None):
     # logging.getLogger("raspiCamSrv.console").setLevel(logging.DEBUG)
     # logging.getLogger("raspiCamSrv.api").setLevel(logging.DEBUG)
     # logging.getLogger("raspiCamSrv.stereoCam").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.asyncStreamer").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.metrics").setLevel(logging.DEBUG)
     # logging.getLogger("raspiCamSrv.info").setLevel(logging.DEBUG)
     # logging.getLogger("raspiCamSrv.config").setLevel(logging.DEBUG)
     # logging.getLogger("raspiCamSrv.gpioDevices").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.motionWorker").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.eventWriter").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.eventCleanup").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.mediaIndex").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.thumbnails").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.zipStream").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.media").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.retention").setLevel(logging.DEBUG)
+    # logging.getLogger("raspiCamSrv.usbCircular").setLevel(logging.DEBUG)
 
     # >>>>> Set log level for picamera2 (DEBUG, INFO, WARNING, ERROR)
     Picamera2.set_logging(logging.ERROR)
@@ -149,6 +172,10 @@ def create_app(test_config=None):
     sc.cfgBackupPath = os.path.dirname(app.instance_path) + "/backups"
     sc.checkEnvironment()
     sc.database = os.path.join(app.instance_path, "raspiCamSrv.sqlite")
+    from . import dbx
+    dbx.update_schema()
+    FrameRing.latency.enabled = sc.streamLatencyHistogram
+    Metrics.setEnabled(sc.collectMetrics)
     stc = cfg.stereoCfg
     stc.calibPhotosPath = app.static_folder + "/calib_photos/"
     stc.calibPhotosSubPath = "calib_photos/"
@@ -202,6 +229,14 @@ def create_app(test_config=None):
             else:
                 sr.nextStatus("pause")
 
+    # Scheduler for automatic cleanup of events
+    from raspiCamSrv.eventCleanup import EventCleanup
+    EventCleanup.startScheduler()
+
+    # Storage usage tracking and retention
+    from raspiCamSrv.retention import Retention
+    Retention.start()
+
     # Autostart triggered capture, if configured
     if tc.operationAutoStart == True:
         if tc.triggeredByMotion == True:
@@ -211,6 +246,10 @@ def create_app(test_config=None):
             TriggerHandler().start()
             sc.isEventhandling = True
 
+    # Serve static content with range requests and caching for media
+    from . import media
+    app.view_functions["static"] = media.static
+
     # Register required blueprints
     from . import auth
     app.register_blueprint(auth.bp)
@@ -260,4 +299,9 @@ def create_app(test_config=None):
                 app.config["JWT_REFRESH_TOKEN_EXPIRES"] = datetime.timedelta(days=sc.jwtRefreshTokenExpirationDays)
             jwt = JWTManager(app)
 
+    # Start the asynchronous streaming server, if configured
+    if sc.useAsyncStreaming == True:
+        from .asyncStreamer import AsyncStreamer
+        AsyncStreamer().start(app, sc.asyncStreamingPort)
+
     return app
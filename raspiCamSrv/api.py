@@ -1,9 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from werkzeug.security import check_password_hash
 from werkzeug.exceptions import abort
 from raspiCamSrv.db import get_db
 
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, StreamClient, FrameRing
+from raspiCamSrv.metrics import Metrics
 from raspiCamSrv.camCfg import CameraCfg, TuningConfig
 from raspiCamSrv.photoseriesCfg import PhotoSeriesCfg
 from _thread import get_ident
@@ -11,6 +12,7 @@ import datetime
 import time
 from raspiCamSrv.motionDetector import MotionDetector
 from raspiCamSrv.triggerHandler import TriggerHandler
+from raspiCamSrv.retention import Retention
 from raspiCamSrv.version import version
 from raspiCamSrv.home import generateHistogram
 
@@ -340,15 +342,37 @@ def info():
         infoStatus["livestream2_active"] = sc.isLiveStream2
     infoStatus["photoseries_recording"] = sc.isPhotoSeriesRecording
     infoStatus["motion_capturing"] = sc.isTriggerRecording == True and tc.triggeredByMotion == True
+    if infoStatus["motion_capturing"] == True:
+        infoStatus["motion_mode"] = tc.motionMode
+        infoStatus["motion_rate"] = round(tc.motionTestFramerate, 1)
     infoStatus["event_handling"] = sc.isEventhandling == True and sc.isEventsWaiting == False
     infoStatus["video_recording"] = sc.isVideoRecording
     infoStatus["audio_recording"] = sc.isAudioRecording
     if len(cams) > 1:
         infoStatus["video_recording2"] = sc.isVideoRecording2
     info["operation_status"] = infoStatus
+    info["streaming_clients"] = StreamClient.getStats()
+    info["storage"] = Retention.getStatus()
+    if FrameRing.latency.enabled == True:
+        info["stream_latency"] = FrameRing.latency.toDict()
     
     return jsonify(message=info)
 
+@bp.route("/api/metrics", methods=["GET"])
+@jwt_required()
+def metrics():
+    logger.debug("In /api/metrics")
+    res = {}
+    res["enabled"] = Metrics.enabled
+    res["timers"] = Metrics.toDict()
+    return jsonify(message=res)
+
+@bp.route("/api/metrics/prometheus", methods=["GET"])
+@jwt_required()
+def metrics_prometheus():
+    logger.debug("In /api/metrics/prometheus")
+    return Response(Metrics.toPrometheus(), mimetype="text/plain; version=0.0.4")
+
 @bp.route("/api/switch_cameras", methods=["GET"])
 @jwt_required()
 def switch_cameras():
@@ -0,0 +1,338 @@
+from raspiCamSrv.camera_pi import Camera, FrameRing, StreamClient
+from raspiCamSrv.camCfg import CameraCfg
+from raspiCamSrv.dbx import get_dbx
+from raspiCamSrv.metrics import Metrics
+from _thread import get_ident
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFeed():
+    """State of a single MJPEG feed within the event loop"""
+
+    def __init__(self, ring: str, auth: str):
+        self.ring = ring            # Name of the FrameRing publishing to this feed
+        self.auth = auth            # "none", "streaming" or "login"
+        self.clients = 0
+        self.seq = 0
+        self.chunk = None
+        self.time = 0.0
+        self.event = None
+
+
+class AsyncStreamer():
+    """ Optional asynchronous front end for MJPEG streaming
+
+    All MJPEG feeds are served from a single asyncio event loop on a separate port.
+    Frames are pushed from the camera threads through FrameRing listeners,
+    so that an idle viewer costs a coroutine instead of an OS thread.
+    The Flask routes are not affected.
+    """
+    logger.debug("Thread %s: AsyncStreamer - setting class variables", get_ident())
+    _instance = None
+
+    # Feed path -> (ring name, authentication mode)
+    FEEDS = {
+        "/video_feed": ("video_feed", "streaming"),
+        "/video_feed2": ("video_feed2", "streaming"),
+        "/live_view_feed": ("video_feed", "login"),
+        "/test_frame1_feed": ("test_frame1_feed", "none"),
+        "/test_frame2_feed": ("test_frame2_feed", "none"),
+        "/test_frame3_feed": ("test_frame3_feed", "none"),
+        "/test_frame4_feed": ("test_frame4_feed", "none"),
+        "/stereo_feed": ("stereo_feed", "streaming"),
+    }
+    KEEPALIVE_INTERVAL = 2.0
+    REQUEST_TIMEOUT = 10.0
+    STREAM_HEADER = (
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+        b"Cache-Control: no-cache, private\r\n"
+        b"Pragma: no-cache\r\n"
+        b"Connection: close\r\n"
+        b"\r\n"
+        b"--frame\r\n"
+    )
+
+    def __new__(cls):
+        logger.debug("Thread %s: AsyncStreamer.__new__", get_ident())
+        if cls._instance is None:
+            logger.debug("Thread %s: AsyncStreamer.__new__ - Instantiating Class", get_ident())
+            cls._instance = super(AsyncStreamer, cls).__new__(cls)
+            cls.app = None
+            cls.port = None
+            cls.loop = None
+            cls.server = None
+            cls.thread = None
+            cls.kThread = None
+            cls.active = False
+            cls.feeds = {}
+            cls.ringFeeds = {}
+            for path, (ring, auth) in cls.FEEDS.items():
+                feed = AsyncFeed(ring, auth)
+                cls.feeds[path] = feed
+                if ring not in cls.ringFeeds:
+                    cls.ringFeeds[ring] = []
+                cls.ringFeeds[ring].append(feed)
+            cls.registeredClients = {}
+        return cls._instance
+
+    def start(self, app, port: int):
+        """ Start the streaming server in a background thread
+
+        app is the Flask application, used for session authentication.
+        """
+        logger.debug("Thread %s: AsyncStreamer.start - port: %s", get_ident(), port)
+        if self.thread is None:
+            self.app = app
+            self.port = port
+            self.active = True
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self._serverThread, daemon=True)
+            self.thread.start()
+            self.kThread = threading.Thread(target=self._keepAliveThread, daemon=True)
+            self.kThread.start()
+            FrameRing.listeners.append(self._onFrame)
+            logger.debug("Thread %s: AsyncStreamer.start - threads started", get_ident())
+
+    def stop(self):
+        """ Stop the streaming server"""
+        logger.debug("Thread %s: AsyncStreamer.stop", get_ident())
+        if self.thread is not None:
+            self.active = False
+            if self._onFrame in FrameRing.listeners:
+                FrameRing.listeners.remove(self._onFrame)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+            self.kThread = None
+
+    def _serverThread(self):
+        """ Run the event loop with the streaming server"""
+        logger.debug("Thread %s: AsyncStreamer._serverThread", get_ident())
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handleClient, host="0.0.0.0", port=self.port)
+            )
+            for feed in self.feeds.values():
+                feed.event = asyncio.Event()
+            logger.debug("Thread %s: AsyncStreamer._serverThread - listening on port %s", get_ident(), self.port)
+            self.loop.run_forever()
+        except Exception as e:
+            logger.error("Thread %s: AsyncStreamer._serverThread - Exception: %s", get_ident(), e)
+            self.active = False
+        finally:
+            if self.server:
+                self.server.close()
+            self.loop.close()
+        logger.debug("Thread %s: AsyncStreamer._serverThread - terminated", get_ident())
+
+    def _keepAliveThread(self):
+        """ Keep camera streams alive as long as async clients are connected
+
+        Threaded clients of the Flask routes do this with every frame they request.
+        """
+        logger.debug("Thread %s: AsyncStreamer._keepAliveThread", get_ident())
+        while self.active:
+            time.sleep(self.KEEPALIVE_INTERVAL)
+            rings = set([feed.ring for feed in self.feeds.values() if feed.clients > 0])
+            if "video_feed" in rings \
+            or "test_frame1_feed" in rings \
+            or "test_frame2_feed" in rings \
+            or "test_frame3_feed" in rings \
+            or "test_frame4_feed" in rings \
+            or "stereo_feed" in rings:
+                with Camera.threadLock:
+                    Camera.last_access = time.time()
+            if "video_feed2" in rings \
+            or "stereo_feed" in rings:
+                with Camera.thread2Lock:
+                    Camera.last_access2 = time.time()
+            if "stereo_feed" in rings:
+                from raspiCamSrv.stereoCam import StereoCam
+                StereoCam().last_access = time.time()
+        logger.debug("Thread %s: AsyncStreamer._keepAliveThread - terminated", get_ident())
+
+    def _onFrame(self, ring: str, seq: int, chunk: bytes, publishTime: float):
+        """ FrameRing listener. Runs in the publishing thread."""
+        if ring in self.ringFeeds:
+            for feed in self.ringFeeds[ring]:
+                if feed.clients > 0:
+                    self.loop.call_soon_threadsafe(self._dispatch, feed, seq, chunk, publishTime)
+
+    @staticmethod
+    def _dispatch(feed: AsyncFeed, seq: int, chunk: bytes, publishTime: float):
+        """ Store the new chunk and wake up all clients of the feed. Runs in the event loop."""
+        feed.seq = seq
+        feed.chunk = chunk
+        feed.time = publishTime
+        event = feed.event
+        feed.event = asyncio.Event()
+        event.set()
+
+    def _startStream(self, path: str):
+        """ Start the camera processes required for a feed, like the Flask routes do"""
+        logger.debug("Thread %s: AsyncStreamer._startStream - path: %s", get_ident(), path)
+        if path == "/video_feed2":
+            Camera().startLiveStream2()
+        elif path == "/stereo_feed":
+            from raspiCamSrv.stereoCam import StereoCam
+            Camera().startLiveStream()
+            Camera().startLiveStream2()
+            StereoCam().startStereoCam()
+            CameraCfg().serverConfig.isStereoCamActive = True
+        else:
+            Camera().startLiveStream()
+
+    def _isAuthorized(self, auth: str, cookieHeader: str) -> bool:
+        """ Check authorization of a request through the Flask session cookie"""
+        if auth == "none":
+            return True
+        if auth == "streaming":
+            if CameraCfg().serverConfig.requireAuthForStreaming == False:
+                return True
+        if not cookieHeader:
+            return False
+        try:
+            app = self.app
+            cookies = SimpleCookie()
+            cookies.load(cookieHeader)
+            cookieName = app.config.get("SESSION_COOKIE_NAME", "session")
+            if cookieName not in cookies:
+                return False
+            serializer = app.session_interface.get_signing_serializer(app)
+            if serializer is None:
+                return False
+            session = serializer.loads(
+                cookies[cookieName].value,
+                max_age=int(app.permanent_session_lifetime.total_seconds()),
+            )
+            user_id = session.get("user_id")
+            if user_id is None:
+                return False
+            db = get_dbx()
+            try:
+                userdb = db.execute("SELECT id FROM user WHERE id = ?", (user_id,)).fetchone()
+            finally:
+                db.close()
+            return userdb is not None
+        except Exception as e:
+            logger.debug("Thread %s: AsyncStreamer._isAuthorized - Exception: %s", get_ident(), e)
+            return False
+
+    def _registerClient(self, ipaddr: str, stream: str, register: bool):
+        """ Maintain the streaming client list of the server configuration
+
+        All async clients share the event loop thread, so clients are counted per IP and stream.
+        """
+        sc = CameraCfg().serverConfig
+        key = (ipaddr, stream)
+        count = self.registeredClients.get(key, 0)
+        if register:
+            if count == 0:
+                sc.registerStreamingClient(ipaddr, stream, self.thread.ident)
+            self.registeredClients[key] = count + 1
+        else:
+            if count <= 1:
+                sc.unregisterStreamingClient(ipaddr, stream, self.thread.ident)
+                self.registeredClients.pop(key, None)
+            else:
+                self.registeredClients[key] = count - 1
+
+    @staticmethod
+    def _response(writer, status: str, text: str):
+        """ Write a short plain text response"""
+        body = text.encode()
+        writer.write(
+            ("HTTP/1.1 " + status + "\r\n"
+             + "Content-Type: text/plain\r\n"
+             + "Content-Length: " + str(len(body)) + "\r\n"
+             + "Connection: close\r\n\r\n").encode() + body
+        )
+
+    async def _handleClient(self, reader, writer):
+        """ Handle a single streaming connection"""
+        peer = writer.get_extra_info("peername")
+        ipaddr = peer[0] if peer else ""
+        client = None
+        feed = None
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.REQUEST_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                return
+            lines = head.decode("latin-1").split("\r\n")
+            parts = lines[0].split(" ")
+            if len(parts) < 2 or parts[0] != "GET":
+                self._response(writer, "405 Method Not Allowed", "Method not allowed")
+                return
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            url = urlsplit(parts[1])
+            if url.path not in self.feeds:
+                self._response(writer, "404 Not Found", "Unknown feed")
+                return
+            feed = self.feeds[url.path]
+            authorized = await self.loop.run_in_executor(
+                None, self._isAuthorized, feed.auth, headers.get("cookie")
+            )
+            if not authorized:
+                feed = None
+                self._response(writer, "401 Unauthorized", "Please log in to raspiCamSrv")
+                return
+            fps = None
+            query = parse_qs(url.query)
+            if "fps" in query:
+                try:
+                    fps = float(query["fps"][0])
+                except ValueError:
+                    fps = None
+            stream = url.path[1:]
+            logger.debug("Thread %s: AsyncStreamer._handleClient - client IP: %s stream: %s", get_ident(), ipaddr, stream)
+
+            feed.clients += 1
+            client = StreamClient(ipaddr, stream, fps, thread=self.thread.ident)
+            self._registerClient(ipaddr, stream, True)
+            await self.loop.run_in_executor(None, self._startStream, url.path)
+
+            writer.write(self.STREAM_HEADER)
+            await writer.drain()
+            while self.active:
+                wait = client.waitTime()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if feed.seq == client.seq:
+                    await feed.event.wait()
+                # Latest frame wins: frames published while draining are skipped
+                seq = feed.seq
+                chunk = feed.chunk
+                if chunk is None or seq == client.seq:
+                    continue
+                client.delivered(seq)
+                if FrameRing.latency.enabled == True:
+                    FrameRing.latency.record(time.monotonic() - feed.time)
+                mt = Metrics.enabled and time.perf_counter()
+                writer.write(chunk)
+                await writer.drain()
+                if mt:
+                    Metrics.record("stream_send", time.perf_counter() - mt)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.error("Thread %s: AsyncStreamer._handleClient - Exception: %s", get_ident(), e)
+        finally:
+            if client is not None:
+                client.close()
+                self._registerClient(ipaddr, client.stream, False)
+                feed.clients -= 1
+            writer.close()
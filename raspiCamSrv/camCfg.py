@@ -11,7 +11,9 @@ from datetime import datetime
 from datetime import date
 from datetime import time
 from datetime import timedelta
+import sqlite3
 import raspiCamSrv.dbx as dbx
+from raspiCamSrv.eventWriter import EventWriter
 from raspiCamSrv.gpioDeviceTypes import gpioDeviceTypes
 from raspiCamSrv import versionDoc
 from raspiCamSrv.version import version as currentVersion
@@ -463,9 +465,11 @@ class Action():
         return act
 
 class TriggerConfig():
-    motionDetectAlgos = ["Mean Square Diff", "Frame Differencing", "Optical Flow", "Background Subtraction"]
+    motionDetectAlgos = ["Mean Square Diff", "Frame Differencing", "Optical Flow", "Background Subtraction", "Sparse Optical Flow"]
     videoRecorders = ["Normal", "Circular"]
     backgroundSubtractionModels = ["MOG2", "KNN"]
+    # Attributes which are only valid at runtime and are not persisted
+    transientAttrs = ["_motionMode", "_evPageAfter", "_evPageLast", "_evHasMore", "_calCache"]
     def __init__(self):
         self._triggeredByMotion = True
         self._triggeredBySound = False
@@ -486,19 +490,29 @@ class TriggerConfig():
         self._bboxThreshold = 400
         self._nmsThreshold = 0.001
         self._motionThreshold = 1
+        self._motionAnalysisScale = 1
+        self._motionDutyCycle = False
+        self._motionIdleRate = 2.0
+        self._motionPreThreshold = 5
+        self._motionQuietPeriod = 10
         self._useRoI = False
         self._regionOfNoInterest = ()
         self._regionOfInterest = ()
         self._backSubModel = "MOG2"
+        self._bgLearningRate = -1.0
+        self._bgWarmupFrames = 10
         self._videoBboxes = True
+        self._motionWorkerProcess = False
         self._photoRois = False
         self._motionTestFrame1Title = ""
         self._motionTestFrame2Title = ""
         self._motionTestFrame3Title = ""
         self._motionTestFrame4Title = ""
         self._motionTestFramerate = 0
+        self._motionMode = ""
         self._actionVR = 1
         self._actionCircSize = 5
+        self._actionCircMaxMB = 50
         self._actionPath = ""
         self._actionVideoDuration = 10
         self._actionPhotoBurst = 1
@@ -517,11 +531,19 @@ class TriggerConfig():
         self._notifyTo = ""
         self._notifySubject = ""
         self._retentionPeriod = 3
+        self._cleanupAuto = False
+        self._cleanupMinute = 180
+        self._cleanupLastRun = ""
         self._evStart = None
+        self._evPageSize = 50
+        self._evPageAfter = ("", 0)
+        self._evPageLast = ("", 0)
+        self._evHasMore = False
         self._evIncludePhoto = False
         self._evIncludeVideo = True
         self._evAutoRefresh = False
         self._calStart = None
+        self._calCache = None
         self._error = None
         self._error2 = None
         self._errorSource = None
@@ -722,6 +744,82 @@ class TriggerConfig():
     def motionThreshold(self, value: int):
         self._motionThreshold = value
 
+    @property
+    def bgLearningRate(self) -> float:
+        return self._bgLearningRate
+
+    @bgLearningRate.setter
+    def bgLearningRate(self, value: float):
+        if value < 0:
+            value = -1.0
+        if value > 1:
+            value = 1.0
+        self._bgLearningRate = value
+
+    @property
+    def bgWarmupFrames(self) -> int:
+        return self._bgWarmupFrames
+
+    @bgWarmupFrames.setter
+    def bgWarmupFrames(self, value: int):
+        if value < 0:
+            value = 0
+        self._bgWarmupFrames = value
+
+    @property
+    def motionAnalysisScale(self) -> int:
+        return self._motionAnalysisScale
+
+    @motionAnalysisScale.setter
+    def motionAnalysisScale(self, value: int):
+        if value not in (1, 2, 4):
+            value = 1
+        self._motionAnalysisScale = value
+
+    @property
+    def motionAnalysisScales(self) -> list:
+        return [1, 2, 4]
+
+    @property
+    def motionDutyCycle(self) -> bool:
+        return self._motionDutyCycle
+
+    @motionDutyCycle.setter
+    def motionDutyCycle(self, value: bool):
+        self._motionDutyCycle = value
+
+    @property
+    def motionIdleRate(self) -> float:
+        return self._motionIdleRate
+
+    @motionIdleRate.setter
+    def motionIdleRate(self, value: float):
+        if value < 0.1:
+            value = 0.1
+        if value > 10:
+            value = 10.0
+        self._motionIdleRate = value
+
+    @property
+    def motionPreThreshold(self) -> float:
+        return self._motionPreThreshold
+
+    @motionPreThreshold.setter
+    def motionPreThreshold(self, value: float):
+        if value < 0:
+            value = 0
+        self._motionPreThreshold = value
+
+    @property
+    def motionQuietPeriod(self) -> int:
+        return self._motionQuietPeriod
+
+    @motionQuietPeriod.setter
+    def motionQuietPeriod(self, value: int):
+        if value < 1:
+            value = 1
+        self._motionQuietPeriod = value
+
     @property
     def useRoI(self) -> bool:
         return self._useRoI
@@ -878,6 +976,14 @@ class TriggerConfig():
     def videoBboxes(self, value: bool):
         self._videoBboxes = value
 
+    @property
+    def motionWorkerProcess(self) -> bool:
+        return self._motionWorkerProcess
+
+    @motionWorkerProcess.setter
+    def motionWorkerProcess(self, value: bool):
+        self._motionWorkerProcess = value
+
     @property
     def photoRois(self) -> bool:
         return self._photoRois
@@ -925,6 +1031,14 @@ class TriggerConfig():
     @motionTestFramerate.setter
     def motionTestFramerate(self, value: str):
         self._motionTestFramerate = value
+
+    @property
+    def motionMode(self) -> str:
+        return self._motionMode
+
+    @motionMode.setter
+    def motionMode(self, value: str):
+        self._motionMode = value
         
     @property
     def actionVR(self) -> int:
@@ -942,6 +1056,18 @@ class TriggerConfig():
     def actionCircSize(self, value: int):
         self._actionCircSize = value
 
+    @property
+    def actionCircMaxMB(self) -> int:
+        return self._actionCircMaxMB
+
+    @actionCircMaxMB.setter
+    def actionCircMaxMB(self, value: int):
+        if value < 1:
+            value = 1
+        if value > 500:
+            value = 500
+        self._actionCircMaxMB = value
+
     @property
     def actionPath(self) -> str:
         return self._actionPath
@@ -1090,6 +1216,50 @@ class TriggerConfig():
     def retentionPeriodStr(self) -> str:
         return str(self._retentionPeriod)
 
+    @property
+    def cleanupAuto(self) -> bool:
+        return self._cleanupAuto
+
+    @cleanupAuto.setter
+    def cleanupAuto(self, value: bool):
+        self._cleanupAuto = value
+
+    @property
+    def cleanupMinute(self) -> int:
+        return self._cleanupMinute
+
+    @cleanupMinute.setter
+    def cleanupMinute(self, value: int):
+        self._cleanupMinute = value
+
+    @property
+    def cleanupTimeStr(self) -> str:
+        h = self._cleanupMinute // 60
+        m = self._cleanupMinute % 60
+        return str(h).zfill(2) + ":" + str(m).zfill(2)
+
+    @cleanupTimeStr.setter
+    def cleanupTimeStr(self, value: str):
+        """ Set cleanup time from "HH:MM"
+
+            Raises ValueError if value is not a valid time.
+        """
+        h = 0
+        m = 0
+        if value:
+            t = datetime.strptime(value, "%H:%M")
+            h = t.hour
+            m = t.minute
+        self._cleanupMinute = 60 * h + m
+
+    @property
+    def cleanupLastRun(self) -> str:
+        return self._cleanupLastRun
+
+    @cleanupLastRun.setter
+    def cleanupLastRun(self, value: str):
+        self._cleanupLastRun = value
+
     @property
     def evStart(self) -> datetime:
         return self._evStart
@@ -1101,6 +1271,7 @@ class TriggerConfig():
         else:
             val = datetime(year=value.year, month=value.month, day=value.day, hour=value.hour, minute=value.minute)
         self._evStart = val
+        self._evPageAfter = ("", 0)
 
     @property
     def evStartDateStr(self) -> str:
@@ -1114,6 +1285,7 @@ class TriggerConfig():
             d = datetime.now()
         v = datetime(year=d.year, month=d.month, day=d.day, hour=self._evStart.hour, minute=self._evStart.minute)        
         self._evStart = v
+        self._evPageAfter = ("", 0)
 
     @property
     def evStartTimeStr(self) -> str:
@@ -1127,6 +1299,7 @@ class TriggerConfig():
             d = datetime.now()
         v = datetime(year=self._evStart.year, month=self._evStart.month, day=self._evStart.day, hour=d.hour, minute=d.minute)        
         self._evStart = v
+        self._evPageAfter = ("", 0)
     
     @property
     def evStartIso(self) -> str:
@@ -1134,6 +1307,41 @@ class TriggerConfig():
     
     def evStartMidnight(self):
         self._evStart = datetime(year=self._evStart.year, month=self._evStart.month, day=self._evStart.day, hour=0, minute=0)
+        self._evPageAfter = ("", 0)
+
+    @property
+    def evPageSize(self) -> int:
+        return self._evPageSize
+
+    @evPageSize.setter
+    def evPageSize(self, value: int):
+        if value < 1:
+            value = 1
+        if value > 500:
+            value = 500
+        self._evPageSize = value
+
+    @property
+    def evPageAfter(self) -> tuple:
+        """ (timestamp, id) of the last event on the previous page (("", 0) for the first page)
+        """
+        return self._evPageAfter
+
+    @evPageAfter.setter
+    def evPageAfter(self, value: tuple):
+        self._evPageAfter = value
+
+    @property
+    def evHasMore(self) -> bool:
+        """ Whether events exist after the current page
+        """
+        return self._evHasMore
+
+    @property
+    def evPageLast(self) -> tuple:
+        """ (timestamp, id) of the last event on the current page
+        """
+        return self._evPageLast
 
     @property
     def evIncludePhoto(self) -> bool:
@@ -1232,14 +1440,33 @@ class TriggerConfig():
         return self.getEventList()
         
     def getEventList(self) -> list:
+        """ Return one page of events starting at evStart
+
+            Pages are selected by (timestamp, id) (keyset pagination)
+            because several events may have the same timestamp:
+            the page starts after evPageAfter and contains at most evPageSize events.
+            Videos and photos for all events of the page are read with a single query.
+        """
+        EventWriter.flush()
         db = dbx.get_dbx()
         events = []
         seldate = self.evStartDateStr
         seltime = self.evStartTimeStr
-        eventsdb = db.execute("SELECT * FROM events WHERE date = ? AND minute >= ?",
-                              (seldate, seltime)
+        pageSel = "SELECT * FROM events WHERE date = ? AND minute >= ? AND (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?"
+        (afterTimestamp, afterId) = self._evPageAfter
+        pageParams = (seldate, seltime, afterTimestamp, afterId, self._evPageSize)
+        # Read one more event than required in order to know whether there are more
+        eventsdb = db.execute(pageSel,
+                              (seldate, seltime, afterTimestamp, afterId, self._evPageSize + 1)
         ).fetchall()
+        self._evHasMore = len(eventsdb) > self._evPageSize
+        eventsdb = eventsdb[:self._evPageSize]
+        if len(eventsdb) > 0:
+            self._evPageLast = (eventsdb[-1]["timestamp"], eventsdb[-1]["id"])
+        else:
+            self._evPageLast = self._evPageAfter
         
+        eventIdx = {}
         for eventdb in eventsdb:
             eventContainer = {}
             event = {}
@@ -1267,63 +1494,58 @@ class TriggerConfig():
                     tpd["par"] = tps
             event["triggerparam"] = tpd
             eventContainer["event"] = event
+            if self.evIncludeVideo:
+                eventContainer["video"] = {}
+            if self.evIncludePhoto:
+                eventContainer["photos"] = []
             events.append(eventContainer)
-            
-        if self.evIncludeVideo:
-            for ev in events:
-                event = ev["event"]
-                ts = event["timestamp"]
-                eventactions = db.execute("SELECT * FROM eventactions WHERE event = ? AND actiontype = ?",
-                                    (ts, "Video")
-                ).fetchone()
-                if eventactions is None:
-                    eventVideo = {}
-                else:
-                    eventVideo = {}
-                    eventVideo["timestamp"] = eventactions["timestamp"]
-                    eventVideo["date"] = eventactions["date"]
-                    eventVideo["time"] = eventactions["time"]
-                    eventVideo["duration"] = round(eventactions["actionduration"], 0)
-                    eventVideo["filename"] = eventactions["filename"]
-                    videophoto = db.execute("SELECT * FROM eventactions WHERE event = ? AND actiontype = ? AND timestamp = ?",
-                                        (ts, "Photo", eventactions["timestamp"])
-                    ).fetchone()
-                    if videophoto is None:
+            eventIdx[eventdb["id"]] = eventContainer
+
+        if len(events) > 0 \
+        and (self.evIncludeVideo or self.evIncludePhoto):
+            # Photos are also required for the preview of videos
+            eventactions = db.execute(
+                "SELECT e.id AS eventid, a.timestamp, a.actiontype, a.date, a.time, a.actionduration, a.filename"
+                " FROM (" + pageSel.replace("SELECT *", "SELECT timestamp, id") + ") e"
+                " JOIN eventactions a ON a.event = e.timestamp"
+                " WHERE a.actiontype IN (?, ?)"
+                " ORDER BY e.timestamp, e.id, a.timestamp",
+                pageParams + ("Video", "Photo")
+            ).fetchall()
+            videoPhotos = {}
+            for eventactiondb in eventactions:
+                ev = eventIdx[eventactiondb["eventid"]]
+                if eventactiondb["actiontype"] == "Video":
+                    if self.evIncludeVideo \
+                    and len(ev["video"]) == 0:
+                        eventVideo = {}
+                        eventVideo["timestamp"] = eventactiondb["timestamp"]
+                        eventVideo["date"] = eventactiondb["date"]
+                        eventVideo["time"] = eventactiondb["time"]
+                        eventVideo["duration"] = round(eventactiondb["actionduration"], 0)
+                        eventVideo["filename"] = eventactiondb["filename"]
                         eventVideo["photo"] = None
-                    else:
-                        eventVideo["photo"] = videophoto["filename"]
-                ev["video"] = eventVideo
-
-        if self.evIncludePhoto:
-            for ev in events:
-                event = ev["event"]
-                ts = event["timestamp"]
-                eventactions = None
-                #if self.evIncludeVideo:
-                #    if len(ev["video"]) > 0:
-                #        eventVideo = ev["video"]
-                #        if not eventVideo["photo"] is None:
-                #            videoTs = eventVideo["timestamp"]
-                #            eventactions = db.execute("SELECT * FROM eventactions WHERE event = ? AND actiontype = ? AND timestamp != ? ORDER BY timestamp ASC",
-                #                                (ts, "Photo", videoTs)
-                #            ).fetchall()
-                if eventactions is None:
-                    eventactions = db.execute("SELECT * FROM eventactions WHERE event = ? AND actiontype = ? ORDER BY timestamp ASC",
-                                        (ts, "Photo")
-                    ).fetchall()
-                if eventactions is None:
-                    eventPhotos = []
+                        ev["video"] = eventVideo
                 else:
-                    eventPhotos = []
-                    for eventactiondb in eventactions:
+                    key = (eventactiondb["eventid"], eventactiondb["timestamp"])
+                    if not key in videoPhotos:
+                        videoPhotos[key] = eventactiondb["filename"]
+                    if self.evIncludePhoto:
                         eventPhoto = {}
                         eventPhoto["timestamp"] = eventactiondb["timestamp"]
                         eventPhoto["date"] = eventactiondb["date"]
                         eventPhoto["time"] = eventactiondb["time"]
                         eventPhoto["duration"] = round(eventactiondb["actionduration"], 0)
                         eventPhoto["filename"] = eventactiondb["filename"]
-                        eventPhotos.append(eventPhoto)
-                ev["photos"] = eventPhotos
+                        ev["photos"].append(eventPhoto)
+            if self.evIncludeVideo:
+                # The video preview is the photo taken together with the video
+                for eventId, ev in eventIdx.items():
+                    eventVideo = ev["video"]
+                    if len(eventVideo) > 0:
+                        key = (eventId, eventVideo["timestamp"])
+                        if key in videoPhotos:
+                            eventVideo["photo"] = videoPhotos[key]
         return events
 
     @property 
@@ -1336,14 +1558,24 @@ class TriggerConfig():
 
     def getCalendar(self)-> list:
         """ Setup calendar for the selected month with information on events
+
+            Event counts for all days of the grid are read with a single query
+            from the daily summary table eventdays.
+            The result is cached until the month changes or new events have been written.
         """
-        db = dbx.get_dbx()
+        EventWriter.flush()
+        cacheKey = self.calStartDateStr + "|" + str(EventWriter.generation)
+        if not self._calCache is None \
+        and self._calCache["key"] == cacheKey:
+            return self._calCache["calendar"]
+
         wd = self.calStart.isocalendar().weekday
         month = self.calStart.month
         wnrStart = self.calStart.isocalendar().week
         dayStart = self.calStart - timedelta(hours = (wd - 1) * 24)
         
         calendar = []
+        days = []
         dayIter = dayStart
         for week in range(wnrStart, wnrStart + 6):
             calWeek = {}
@@ -1357,65 +1589,61 @@ class TriggerConfig():
                 dayIso = dayIter.isoformat()[:10]
                 day["date"] = dayIso
                 data = {}
-                nrEvents = db.execute("SELECT count(*) FROM events WHERE date = ?",
-                                    (dayIso,)
-                ).fetchone()[0]
-                data["nrevents"] = nrEvents
+                data["nrevents"] = 0
                 day["data"] = data
                 weekdays.append(day)
+                days.append(day)
                 dayIter = dayIter + timedelta(hours=24)
             calWeek["weekdays"] = weekdays
             calendar.append(calWeek)
             if dayIter.month > month:
                 break
+
+        db = dbx.get_dbx()
+        dateFrom = days[0]["date"]
+        dateTo = days[-1]["date"]
+        try:
+            rows = db.execute("SELECT date, nrevents FROM eventdays WHERE date BETWEEN ? AND ?",
+                              (dateFrom, dateTo)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Database without daily summary
+            rows = db.execute("SELECT date, count(*) AS nrevents FROM events WHERE date BETWEEN ? AND ? GROUP BY date",
+                              (dateFrom, dateTo)
+            ).fetchall()
+        db.close()
+        nrEvents = {}
+        for row in rows:
+            nrEvents[row["date"]] = row["nrevents"]
+        for day in days:
+            if day["date"] in nrEvents:
+                day["data"]["nrevents"] = nrEvents[day["date"]]
+        self._calCache = {"key": cacheKey, "calendar": calendar}
         return calendar
     
-    def cleanupEvents(self):
-        """ Remove all events older than retention period
+    def cleanupEvents(self) -> tuple:
+        """ Start removal of all events older than retention period
+
+            Cleanup runs as background job (see eventCleanup.EventCleanup).
+
+        Returns:
+            (done, msg)
         """
         logger.debug("TriggerConfig.cleanupEvents")
-        db = dbx.get_dbx()
-        dr = datetime.now() - timedelta(days=self.retentionPeriod)
-        #dr = dr - timedelta(hours=23)
-        dateRem = str(dr.isoformat()[:10])
-        logger.debug("TriggerConfig.cleanupEvents - Removing %s and earlier", dateRem)
-        
-        # Cleanup events log
-        fpLog = self.logFilePath
-        fpLogOld = os.path.dirname(fpLog) + "/_backup.log"
-        if os.path.exists(fpLog):
-            if os.path.exists(fpLogOld):
-                os.remove(fpLogOld)
-            os.rename(fpLog, fpLogOld)
-        with open(fpLogOld, "r") as src:
-            oldLines = src.readlines()
-        with open(fpLog, "w") as tgt:
-            for line in oldLines:
-                if line[:10] > dateRem:
-                    tgt.write(line)
-        os.remove(fpLogOld)
-        logger.debug("Cleaned up %s", fpLog)
-        
-        # Remove files
-        cnt = 0
-        evadb = db.execute("SELECT * FROM eventactions WHERE date <= ?", (dateRem,)).fetchall()
-        if not evadb is None:
-            for eva in evadb:
-                fp = eva["fullpath"]
-                if os.path.exists(fp):
-                    os.remove(fp)
-                    cnt += 1
-        logger.debug("Removed %s files", cnt)
-
-        # Delete eventactions
-        db.execute("DELETE FROM eventactions WHERE date <= ?", (dateRem,)).fetchall()
-        db.commit()
-        logger.debug("Removed old eventaction")
-
-        # Delete events
-        db.execute("DELETE FROM events WHERE date <= ?", (dateRem,)).fetchall()
-        db.commit()
-        logger.debug("Removed old events")
+        from raspiCamSrv.eventCleanup import EventCleanup
+        return EventCleanup.start()
+
+    @property
+    def cleanupStatus(self) -> dict:
+        """ Progress of the current or last cleanup job
+        """
+        from raspiCamSrv.eventCleanup import EventCleanup
+        return EventCleanup.status
+
+    def resetCalendarCache(self):
+        """ Invalidate the cached calendar after events have been removed
+        """
+        self._calCache = None
 
     @staticmethod    
     def _parseWindows(wins: str) -> list:
@@ -1886,14 +2114,22 @@ class TriggerConfig():
         cs["bboxThreshold"] = self._bboxThreshold
         cs["nmsThreshold"] = self._nmsThreshold
         cs["motionThreshold"] = self._motionThreshold
+        cs["motionAnalysisScale"] = self._motionAnalysisScale
+        cs["motionDutyCycle"] = self._motionDutyCycle
+        cs["motionIdleRate"] = self._motionIdleRate
+        cs["motionPreThreshold"] = self._motionPreThreshold
+        cs["motionQuietPeriod"] = self._motionQuietPeriod
         cs["useRoI"] = self._useRoI
         cs["regionOfNoInterest"] = self._regionOfNoInterest
         cs["regionOfInterest"] = self._regionOfInterest
         cs["backSubModel"] = self._backSubModel
+        cs["bgLearningRate"] = self._bgLearningRate
+        cs["bgWarmupFrames"] = self._bgWarmupFrames
         cs["videoBboxes"] = self._videoBboxes
         cs["photoRois"] = self._photoRois
         cs["actionVR"] = self._actionVR
         cs["actionCircSize"] = self._actionCircSize
+        cs["actionCircMaxMB"] = self._actionCircMaxMB
         cs["actionVideoDuration"] = self._actionVideoDuration
         cs["actionPhotoBurst"] = self._actionPhotoBurst
         cs["actionPhotoBurstDelaySec"] = self._actionPhotoBurstDelaySec
@@ -1915,6 +2151,16 @@ class TriggerConfig():
             self._nmsThreshold = value["nmsThreshold"]
         if "motionThreshold" in value:
             self._motionThreshold = value["motionThreshold"]
+        if "motionAnalysisScale" in value:
+            self._motionAnalysisScale = value["motionAnalysisScale"]
+        if "motionDutyCycle" in value:
+            self._motionDutyCycle = value["motionDutyCycle"]
+        if "motionIdleRate" in value:
+            self._motionIdleRate = value["motionIdleRate"]
+        if "motionPreThreshold" in value:
+            self._motionPreThreshold = value["motionPreThreshold"]
+        if "motionQuietPeriod" in value:
+            self._motionQuietPeriod = value["motionQuietPeriod"]
         if "useRoI" in value:
             self._useRoI = value["useRoI"]
         if "regionOfNoInterest" in value:
@@ -1923,6 +2169,10 @@ class TriggerConfig():
             self._regionOfInterest = value["regionOfInterest"]
         if "backSubModel" in value:
             self._backSubModel = value["backSubModel"]
+        if "bgLearningRate" in value:
+            self._bgLearningRate = value["bgLearningRate"]
+        if "bgWarmupFrames" in value:
+            self._bgWarmupFrames = value["bgWarmupFrames"]
         if "videoBboxes" in value:
             self._videoBboxes = value["videoBboxes"]
         if "photoRois" in value:
@@ -1931,6 +2181,8 @@ class TriggerConfig():
             self._actionVR = value["actionVR"]
         if "actionCircSize" in value:
             self._actionCircSize = value["actionCircSize"]
+        if "actionCircMaxMB" in value:
+            self._actionCircMaxMB = value["actionCircMaxMB"]
         if "actionVideoDuration" in value:
             self._actionVideoDuration = value["actionVideoDuration"]
         if "actionPhotoBurst" in value:
@@ -1946,14 +2198,22 @@ class TriggerConfig():
         self._bboxThreshold = 400
         self._nmsThreshold = 0.001
         self._motionThreshold = 1
+        self._motionAnalysisScale = 1
+        self._motionDutyCycle = False
+        self._motionIdleRate = 2.0
+        self._motionPreThreshold = 5
+        self._motionQuietPeriod = 10
         self._useRoI = False
         self._regionOfNoInterest = ()
         self._regionOfInterest = ()
         self._backSubModel = "MOG2"
+        self._bgLearningRate = -1.0
+        self._bgWarmupFrames = 10
         self._videoBboxes = True
         self._photoRois = True
         self._actionVR = 1
         self._actionCircSize = 5
+        self._actionCircMaxMB = 50
         self._actionVideoDuration = 10
         self._actionPhotoBurst = 1
         self._actionPhotoBurstDelaySec = 2
@@ -1968,13 +2228,21 @@ class TriggerConfig():
         cs["bboxThreshold"] = 400
         cs["nmsThreshold"] = 0.001
         cs["motionThreshold"] = 1
+        cs["motionAnalysisScale"] = 1
+        cs["motionDutyCycle"] = False
+        cs["motionIdleRate"] = 2.0
+        cs["motionPreThreshold"] = 5
+        cs["motionQuietPeriod"] = 10
         cs["useRoI"] = False
         cs["regionOfNoInterest"] = ()
         cs["regionOfInterest"] = ()
         cs["backSubModel"] = "MOG2"
+        cs["bgLearningRate"] = -1.0
+        cs["bgWarmupFrames"] = 10
         cs["videoBboxes"] = True
         cs["actionVR"] = 1
         cs["actionCircSize"] = 5
+        cs["actionCircMaxMB"] = 50
         cs["actionVideoDuration"] = 10
         cs["actionPhotoBurst"] = 1
         cs["actionPhotoBurstDelaySec"] = 2
@@ -2005,11 +2273,15 @@ class TriggerConfig():
                         action = Action.initFromDict(act)
                         actions.append(action)
                     setattr(cc, key, actions)
+            elif key in TriggerConfig.transientAttrs:
+                # Ignore runtime attributes stored by previous versions
+                pass
             else:
                 setattr(cc, key, value)
         #Reset some default values for which imported values shall be ignored
         cc.evStart = None
         cc.calStart = None
+        cc._calCache = None
         cc.notifyConOK = False
         #Reset error
         cc._error = None
@@ -4503,6 +4775,17 @@ class ServerConfig():
         self._pvFrom = None
         self._pvTo = None
         self._pvList = []
+        self._pvCount = 0
+        self._pvPage = 0
+        self._pvPageSize = 100
+        self._retentionActive = False
+        self._retentionHighWater = 90
+        self._retentionLowWater = 80
+        self._retentionCategories = {
+            "events": {"priority": 1, "protect": False},
+            "photos": {"priority": 2, "protect": False},
+            "photoseries": {"priority": 3, "protect": True},
+        }
         self._useAPI = False
         self._API_active = False
         self._jwtAuthenticationActive = False
@@ -4510,6 +4793,11 @@ class ServerConfig():
         self._jwtAccessTokenExpirationMin = 60
         self._jwtRefreshTokenExpirationDays = 0
         self._streamingClients = []
+        self._useAsyncStreaming = False
+        self._asyncStreamingPort = 5001
+        self._streamLatencyHistogram = False
+        self._collectMetrics = False
+        self._usbMjpegPassthrough = False
         self._vButtonsRows = 0
         self._vButtonsCols = 0
         self._vButtons = []
@@ -5598,6 +5886,103 @@ class ServerConfig():
     def pvList(self, value: list):
         self._pvList = value
 
+    @property
+    def pvCount(self) -> int:
+        """ Number of media in the selected range
+        """
+        return self._pvCount
+
+    @pvCount.setter
+    def pvCount(self, value: int):
+        self._pvCount = value
+
+    @property
+    def pvPage(self) -> int:
+        """ Current page (0-based) of the photo viewer
+        """
+        return self._pvPage
+
+    @pvPage.setter
+    def pvPage(self, value: int):
+        if value < 0:
+            value = 0
+        self._pvPage = value
+
+    @property
+    def pvPageSize(self) -> int:
+        return self._pvPageSize
+
+    @pvPageSize.setter
+    def pvPageSize(self, value: int):
+        if value < 1:
+            value = 1
+        if value > 1000:
+            value = 1000
+        self._pvPageSize = value
+
+    @property
+    def pvPages(self) -> int:
+        """ Number of pages for the selected range
+        """
+        if self._pvCount == 0:
+            return 1
+        return (self._pvCount + self._pvPageSize - 1) // self._pvPageSize
+
+    @property
+    def retentionActive(self) -> bool:
+        return self._retentionActive
+
+    @retentionActive.setter
+    def retentionActive(self, value: bool):
+        self._retentionActive = value
+
+    @property
+    def retentionHighWater(self) -> int:
+        """ File system usage (%) above which media are deleted
+        """
+        return self._retentionHighWater
+
+    @retentionHighWater.setter
+    def retentionHighWater(self, value: int):
+        if value < 50:
+            value = 50
+        if value > 99:
+            value = 99
+        self._retentionHighWater = value
+        if self._retentionLowWater >= value:
+            self._retentionLowWater = value - 1
+
+    @property
+    def retentionLowWater(self) -> int:
+        """ File system usage (%) down to which media are deleted
+        """
+        return self._retentionLowWater
+
+    @retentionLowWater.setter
+    def retentionLowWater(self, value: int):
+        if value < 10:
+            value = 10
+        if value >= self._retentionHighWater:
+            value = self._retentionHighWater - 1
+        self._retentionLowWater = value
+
+    @property
+    def retentionCategories(self) -> dict:
+        """ Priority and protection of the media categories for retention
+        """
+        return self._retentionCategories
+
+    @retentionCategories.setter
+    def retentionCategories(self, value: dict):
+        self._retentionCategories = value
+
+    @property
+    def storageStatus(self) -> dict:
+        """ Storage usage and ingest rate from the retention manager
+        """
+        from raspiCamSrv.retention import Retention
+        return Retention.getStatus()
+
     @property
     def jwtAuthenticationActive(self) -> bool:
         return self._jwtAuthenticationActive
@@ -5638,6 +6023,46 @@ class ServerConfig():
     def streamingClients(self, value: list):
         self._streamingClients = value
 
+    @property
+    def useAsyncStreaming(self) -> bool:
+        return self._useAsyncStreaming
+
+    @useAsyncStreaming.setter
+    def useAsyncStreaming(self, value: bool):
+        self._useAsyncStreaming = value
+
+    @property
+    def asyncStreamingPort(self) -> int:
+        return self._asyncStreamingPort
+
+    @asyncStreamingPort.setter
+    def asyncStreamingPort(self, value: int):
+        self._asyncStreamingPort = value
+
+    @property
+    def streamLatencyHistogram(self) -> bool:
+        return self._streamLatencyHistogram
+
+    @streamLatencyHistogram.setter
+    def streamLatencyHistogram(self, value: bool):
+        self._streamLatencyHistogram = value
+
+    @property
+    def collectMetrics(self) -> bool:
+        return self._collectMetrics
+
+    @collectMetrics.setter
+    def collectMetrics(self, value: bool):
+        self._collectMetrics = value
+
+    @property
+    def usbMjpegPassthrough(self) -> bool:
+        return self._usbMjpegPassthrough
+
+    @usbMjpegPassthrough.setter
+    def usbMjpegPassthrough(self, value: bool):
+        self._usbMjpegPassthrough = value
+
     def registerStreamingClient(self, ipaddr: str, stream: str, thread: int):
         cl = None
         for scl in self.streamingClients:
@@ -7353,6 +7778,10 @@ class ServerConfig():
                 setattr(sc, key, [])
             elif key == "_pvCamera":
                 setattr(sc, key, None)
+            elif key == "_pvCount":
+                setattr(sc, key, 0)
+            elif key == "_pvPage":
+                setattr(sc, key, 0)
             elif key == "_pvFrom":
                 setattr(sc, key, None)
             elif key == "_pvTo":
@@ -7886,7 +8315,19 @@ class CameraCfg():
             self._persistCl(self.stereoCfg, "stereoCfg.json", cfgPath)
 
     def _toJson(self, cl):
-        return json.dumps(cl, default=lambda o: getattr(o, '__dict__', str(o)), indent=4)
+        return json.dumps(cl, default=self._persistDict, indent=4)
+
+    @staticmethod
+    def _persistDict(o):
+        """ Return the dictionary of o to be persisted, without transient attributes
+        """
+        d = getattr(o, '__dict__', None)
+        if d is None:
+            return str(o)
+        transient = getattr(o, "transientAttrs", None)
+        if transient:
+            d = {k: v for k, v in d.items() if not k in transient}
+        return d
 
     def _loadConfigCl(self, cl, fn: str, cfgPath: str):
         """ Load configuration from files, except camera-specific configs
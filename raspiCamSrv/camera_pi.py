@@ -13,6 +13,9 @@ from raspiCamSrv.camCfg import (
 )
 from typing import List
 from raspiCamSrv.photoseriesCfg import Series
+from raspiCamSrv.metrics import Metrics
+from raspiCamSrv.thumbnails import Thumbnails
+from raspiCamSrv.usbCircular import UsbCircularOutput
 from picamera2 import Picamera2, CameraConfiguration, StreamConfiguration, Controls
 from picamera2 import CompletedRequest, MappedArray
 from libcamera import Transform, Size, ColorSpace, controls
@@ -137,21 +140,273 @@ class Cam2Detection:
             self.box_main = None
 
 
-class StreamingOutput(io.BufferedIOBase):
+class LatencyHistogram(object):
+    """Histogram of the latency between encoder write and client yield.
+
+    Recording is skipped entirely unless the histogram is enabled.
+    """
+    BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
     def __init__(self):
-        # logger.debug("Thread %s: StreamingOutput.__init__", get_ident())
+        self.enabled = False
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded values"""
+        with self.lock:
+            self.counts = [0] * (len(LatencyHistogram.BOUNDS_MS) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def record(self, latency: float):
+        """Record a latency given in seconds"""
+        ms = latency * 1000.0
+        idx = 0
+        for bound in LatencyHistogram.BOUNDS_MS:
+            if ms <= bound:
+                break
+            idx += 1
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += ms
+            if ms > self.max:
+                self.max = ms
+
+    def toDict(self) -> dict:
+        """Convert the histogram to a dict representation."""
+        with self.lock:
+            buckets = {}
+            for idx, bound in enumerate(LatencyHistogram.BOUNDS_MS):
+                buckets["le_" + str(bound) + "ms"] = self.counts[idx]
+            buckets["gt_" + str(LatencyHistogram.BOUNDS_MS[-1]) + "ms"] = self.counts[-1]
+            return {
+                "enabled": self.enabled,
+                "count": self.count,
+                "mean_ms": round(self.sum / self.count, 2) if self.count > 0 else 0.0,
+                "max_ms": round(self.max, 2),
+                "buckets": buckets,
+            }
+
+
+class FrameRing(io.BufferedIOBase):
+    """Frame hub for MJPEG streams: a small fixed ring of immutable multipart chunks.
+
+    For Pi cameras, the MJPEG encoder's FileOutput writes directly into the ring,
+    for USB cameras, the camera thread publishes each encoded frame.
+    The multipart chunk (part header + JPEG + boundary) is built once per frame
+    and the same bytes object is handed out to every client generator,
+    so that N viewers do not cause N concatenations and N copies of the frame.
+
+    Consumers do not register own events. They wait on one shared condition
+    for a sequence number newer than the one they have already processed.
+
+    Callbacks registered in FrameRing.listeners are invoked with
+    (name, seq, chunk, publishTime) for every published frame of any ring.
+    They must return quickly, because they run in the publishing thread.
+    """
+    PART_HEADER = b"Content-Type: image/jpeg\r\n\r\n"
+    PART_TRAILER = b"\r\n--frame\r\n"
+    listeners = []
+    latency = LatencyHistogram()
+
+    def __init__(self, name: str = "", size: int = 4):
+        # logger.debug("Thread %s: FrameRing.__init__ - name=%s", get_ident(), name)
+        self.name = name
+        self.size = size
+        self.chunks = [None] * size
+        self.seqs = [0] * size
+        self.times = [0.0] * size
+        self.seq = 0
         self.frame = None
         self.lock = Lock()
         self.condition = Condition(self.lock)
 
+    def writable(self):
+        return True
+
     def write(self, buf):
-        # logger.debug("Thread %s: StreamingOutput.write", get_ident())
+        """Invoked by the encoder's FileOutput for every encoded frame."""
+        self.publish(bytes(buf))
+        return len(buf)
+
+    def close(self):
+        # The ring outlives the encoders writing into it. It is never closed.
+        pass
+
+    @staticmethod
+    def toChunk(frame: bytes) -> bytes:
+        """Build the multipart chunk for a JPEG frame"""
+        return FrameRing.PART_HEADER + frame + FrameRing.PART_TRAILER
+
+    def publish(self, frame: bytes):
+        """Invoked by the encoder or the camera thread when a new frame is available."""
+        chunk = FrameRing.toChunk(frame)
+        now = time.monotonic()
         with self.condition:
-            self.frame = buf
-            # logger.debug("Thread %s: StreamingOutput.write - got buffer of length %s", get_ident(), len(buf))
+            self.seq += 1
+            seq = self.seq
+            slot = seq % self.size
+            self.chunks[slot] = chunk
+            self.seqs[slot] = seq
+            self.times[slot] = now
+            self.frame = frame
             self.condition.notify_all()
-            # logger.debug("Thread %s: StreamingOutput.write - notification done", get_ident())
-        # logger.debug("Thread %s: StreamingOutput.write - write done", get_ident())
+        for listener in FrameRing.listeners:
+            listener(self.name, seq, chunk, now)
+
+    def wakeup(self):
+        """Wake up all waiting clients without publishing a frame"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def get(self, lastSeq: int, timeout: float = 5.0, latest: bool = False) -> tuple:
+        """Invoked from each client's thread to get the next chunk after lastSeq
+
+        If the successor of lastSeq is still in the ring, it is returned,
+        otherwise the client continues with the newest chunk.
+        With latest=True, the newest chunk is always returned (latest frame wins).
+
+        Returns (seq, chunk). chunk is None if no new frame arrived within timeout.
+        """
+        with self.condition:
+            if lastSeq > self.seq:
+                # The ring has been replaced since the client's last frame
+                lastSeq = 0
+            if self.seq <= lastSeq:
+                self.condition.wait(timeout)
+            if self.seq <= lastSeq:
+                return lastSeq, None
+            nextSeq = lastSeq + 1
+            if latest == True \
+            or self.seq - nextSeq >= self.size:
+                nextSeq = self.seq
+            slot = nextSeq % self.size
+            if self.seqs[slot] != nextSeq:
+                nextSeq = self.seq
+                slot = nextSeq % self.size
+            if FrameRing.latency.enabled == True:
+                FrameRing.latency.record(time.monotonic() - self.times[slot])
+            return nextSeq, self.chunks[slot]
+
+    def getFrame(self, lastSeq: int, timeout: float = 5.0) -> tuple:
+        """Invoked by the camera thread to get the newest JPEG frame after lastSeq
+
+        Returns (seq, frame). frame is None if no new frame arrived within timeout.
+        """
+        with self.condition:
+            if lastSeq > self.seq:
+                lastSeq = 0
+            if self.seq <= lastSeq:
+                self.condition.wait(timeout)
+            if self.seq <= lastSeq:
+                return lastSeq, None
+            return self.seq, self.frame
+
+    def toDict(self):
+        """Convert the ring to a dict representation."""
+        return {
+            "name": self.name,
+            "size": self.size,
+            "seq": self.seq,
+            "slots": self.seqs,
+        }
+
+
+class StreamClient(object):
+    """Delivery state of a single streaming connection
+
+    Each client always gets the newest frame available (latest frame wins).
+    Frames published while the client was busy sending or pacing
+    are skipped and counted as dropped.
+    Optionally, the client's frame rate is capped to a target fps.
+    The cap is at least MIN_FPS so that pacing never sleeps longer than
+    the inactivity timeout after which the camera thread stops itself.
+
+    All active clients are registered in a class-level registry
+    from which statistics can be obtained.
+    """
+    clients = {}
+    clientsLock = Lock()
+    nextId = 1
+    MIN_FPS = 0.2
+
+    def __init__(self, ipaddr: str, stream: str, fps: float = None, thread: int = None):
+        self.ipaddr = ipaddr
+        self.stream = stream
+        if fps is not None and fps <= 0:
+            fps = None
+        if fps is not None and fps < StreamClient.MIN_FPS:
+            fps = StreamClient.MIN_FPS
+        self.fps = fps
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.started = time.monotonic()
+        self.lastSent = 0.0
+        if thread is None:
+            thread = get_ident()
+        self.thread = thread
+        with StreamClient.clientsLock:
+            self.id = StreamClient.nextId
+            StreamClient.nextId += 1
+            StreamClient.clients[self.id] = self
+        logger.debug("Thread %s: StreamClient.__init__ - id=%s ipaddr=%s stream=%s fps=%s", get_ident(), self.id, ipaddr, stream, fps)
+
+    def close(self):
+        """Remove the client from the registry"""
+        with StreamClient.clientsLock:
+            if self.id in StreamClient.clients:
+                del StreamClient.clients[self.id]
+        logger.debug("Thread %s: StreamClient.close - id=%s sent=%s dropped=%s", get_ident(), self.id, self.sent, self.dropped)
+
+    def waitTime(self) -> float:
+        """Return the time in sec until the next frame is due according to the fps cap"""
+        wait = 0.0
+        if self.fps:
+            wait = self.lastSent + 1.0 / self.fps - time.monotonic()
+            if wait < 0:
+                wait = 0.0
+        return wait
+
+    def pace(self):
+        """Sleep until the next frame is due according to the fps cap"""
+        wait = self.waitTime()
+        if wait > 0:
+            time.sleep(wait)
+
+    def delivered(self, seq: int):
+        """Account for a chunk with sequence number seq being sent"""
+        if self.seq > 0 and seq > self.seq + 1:
+            self.dropped += seq - self.seq - 1
+        self.seq = seq
+        self.sent += 1
+        self.lastSent = time.monotonic()
+
+    def toDict(self) -> dict:
+        """Convert the client state to a dict representation."""
+        duration = time.monotonic() - self.started
+        total = self.sent + self.dropped
+        return {
+            "ipaddr": self.ipaddr,
+            "stream": self.stream,
+            "thread": self.thread,
+            "fps_cap": self.fps,
+            "frames_sent": self.sent,
+            "frames_dropped": self.dropped,
+            "drop_rate": round(self.dropped / total, 3) if total > 0 else 0.0,
+            "fps": round(self.sent / duration, 2) if duration > 0 else 0.0,
+            "duration": round(duration, 1),
+        }
+
+    @classmethod
+    def getStats(cls) -> list:
+        """Return the statistics of all active streaming clients"""
+        with cls.clientsLock:
+            clients = list(cls.clients.values())
+        return [cl.toDict() for cl in clients]
 
 
 class CameraController:
@@ -1555,6 +1810,7 @@ class Camera:
     thread2Lock = allocate_lock()  # lock for stopping the second camera thread
     threadUsbVideo = None  # background thread that records video from USB camera
     threadUsbVideoLock = allocate_lock()  # lock for stopping the USB video thread
+    usbCircOutput = None  # circular output fed with frames from the USB camera
     logUsbFrameApplyControls = False
     logUsbFrame2ApplyControls = False
     liveViewDeactivated = False
@@ -1581,6 +1837,13 @@ class Camera:
     resetScalerCropRequested = False
     event = CameraEvent()
     event2 = None
+    frameRing = FrameRing("video_feed")
+    frameRing2 = FrameRing("video_feed2")
+    usbDecodeCache = (None, None)  # (JPEG, decoded frame) for USB MJPEG passthrough
+    usbDecodeCache2 = (None, None)
+    usbDecodeSource = None  # (live view JPEG, captured JPEG, hflip, vflip) if the live view was decoded at reduced size
+    usbDecodeSource2 = None
+    usbTransformCache = {}  # Affine matrices for USB flip + ScalerCrop
 
     # Callbacks
     when_photo_taken = None
@@ -1698,6 +1961,13 @@ class Camera:
             cls.resetScalerCropRequested = False
             cls.event = CameraEvent()
             cls.event2 = None
+            cls.frameRing = FrameRing("video_feed")
+            cls.frameRing2 = FrameRing("video_feed2")
+            cls.usbDecodeCache = (None, None)
+            cls.usbDecodeCache2 = (None, None)
+            cls.usbDecodeSource = None
+            cls.usbDecodeSource2 = None
+            cls.usbTransformCache = {}
             cls.when_photo_taken = None
             cls.when_photo_2_taken = None
             cls.when_series_photo_taken = None
@@ -2625,7 +2895,12 @@ class Camera:
         )
 
     def getLiveViewImageForMotionDetection(self):
-        """Capture and return a buffer"""
+        """Capture and return a buffer
+
+        The buffer is returned as delivered by the live view stream.
+        For YUV420, this is the full buffer with the Y plane followed by the U and V planes.
+        Use motionGray() to get the image for motion analysis.
+        """
         cfg = CameraCfg()
         if Camera.camIsUsb == False:
             if cfg.triggerConfig.motionDetectAlgo == 0:
@@ -2634,13 +2909,28 @@ class Camera:
                 buf = buf[: w * h].reshape(h, w)
                 frameRaw = buf
             else:
+                # capture_array returns a new array, so no copy is required
                 frameRaw = Camera.cam.capture_array(cfg.liveViewConfig.stream)
-                if cfg.liveViewConfig.format == "YUV420":
-                    if cv2Available == True:
-                        frameRaw = cv2.cvtColor(frameRaw, cv2.COLOR_YUV2BGR_I420)
         else:
             frame, frameRaw = self.get_frame()
-        return copy.copy(frameRaw)
+            frameRaw = copy.copy(frameRaw)
+        return frameRaw
+
+    @staticmethod
+    def motionGray(frameRaw):
+        """Return the grayscale image of a buffer from getLiveViewImageForMotionDetection
+
+        For YUV420 buffers, this is a view on the Y plane without copy or conversion.
+        Other formats are converted to grayscale if OpenCV is available.
+        """
+        if len(frameRaw.shape) == 2:
+            (w, h) = CameraCfg().liveViewConfig.stream_size
+            return frameRaw[:h, :w]
+        if cv2Available == False:
+            return frameRaw
+        if Camera.camIsUsb == True:
+            return cv2.cvtColor(frameRaw, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(frameRaw, cv2.COLOR_RGB2GRAY)
 
     def getLeftImageForStereo(self):
         """Capture and return a buffer"""
@@ -2770,7 +3060,11 @@ class Camera:
         Camera.event.clear()
 
         # logger.debug("Thread %s: Returning frame", get_ident())
-        return Camera.frame, Camera.frameRaw
+        frame = Camera.frame
+        frameRaw = Camera.frameRaw
+        if frameRaw is None and Camera.camIsUsb == True:
+            frameRaw = Camera.usbDecodeFrame(frame)
+        return frame, frameRaw
 
     def get_frame2(self):
         """Return the current camera 2 frame."""
@@ -2794,10 +3088,53 @@ class Camera:
             Camera.event2.clear()
 
             # logger.debug("Thread %s: Returning frame2", get_ident())
-            return Camera.frame2, Camera.frame2Raw
+            frame = Camera.frame2
+            frameRaw = Camera.frame2Raw
+            if frameRaw is None and Camera.cam2IsUsb == True:
+                frameRaw = Camera.usbDecodeFrame(frame, forCam2=True)
+            return frame, frameRaw
         else:
             return None, None
 
+    def get_chunk(self, lastSeq: int = 0, latest: bool = False) -> tuple:
+        """Return the next prebuilt multipart chunk of the live stream after lastSeq.
+
+        The chunk object is shared among all streaming clients.
+        Returns (seq, chunk). chunk is None if no frame was available.
+        """
+        # logger.debug("Thread %s: Camera.get_chunk - lastSeq=%s", get_ident(), lastSeq)
+        with Camera.threadLock:
+            Camera.last_access = time.time()
+
+        if cv2Available == True:
+            if Camera.camWaitingForFirstFrame == True:
+                frame = self.startAnimation()
+                stat, frame_jpg = cv2.imencode(".jpg", frame)
+                if stat:
+                    return lastSeq, FrameRing.toChunk(frame_jpg.tobytes())
+                return lastSeq, None
+
+        return Camera.frameRing.get(lastSeq, latest=latest)
+
+    def get_chunk2(self, lastSeq: int = 0, latest: bool = False) -> tuple:
+        """Return the next prebuilt multipart chunk of the camera 2 stream after lastSeq."""
+        # logger.debug("Thread %s: Camera.get_chunk2 - lastSeq=%s", get_ident(), lastSeq)
+        if Camera.cam2:
+            with Camera.thread2Lock:
+                Camera.last_access2 = time.time()
+
+            if cv2Available == True:
+                if Camera.cam2WaitingForFirstFrame == True:
+                    frame = self.startAnimation2()
+                    stat, frame_jpg = cv2.imencode(".jpg", frame)
+                    if stat:
+                        return lastSeq, FrameRing.toChunk(frame_jpg.tobytes())
+                    return lastSeq, None
+
+            return Camera.frameRing2.get(lastSeq, latest=latest)
+        else:
+            return lastSeq, None
+
     def get_photoFrame(self):
         """Return the current camera frame."""
         logger.debug("Thread %s: Camera.get_photoFrame", get_ident())
@@ -3241,6 +3578,7 @@ class Camera:
                         raise RuntimeError("USB camera not opened")
                 cls.ctrl2 = CameraController(cls.cam2IsUsb, cls.cam2UsbDev, forActiveCamera=False)
                 cls.event2 = CameraEvent()
+                cls.frameRing2 = FrameRing("video_feed2")
                 logger.debug(
                     "Thread %s: Camera.setSecondCamera - second camera initialized %s",
                     get_ident(),
@@ -3999,6 +4337,107 @@ class Camera:
         # LensPosition
         Camera.applyDirectControlToUsbCamera("LensPosition", ctrls, usbCc, camDev)
 
+    @staticmethod
+    def usbRead(cam) -> tuple:
+        """Read a frame from a USB camera as BGR image
+
+        If the camera is in MJPEG passthrough mode, it delivers the compressed
+        frame as 1-dimensional buffer, which is decoded here.
+        """
+        success, frame = cam.read()
+        if success == True \
+        and frame is not None \
+        and (frame.ndim == 1 or frame.shape[0] == 1):
+            frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+            success = frame is not None
+        return success, frame
+
+    @staticmethod
+    def usbMjpegPassthrough(cam, conf, enable: bool) -> bool:
+        """Switch a USB camera between native MJPEG passthrough and decoded BGR frames
+
+        cam         : cv2.VideoCapture of the USB camera
+        conf        : Active configuration of the camera controller
+        enable      : If True, request MJPEG and disable conversion to BGR,
+                      otherwise restore the configured format and conversion
+
+        Returns     : True if the camera delivers MJPEG frames without conversion
+        """
+        logger.debug("Thread %s: Camera.usbMjpegPassthrough - enable: %s", get_ident(), enable)
+        mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+        width = conf.main.size[0]
+        height = conf.main.size[1]
+        res = False
+        if enable == True:
+            cam.set(cv2.CAP_PROP_FOURCC, mjpg)
+            cam.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cam.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if int(cam.get(cv2.CAP_PROP_FOURCC)) == mjpg:
+                cam.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+                res = True
+            else:
+                logger.debug("Thread %s: Camera.usbMjpegPassthrough - MJPEG not supported by camera", get_ident())
+                enable = False
+        if enable == False:
+            cam.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*conf.main.format))
+            cam.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cam.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        logger.debug("Thread %s: Camera.usbMjpegPassthrough - passthrough: %s", get_ident(), res)
+        return res
+
+    @staticmethod
+    def usbDecodeFlag(captureSize: tuple, liveSize: tuple) -> int:
+        """Return the cv2.imdecode flag for decoding a captured JPEG frame
+
+        The JPEG decoder can directly decode at 1/2, 1/4 or 1/8 of the size.
+        The largest reduction is chosen for which the decoded frame is not smaller than the live view.
+        """
+        flag = cv2.IMREAD_COLOR
+        if captureSize and liveSize:
+            for factor, reducedFlag in (
+                (2, cv2.IMREAD_REDUCED_COLOR_2),
+                (4, cv2.IMREAD_REDUCED_COLOR_4),
+                (8, cv2.IMREAD_REDUCED_COLOR_8),
+            ):
+                if captureSize[0] / factor >= liveSize[0] \
+                and captureSize[1] / factor >= liveSize[1]:
+                    flag = reducedFlag
+        return flag
+
+    @staticmethod
+    def usbDecodeFrame(frame: bytes, forCam2: bool = False):
+        """Decode a JPEG frame passed through from a USB camera
+
+        The decoded frame is cached, so that several consumers of the same frame
+        cause only one decoding.
+        If the live view frame has been decoded at reduced size,
+        the captured frame is decoded at full size and transformed,
+        so that the raw frame always has the capture resolution.
+        """
+        if frame is None:
+            return None
+        if forCam2 == False:
+            cache = Camera.usbDecodeCache
+            source = Camera.usbDecodeSource
+        else:
+            cache = Camera.usbDecodeCache2
+            source = Camera.usbDecodeSource2
+        if cache[0] is frame:
+            return cache[1]
+        if not source is None \
+        and source[0] is frame:
+            frameRaw = cv2.imdecode(source[1], cv2.IMREAD_COLOR)
+            if frameRaw is not None:
+                frameRaw = Camera.usbFrameTransform(frameRaw, source[2], source[3], toCam2=forCam2)
+        else:
+            frameRaw = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if forCam2 == False:
+            Camera.usbDecodeCache = (frame, frameRaw)
+        else:
+            Camera.usbDecodeCache2 = (frame, frameRaw)
+        return frameRaw
+
     @staticmethod
     def usbFrameApplyControls(
         frame,
@@ -4019,100 +4458,154 @@ class Camera:
 
         Returns     : The frame with applied controls
         """
+        return Camera.usbFrameTransform(frame, False, False, log=log, toCam2=toCam2)
+
+    @staticmethod
+    def usbFrameTransform(frame, hflip: bool, vflip: bool, log=False, toCam2=None):
+        """Apply flip and the currently selected camera controls to a frame captured from a USB camera
+
+        Flip, Scaler Crop and resizing to the original frame size are combined
+        into a single affine transformation, so that the frame is processed in one pass.
+        The transformation matrix is cached per (camera, frame size, ScalerCrop, hflip, vflip)
+        and computed only if one of these changes.
+
+        frame       : Frame captured from the USB camera
+        hflip       : If true, the frame is flipped horizontally
+        vflip       : If true, the frame is flipped vertically
+        log         : If true, log debug information (to prevent logging for each frame in video mode)
+        toCam2      : If true, controls are set for the second camera with control data from streamingCfg
+
+        Returns     : The transformed frame
+        """
+        mt = Metrics.enabled and time.perf_counter()
         if toCam2 is None:
             toCam2 = False
 
         if log:
             logger.debug(
-                "Thread %s: Camera.usbFrameApplyControls - toCam2: %s", get_ident(), toCam2
+                "Thread %s: Camera.usbFrameTransform - hflip: %s vflip: %s toCam2: %s", get_ident(), hflip, vflip, toCam2
             )
 
         cfg = CameraCfg()
         if toCam2 is False:
             cfgCtrls = cfg.controls
+            camNum = Camera.camNum
         else:
             cfgCtrls = cfg.streamingCfg[str(Camera.camNum2)]["controls"]
-        
-        if log:
-            logger.debug(
-                "Thread %s: Camera.usbFrameApplyControls - cfgCtrls=%s",
-                get_ident(),
-                cfgCtrls.__dict__,
-            )
-        
-        newFrame = frame
-
-        ctrls = {}
-        cnt = 0
+            camNum = Camera.camNum2
 
-        # Apply selected controls
-        # Scaler crop
         if cfgCtrls.include_scalerCrop:
-            ctrls["ScalerCrop"] = cfgCtrls.scalerCrop
-            cnt += 1
-
             hFrame, wFrame = frame.shape[:2]
-            if log:
-                logger.debug(
-                    "Thread %s: Camera.usbFrameApplyControls - Frame size: width=%s height=%s",
-                    get_ident(),
-                    wFrame,
-                    hFrame,
-                )
-            X, Y, W, H = Camera.getUsbScalerCrop(wFrame, hFrame, log=log, forCam2=toCam2)
-            x, y, w, h = cfgCtrls.scalerCrop
-            if log:
-                logger.debug("Thread %s: Camera.usbFrameApplyControls - ScalerCrop Frame is %s", get_ident(), (X, Y, W, H))
-                logger.debug("Thread %s: Camera.usbFrameApplyControls - Cropping to %s", get_ident(), (x, y, w, h))
-            xc = x + int(w/2)
-            yc = y + int(h/2)
-            if log:
-                logger.debug("Thread %s: Camera.usbFrameApplyControls - Crop center is %s", get_ident(), (xc, yc))
-
-            aspectRatioFrame = W / H
-            aspectRatioCrop = w / h
-            if aspectRatioFrame > aspectRatioCrop:
-                # Frame is wider than crop aspect ratio -> increase width
-                wNew = int(h * aspectRatioFrame)
-                hNew = h
-                if log:
-                    logger.debug("Thread %s: Camera.usbFrameApplyControls - Frame is wider than crop aspect ratio. New size is %s", get_ident(), (wNew, hNew))
+            scalerCrop = tuple(cfgCtrls.scalerCrop)
+            key = (camNum, toCam2, wFrame, hFrame, scalerCrop, hflip, vflip)
+            matrix = Camera.usbTransformCache.get(key)
+            if matrix is None:
+                x1, y1, x2, y2 = Camera.usbCropRect(wFrame, hFrame, scalerCrop, log=True, toCam2=toCam2)
+                matrix = Camera.usbTransformMatrix(wFrame, hFrame, (x1, y1, x2, y2), hflip, vflip)
+                if len(Camera.usbTransformCache) >= 8:
+                    Camera.usbTransformCache.clear()
+                Camera.usbTransformCache[key] = matrix
+                logger.debug("Thread %s: Camera.usbFrameTransform - New transformation for %s: %s", get_ident(), key, matrix.tolist())
+            newFrame = cv2.warpAffine(
+                frame,
+                matrix,
+                (wFrame, hFrame),
+                flags=cv2.INTER_LINEAR,
+                borderMode=cv2.BORDER_REPLICATE,
+            )
+        else:
+            if hflip == True and vflip == True:
+                newFrame = cv2.flip(frame, -1)
+            elif hflip == True:
+                newFrame = cv2.flip(frame, 1)
+            elif vflip == True:
+                newFrame = cv2.flip(frame, 0)
             else:
-                # Frame is taller than crop aspect ratio -> increase height
-                wNew = w
-                hNew = int(w / aspectRatioFrame)
-                if log:
-                    logger.debug("Thread %s: Camera.usbFrameApplyControls - Frame is taller than crop aspect ratio. New size is %s", get_ident(), (wNew, hNew))
-            if wNew > W:
-                wNew = W
-            if hNew > H:
-                hNew = H
-
-            scaleToFrame = W / wFrame
-            wNew = int(wNew / scaleToFrame)
-            hNew = int(hNew / scaleToFrame)
-            xc = int((xc - X) / scaleToFrame)
-            yc = int((yc - Y) / scaleToFrame)
-
-            x1 = xc - int(wNew / 2)
-            if x1 < 0:
-                x1 = 0
-            y1 = yc - int(hNew / 2)
-            if y1 < 0:
-                y1 = 0
-            x2 = x1 + wNew
-            if x2 > wFrame:
-                x2 = wFrame
-            y2 = y1 + hNew
-            if y2 > hFrame:
-                y2 = hFrame
+                newFrame = frame
+        if mt:
+            Metrics.record("usb_apply_controls", time.perf_counter() - mt)
+        return newFrame
+
+    @staticmethod
+    def usbTransformMatrix(wFrame: int, hFrame: int, cropRect: tuple, hflip: bool, vflip: bool):
+        """Return the affine matrix for flip, crop to cropRect and resize to the frame size
+
+        The crop rectangle (x1, y1, x2, y2) refers to the flipped frame.
+        Pixel centers are mapped like cv2.flip and cv2.resize with INTER_LINEAR.
+        """
+        x1, y1, x2, y2 = cropRect
+        sx = wFrame / (x2 - x1)
+        sy = hFrame / (y2 - y1)
+        if hflip == True:
+            ax = -sx
+            bx = sx * (wFrame - 0.5 - x1) - 0.5
+        else:
+            ax = sx
+            bx = sx * (0.5 - x1) - 0.5
+        if vflip == True:
+            ay = -sy
+            by = sy * (hFrame - 0.5 - y1) - 0.5
+        else:
+            ay = sy
+            by = sy * (0.5 - y1) - 0.5
+        return np.float32([[ax, 0.0, bx], [0.0, ay, by]])
+
+    @staticmethod
+    def usbCropRect(wFrame: int, hFrame: int, scalerCrop: tuple, log=False, toCam2=False) -> tuple:
+        """Return the rectangle (x1, y1, x2, y2) of a frame which corresponds to scalerCrop
+
+        The rectangle is widened to the aspect ratio of the frame.
+        """
+        X, Y, W, H = Camera.getUsbScalerCrop(wFrame, hFrame, log=log, forCam2=toCam2)
+        x, y, w, h = scalerCrop
+        if log:
+            logger.debug("Thread %s: Camera.usbCropRect - ScalerCrop Frame is %s", get_ident(), (X, Y, W, H))
+            logger.debug("Thread %s: Camera.usbCropRect - Cropping to %s", get_ident(), (x, y, w, h))
+        xc = x + int(w/2)
+        yc = y + int(h/2)
+        if log:
+            logger.debug("Thread %s: Camera.usbCropRect - Crop center is %s", get_ident(), (xc, yc))
+
+        aspectRatioFrame = W / H
+        aspectRatioCrop = w / h
+        if aspectRatioFrame > aspectRatioCrop:
+            # Frame is wider than crop aspect ratio -> increase width
+            wNew = int(h * aspectRatioFrame)
+            hNew = h
             if log:
-                logger.debug("Thread %s: Camera.usbFrameApplyControls - Cropping coordinates are x1=%s y1=%s x2=%s y2=%s", get_ident(), x1, y1, x2, y2)
-            cropped = frame[y1:y2, x1:x2]
-            newFrame = cv2.resize(cropped, (wFrame, hFrame), interpolation=cv2.INTER_LINEAR)
+                logger.debug("Thread %s: Camera.usbCropRect - Frame is wider than crop aspect ratio. New size is %s", get_ident(), (wNew, hNew))
+        else:
+            # Frame is taller than crop aspect ratio -> increase height
+            wNew = w
+            hNew = int(w / aspectRatioFrame)
             if log:
-                logger.debug("Thread %s: Camera.usbFrameApplyControls - Cropping and resizing done", get_ident())
-        return newFrame
+                logger.debug("Thread %s: Camera.usbCropRect - Frame is taller than crop aspect ratio. New size is %s", get_ident(), (wNew, hNew))
+        if wNew > W:
+            wNew = W
+        if hNew > H:
+            hNew = H
+
+        scaleToFrame = W / wFrame
+        wNew = int(wNew / scaleToFrame)
+        hNew = int(hNew / scaleToFrame)
+        xc = int((xc - X) / scaleToFrame)
+        yc = int((yc - Y) / scaleToFrame)
+
+        x1 = xc - int(wNew / 2)
+        if x1 < 0:
+            x1 = 0
+        y1 = yc - int(hNew / 2)
+        if y1 < 0:
+            y1 = 0
+        x2 = x1 + wNew
+        if x2 > wFrame:
+            x2 = wFrame
+        y2 = y1 + hNew
+        if y2 > hFrame:
+            y2 = hFrame
+        if log:
+            logger.debug("Thread %s: Camera.usbCropRect - Cropping coordinates are x1=%s y1=%s x2=%s y2=%s", get_ident(), x1, y1, x2, y2)
+        return (x1, y1, x2, y2)
 
     @staticmethod
     def applyControls(
@@ -4594,18 +5087,33 @@ class Camera:
             logger.debug(
                 "Thread %s: Camera._thread - frames_iterator instantiated", get_ident()
             )
+            mtPrev = 0
             for frame, frameRaw in frames_iterator:
+                mt = Metrics.enabled and time.perf_counter()
+                if mt:
+                    if mtPrev:
+                        Metrics.record("live_interval", mt - mtPrev)
+                    mtPrev = mt
                 Camera.frame = frame
                 Camera.frameRaw = frameRaw
                 # logger.debug("Thread %s: Camera._thread - received frame from camera -> notifying clients", get_ident())
+                if Camera.camIsUsb == True:
+                    # For Pi cameras, the encoder has already published the frame
+                    Camera.frameRing.publish(frame)
                 Camera.event.set()  # send signal to clients
                 Camera.camWaitingForFirstFrame = False
-                time.sleep(0)
 
                 if ai.enable == True:
                     if ai.task == "object detection":
                         Camera.cam_imx500_last_results = Camera.parse_detections(Camera.cam.capture_metadata())
 
+                if mt:
+                    Metrics.record("live_thread", time.perf_counter() - mt)
+
+                # Acquire the lock only if the thread is about to stop
+                if Camera.stopRequested == False \
+                and time.time() - Camera.last_access <= 10:
+                    continue
                 Camera.threadLock.acquire()
 
                 stop = False
@@ -4641,6 +5149,7 @@ class Camera:
             Camera.event.set()
             Camera.camWaitingForFirstFrame = False
             Camera.event.clear()
+            Camera.frameRing.wakeup()
         except UsbCameraOpenError as ue:
             Camera.threadLock.acquire()
             if frames_iterator:
@@ -4648,6 +5157,7 @@ class Camera:
             Camera.event.set()
             Camera.camWaitingForFirstFrame = False
             Camera.event.clear()
+            Camera.frameRing.wakeup()
         except Exception as e:
             Camera.threadLock.acquire()
             logger.error("Thread %s: Camera._thread - Exception: %s", get_ident(), e)
@@ -4656,6 +5166,7 @@ class Camera:
             Camera.event.set()
             Camera.camWaitingForFirstFrame = False
             Camera.event.clear()
+            Camera.frameRing.wakeup()
             CameraCfg().serverConfig.error = "Error in live view: " + str(e)
             CameraCfg().serverConfig.error2 = (
                 "Probably, a different camera configuration can solve the problem."
@@ -4732,19 +5243,34 @@ class Camera:
             logger.debug(
                 "Thread %s: Camera._thread2 - frames_iterator instantiated", get_ident()
             )
+            mtPrev = 0
             for frame, frameRaw in frames_iterator:
+                mt = Metrics.enabled and time.perf_counter()
+                if mt:
+                    if mtPrev:
+                        Metrics.record("live_interval2", mt - mtPrev)
+                    mtPrev = mt
                 Camera.frame2 = frame
                 Camera.frame2Raw = frameRaw
                 # logger.debug("Thread %s: Camera._thread2 - received frame from camera -> notifying clients", get_ident())
+                if Camera.cam2IsUsb == True:
+                    # For Pi cameras, the encoder has already published the frame
+                    Camera.frameRing2.publish(frame)
                 Camera.event2.set()  # send signal to clients
                 Camera.cam2WaitingForFirstFrame = False
-                time.sleep(0)
 
                 if ai.enable == True:
                     if ai.task == "object detection":
                         Camera.cam2_imx500_last_results = Camera.cam2_parse_detections(Camera.cam2.capture_metadata())
 
+                if mt:
+                    Metrics.record("live_thread2", time.perf_counter() - mt)
+
                 # Acquire lock to avoid clients accessing the stream while it is closing down
+                # The lock is acquired only if the thread is about to stop
+                if Camera.stopRequested2 == False \
+                and time.time() - Camera.last_access2 <= 10:
+                    continue
                 # logger.debug("Thread %s: Camera._thread2 - About to acquire Lock: thread2Lock=%s.", get_ident(), Camera.thread2Lock.locked())
                 Camera.thread2Lock.acquire()
                 # logger.debug("Thread %s: Camera._thread2 - Lock acquired: thread2Lock=%s.", get_ident(), Camera.thread2Lock.locked())
@@ -4783,6 +5309,7 @@ class Camera:
             Camera.event2.set()
             Camera.cam2WaitingForFirstFrame = False
             Camera.event2.clear()
+            Camera.frameRing2.wakeup()
             CameraCfg().serverConfig.errorc2 = "Error in camera 2 stream: " + str(e)
             CameraCfg().serverConfig.errorc22 = (
                 "Probably, a different camera configuration can solve the problem."
@@ -4860,14 +5387,22 @@ class Camera:
             hflip,
             vflip,
         )
+        passthrough = False
+        if srvCam.serverConfig.usbMjpegPassthrough == True:
+            passthrough = Camera.usbMjpegPassthrough(Camera.cam, cfg, True)
+            decodeFlag = Camera.usbDecodeFlag(cfg.main.size, srvCam.liveViewConfig.stream_size)
         gotScalerCropLiveView = False
         try:
             cnt = 0
             Camera.logUsbFrameApplyControls = True
             while True:
+                mt = Metrics.enabled and time.perf_counter()
                 if Camera.cam.isOpened() == False:
                     raise UsbCameraOpenError("USB camera not open during live view")
-                success, frame = Camera.cam.read()
+                if passthrough == True:
+                    success, frame = Camera.cam.read()
+                else:
+                    success, frame = Camera.usbRead(Camera.cam)
                 if not success:
                     time.sleep(0.01)
                     cnt += 1
@@ -4882,18 +5417,39 @@ class Camera:
                         srvCam.scalerCropLiveView = metadata["ScalerCrop"]
                         gotScalerCropLiveView = True
                     # logger.debug("Thread %s: Camera.framesUsb - Received frame from camera", get_ident())
+                    if passthrough == True:
+                        if hflip == False \
+                        and vflip == False \
+                        and srvCam.controls.include_scalerCrop == False:
+                            # Pass the camera's JPEG through. Raw frame is decoded on demand
+                            frameEncoded = frame.tobytes()
+                            if not Camera.usbCircOutput is None:
+                                Camera.usbCircOutput.write(frameEncoded)
+                            if mt:
+                                Metrics.record("frames_usb", time.perf_counter() - mt)
+                            yield frameEncoded, None
+                            continue
+                        source = frame
+                        frame = cv2.imdecode(frame, decodeFlag)
                     # Apply controls for each frame to allow dynamic changes
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=Camera.logUsbFrameApplyControls)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=Camera.logUsbFrameApplyControls)
                     Camera.logUsbFrameApplyControls = False
                     # Encode frame as JPEG
                     ret, buffer = cv2.imencode(".jpg", frame)
                     frameEncoded = buffer.tobytes()
-                    yield frameEncoded, frame
+                    if not Camera.usbCircOutput is None:
+                        Camera.usbCircOutput.write(frameEncoded)
+                    if mt:
+                        Metrics.record("frames_usb", time.perf_counter() - mt)
+                    if passthrough == True \
+                    and decodeFlag != cv2.IMREAD_COLOR:
+                        # The frame has been decoded at reduced size for the live view.
+                        # The raw frame is decoded at capture size on demand
+                        Camera.usbDecodeSource = (frameEncoded, source, hflip, vflip)
+                        yield frameEncoded, None
+                    else:
+                        yield frameEncoded, frame
         except UsbCameraNoFrameReceivedError as ue:
             logger.debug(
                 "Thread %s: Camera.framesUsb - No frame received after 1 sec",
@@ -4909,6 +5465,10 @@ class Camera:
         except Exception as e:
             logger.error("Thread %s: Camera.framesUsb - Exception: %s", get_ident(), e)
             raise
+        finally:
+            if passthrough == True:
+                if Camera.cam.isOpened() == True:
+                    Camera.usbMjpegPassthrough(Camera.cam, cfg, False)
 
     @staticmethod
     def frames():
@@ -4951,7 +5511,8 @@ class Camera:
             raise
 
         try:
-            Camera.streamOutput = StreamingOutput()
+            # The encoder writes directly into the frame ring
+            Camera.streamOutput = Camera.frameRing
             prgLogger.debug("output = None")
             encoder = MJPEGEncoder()
             prgLogger.debug("encoder = MJPEGEncoder()")
@@ -4971,16 +5532,16 @@ class Camera:
             # Get the live view scaler crop
             metadata = Camera.cam.capture_metadata()
             srvCam.serverConfig.scalerCropLiveView = metadata["ScalerCrop"]
+            seq = 0
             while True:
                 # logger.debug("Thread %s: Camera.frames - Receiving camera stream", get_ident())
-                with Camera.streamOutput.condition:
-                    # logger.debug("Thread %s: Camera.frames - waiting", get_ident())
-                    Camera.streamOutput.condition.wait()
-                    # logger.debug("Thread %s: Camera.frames - waiting done", get_ident())
-                    frame = Camera.streamOutput.frame
-                    l = len(frame)
-                # logger.debug("Thread %s: Camera.frames - got frame with length %s", get_ident(), l)
-                yield frame, None
+                mt = Metrics.enabled and time.perf_counter()
+                seq, frame = Camera.streamOutput.getFrame(seq)
+                if mt:
+                    Metrics.record("frames_encoder_wait", time.perf_counter() - mt)
+                if frame is not None:
+                    # logger.debug("Thread %s: Camera.frames - got frame %s with length %s", get_ident(), seq, len(frame))
+                    yield frame, None
         except Exception as e:
             logger.error("Thread %s: Camera.frames - Exception: %s", get_ident(), e)
             raise
@@ -5014,29 +5575,58 @@ class Camera:
         cfg = Camera.ctrl2.configuration
         hflip = cfg.transform.hflip
         vflip = cfg.transform.vflip
+        passthrough = False
+        if srvCam.serverConfig.usbMjpegPassthrough == True:
+            passthrough = Camera.usbMjpegPassthrough(Camera.cam2, cfg, True)
+            decodeFlag = Camera.usbDecodeFlag(cfg.main.size, srvCam.streamingCfg[str(Camera.camNum2)]["liveconfig"].stream_size)
+            cfgCtrls = srvCam.streamingCfg[str(Camera.camNum2)]["controls"]
         Camera.logUsbFrame2ApplyControls = True
         try:
             while True:
                 # logger.debug("Thread %s: Camera.frames2Usb - Receiving camera stream", get_ident())
-                success, frame = Camera.cam2.read()
+                mt = Metrics.enabled and time.perf_counter()
+                if passthrough == True:
+                    success, frame = Camera.cam2.read()
+                else:
+                    success, frame = Camera.usbRead(Camera.cam2)
                 if not success:
                     break
                 else:
+                    if passthrough == True:
+                        if hflip == False \
+                        and vflip == False \
+                        and cfgCtrls.include_scalerCrop == False:
+                            # Pass the camera's JPEG through. Raw frame is decoded on demand
+                            frameEncoded = frame.tobytes()
+                            if mt:
+                                Metrics.record("frames2_usb", time.perf_counter() - mt)
+                            yield frameEncoded, None
+                            continue
+                        source = frame
+                        frame = cv2.imdecode(frame, decodeFlag)
                     # Apply controls for each frame to allow dynamic changes
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=Camera.logUsbFrame2ApplyControls, toCam2=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=Camera.logUsbFrame2ApplyControls, toCam2=True)
                     Camera.logUsbFrame2ApplyControls = False
                     # Encode frame as JPEG
                     ret, buffer = cv2.imencode(".jpg", frame)
                     frameEncoded = buffer.tobytes()
+                    if mt:
+                        Metrics.record("frames2_usb", time.perf_counter() - mt)
+                    if passthrough == True \
+                    and decodeFlag != cv2.IMREAD_COLOR:
+                        # The frame has been decoded at reduced size for the live view.
+                        # The raw frame is decoded at capture size on demand
+                        Camera.usbDecodeSource2 = (frameEncoded, source, hflip, vflip)
+                        frame = None
                 yield frameEncoded, frame
         except Exception as e:
             logger.error("Thread %s: Camera.frames2Usb - Exception: %s", get_ident(), e)
             raise
+        finally:
+            if passthrough == True:
+                if Camera.cam2.isOpened() == True:
+                    Camera.usbMjpegPassthrough(Camera.cam2, cfg, False)
 
     @staticmethod
     def frames2():
@@ -5070,7 +5660,8 @@ class Camera:
         time.sleep(0.5)
 
         try:
-            Camera.stream2Output = StreamingOutput()
+            # The encoder writes directly into the frame ring
+            Camera.stream2Output = Camera.frameRing2
             encoder = MJPEGEncoder()
             Camera.cam2.start_encoder(
                 encoder,
@@ -5080,16 +5671,16 @@ class Camera:
             Camera.ctrl2.registerEncoder(Camera.ENCODER_LIVESTREAM, encoder)
             logger.debug("Thread %s: Camera.frames2 - encoder started", get_ident())
 
+            seq = 0
             while True:
                 # logger.debug("Thread %s: Camera.frames2 - Receiving camera stream", get_ident())
-                with Camera.stream2Output.condition:
-                    # logger.debug("Thread %s: Camera.frames2 - waiting", get_ident())
-                    Camera.stream2Output.condition.wait()
-                    # logger.debug("Thread %s: Camera.frames2 - waiting done", get_ident())
-                    frame = Camera.stream2Output.frame
-                    l = len(frame)
-                # logger.debug("Thread %s: Camera.frames2 - got frame with length %s", get_ident(), l)
-                yield frame, None
+                mt = Metrics.enabled and time.perf_counter()
+                seq, frame = Camera.stream2Output.getFrame(seq)
+                if mt:
+                    Metrics.record("frames2_encoder_wait", time.perf_counter() - mt)
+                if frame is not None:
+                    # logger.debug("Thread %s: Camera.frames2 - got frame %s with length %s", get_ident(), seq, len(frame))
+                    yield frame, None
         except Exception as e:
             logger.error("Thread %s: Camera.frames2 - Exception: %s", get_ident(), e)
             raise
@@ -5296,23 +5887,20 @@ class Camera:
                 # For USB cameras, save the image using OpenCV
                 if Camera.cam.isOpened() == False:
                     raise RuntimeError("USB camera is not opened")
-                success, frame = Camera.cam.read()
+                success, frame = Camera.usbRead(Camera.cam)
                 if success:
                     conf = Camera.ctrl.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=True)
                     cv2.imwrite(fp, frame)
                 else:
                     raise RuntimeError("Failed to capture image from USB camera")
             logger.debug(
                 "Thread %s: Camera.takeImage: Image saved as %s", get_ident(), fp
             )
+            Thumbnails.submit(fp)
             if alternatePath == "":
                 sc.displayFile = filename
                 sc.displayPhoto = sc.cameraPhotoSubPath + "/" + filename
@@ -5437,17 +6025,13 @@ class Camera:
                 # For USB cameras, save the image using OpenCV
                 if Camera.cam2.isOpened() == False:
                     raise RuntimeError("USB camera 2 is not opened")
-                success, frame = Camera.cam2.read()
+                success, frame = Camera.usbRead(Camera.cam2)
                 if success:
                     conf = Camera.ctrl2.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=True, toCam2=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=True, toCam2=True)
                     cv2.imwrite(fp, frame)
                 else:
                     raise RuntimeError("Failed to capture image from USB camera")
@@ -5518,6 +6102,8 @@ class Camera:
                     done = True
             else:
                 err = "USB Camera not started"
+        if done == True:
+            Thumbnails.submit(fp)
         return (done, err, copy.copy(frameRaw))
 
     @staticmethod
@@ -5700,7 +6286,14 @@ class Camera:
             else:
                 err = "Camera not started"
         else:
-            err = "USB camera does not support circular recording"
+            if Camera.cam.isOpened() == True:
+                tc = cfg.triggerConfig
+                circ = UsbCircularOutput(bufferSec=buffersizeSec, maxBytes=tc.actionCircMaxMB * 1024 * 1024)
+                encoder = circ
+                Camera.usbCircOutput = circ
+                done = True
+            else:
+                err = "USB Camera not started"
         return (done, circ, encoder, err)
 
     @staticmethod
@@ -5724,7 +6317,10 @@ class Camera:
             else:
                 err = "Camera not started"
         else:
-            err = "USB camera does not support circular recording"
+            Camera.usbCircOutput = None
+            if not encoder is None:
+                encoder.stop()
+            done = True
         return (done, err)
 
     @staticmethod
@@ -5749,7 +6345,20 @@ class Camera:
             else:
                 err = "Camera not started"
         else:
-            err = "USB camera does not support circular recording"
+            if Camera.cam.isOpened() == True:
+                try:
+                    circ.fileoutput = fp
+                    circ.start()
+                    done = True
+                except Exception as e:
+                    logger.error(
+                        "Thread %s: Camera.recordCircular - error when starting circular: %s",
+                        get_ident(),
+                        e,
+                    )
+                    err = str(e)
+            else:
+                err = "USB Camera not started"
         return (done, err)
 
     @staticmethod
@@ -5773,7 +6382,17 @@ class Camera:
             else:
                 err = "Camera not started"
         else:
-            err = "USB camera does not support circular recording"
+            # Stop even if the camera has been closed, so that the video file is finalized
+            try:
+                circ.stop()
+                done = True
+            except Exception as e:
+                logger.error(
+                    "Thread %s: Camera.stopRecordingCircular - error when stopping circular: %s",
+                    get_ident(),
+                    e,
+                )
+                err = str(e)
         return (done, err)
 
     @staticmethod
@@ -5846,17 +6465,13 @@ class Camera:
                 # For USB cameras, save the image using OpenCV
                 if Camera.cam.isOpened() == False:
                     raise RuntimeError("USB camera is not opened")
-                success, frame = Camera.cam.read()
+                success, frame = Camera.usbRead(Camera.cam)
                 if success:
                     conf = Camera.ctrl.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=True)
                     cv2.imwrite(fp, frame)
                     cv2.imwrite(fpr, frame, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
                 else:
@@ -5992,17 +6607,13 @@ class Camera:
                 # For USB cameras, save the image using OpenCV
                 if Camera.cam2.isOpened() == False:
                     raise RuntimeError("USB camera is not opened")
-                success, frame = Camera.cam2.read()
+                success, frame = Camera.usbRead(Camera.cam2)
                 if success:
                     conf = Camera.ctrl2.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, log=True, toCam2=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, log=True, toCam2=True)
                     cv2.imwrite(fp, frame)
                     cv2.imwrite(fpr, frame, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
                 else:
@@ -6081,18 +6692,14 @@ class Camera:
             if duration > 0.0:
                 elapsed = time.time() - videoStart
                 while elapsed <= duration:
-                    ret, frame = Camera.cam.read()
+                    ret, frame = Camera.usbRead(Camera.cam)
                     if not ret:
                         break
                     conf = Camera.ctrl.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip)
                     out.write(frame)
                     if Camera.stopVideoRequested == True:
                         logger.debug(
@@ -6104,18 +6711,14 @@ class Camera:
                 sc.isAudioRecording = False
             else:
                 while Camera.stopVideoRequested == False:
-                    ret, frame = Camera.cam.read()
+                    ret, frame = Camera.usbRead(Camera.cam)
                     if not ret:
                         break
                     conf = Camera.ctrl.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip)
                     out.write(frame)
                     if Camera.stopVideoRequested == True:
                         logger.debug(
@@ -6334,18 +6937,14 @@ class Camera:
             if duration > 0.0:
                 elapsed = time.time() - videoStart
                 while elapsed <= duration:
-                    ret, frame = Camera.cam2.read()
+                    ret, frame = Camera.usbRead(Camera.cam2)
                     if not ret:
                         break
                     conf = Camera.ctrl2.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, toCam2=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, toCam2=True)
                     out.write(frame)
                     if Camera.stopVideoRequested2 == True:
                         logger.debug(
@@ -6358,18 +6957,14 @@ class Camera:
                 sc.isAudioRecording = False
             else:
                 while Camera.stopVideoRequested2 == False:
-                    ret, frame = Camera.cam2.read()
+                    ret, frame = Camera.usbRead(Camera.cam2)
                     if not ret:
                         break
                     conf = Camera.ctrl2.configuration
                     hflip = conf.transform.hflip
                     vflip = conf.transform.vflip
-                    if hflip == True:
-                        frame = cv2.flip(frame, 1)
-                    if vflip == True:
-                        frame = cv2.flip(frame, 0)
-                    # Apply controls
-                    frame = Camera.usbFrameApplyControls(frame, toCam2=True)
+                    # Apply flip and controls in a single pass
+                    frame = Camera.usbFrameTransform(frame, hflip, vflip, toCam2=True)
                     out.write(frame)
                     if Camera.stopVideoRequested2 == True:
                         logger.debug(
@@ -7038,18 +7633,14 @@ class Camera:
                             )
                             if Camera.cam.isOpened() == False:
                                 raise RuntimeError("USB camera is not opened")
-                            success, frame = Camera.cam.read()
+                            success, frame = Camera.usbRead(Camera.cam)
                             if success:
                                 metadata = Camera.getUsbCamMetadata(Camera.cam)
                                 conf = Camera.ctrl.configuration
                                 hflip = conf.transform.hflip
                                 vflip = conf.transform.vflip
-                                if hflip == True:
-                                    frame = cv2.flip(frame, 1)
-                                if vflip == True:
-                                    frame = cv2.flip(frame, 0)
-                                # Apply controls
-                                frame = Camera.usbFrameApplyControls(frame)
+                                # Apply flip and controls in a single pass
+                                frame = Camera.usbFrameTransform(frame, hflip, vflip)
                                 cv2.imwrite(fpjpg, frame)
                                 if ser.type == "raw+jpg":
                                     cv2.imwrite(fpraw, frame, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
@@ -7059,6 +7650,7 @@ class Camera:
                                 )
                             else:
                                 raise RuntimeError("Failed to capture image from USB camera")
+                        Thumbnails.submit(fpjpg)
                         ser.curShots = curShots
                         ser.logPhoto(nextPhoto, lastTime, metadata, serMetaData)
                         if (
@@ -14,3 +14,83 @@ def get_dbx() -> sqlite3.Connection:
     db = sqlite3.connect(database, detect_types=sqlite3.PARSE_DECLTYPES)
     db.row_factory = sqlite3.Row
     return db
+
+
+# Indexes which have been added after the initial schema.
+# They are created for databases initialized with earlier versions.
+SCHEMA_UPDATES = [
+    "CREATE INDEX IF NOT EXISTS events_date_ts_idx ON events(date, timestamp)",
+    "CREATE INDEX IF NOT EXISTS eventactions_event_ts_idx ON eventactions(event, actiontype, timestamp)",
+    "CREATE INDEX IF NOT EXISTS eventactions_date_idx ON eventactions(date)",
+]
+
+# Daily summary of events, maintained by triggers on the events table
+EVENTDAYS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventdays (
+  date TEXT PRIMARY KEY,
+  nrevents INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS events_insert_trg AFTER INSERT ON events
+BEGIN
+  INSERT INTO eventdays (date, nrevents) VALUES (NEW.date, 1)
+    ON CONFLICT(date) DO UPDATE SET nrevents = nrevents + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS events_delete_trg AFTER DELETE ON events
+BEGIN
+  UPDATE eventdays SET nrevents = nrevents - 1 WHERE date = OLD.date;
+  DELETE FROM eventdays WHERE date = OLD.date AND nrevents <= 0;
+END;
+"""
+
+# Index of media files in the photo folders, maintained by MediaIndex
+MEDIA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mediadirs (
+  dir TEXT PRIMARY KEY,
+  mtime INTEGER,
+  scanned REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mediafiles (
+  dir TEXT NOT NULL,
+  file TEXT NOT NULL,
+  name TEXT NOT NULL,
+  ext TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  ts TEXT NOT NULL,
+  PRIMARY KEY (dir, file)
+);
+
+CREATE INDEX IF NOT EXISTS mediafiles_ts_idx ON mediafiles(dir, kind, ts, file);
+
+CREATE INDEX IF NOT EXISTS mediafiles_name_idx ON mediafiles(dir, name);
+"""
+
+
+def update_schema():
+    """ Bring the schema of an existing database up to date
+    """
+    try:
+        db = get_dbx()
+        tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+        if "events" in tables \
+        and "eventactions" in tables:
+            for stmt in SCHEMA_UPDATES:
+                db.execute(stmt)
+            db.commit()
+            if not "eventdays" in tables:
+                # Create the daily summary and fill it from existing events
+                db.executescript(
+                    "BEGIN;"
+                    + EVENTDAYS_SCHEMA
+                    + "INSERT INTO eventdays (date, nrevents) SELECT date, count(*) FROM events GROUP BY date;"
+                    + "COMMIT;"
+                )
+                logger.debug("update_schema - eventdays created")
+            logger.debug("update_schema - schema updated")
+        else:
+            logger.debug("update_schema - database not yet initialized")
+        db.close()
+    except Exception as e:
+        logger.error("Error updating database schema: %s", e)
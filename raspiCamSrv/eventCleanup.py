@@ -0,0 +1,195 @@
+from raspiCamSrv.camCfg import CameraCfg
+from raspiCamSrv.eventWriter import EventWriter
+from raspiCamSrv.dbx import get_dbx
+from _thread import get_ident
+from datetime import datetime, timedelta
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventCleanup():
+    """ Background job for removal of events older than the retention period
+
+    The job
+    - streams the event log into a new file, keeping only lines after the retention date
+    - removes event action files and eventactions rows in batches of batchSize
+    - deletes events in batches of batchSize
+
+    Each batch is a short transaction, so that the event writer of motion detection
+    and trigger handling is not blocked while a large backlog is removed.
+    Progress is reported in status.
+
+    If automatic cleanup is configured, a scheduler thread starts the job once a day.
+    """
+    batchSize = 500
+    batchPause = 0.05
+    _thread = None
+    _scheduler = None
+    _lock = threading.Lock()
+    status = {
+        "running": False,
+        "dateRem": "",
+        "phase": "",
+        "lines": 0,
+        "files": 0,
+        "actions": 0,
+        "events": 0,
+        "start": "",
+        "end": "",
+        "error": "",
+    }
+
+    @classmethod
+    def isRunning(cls) -> bool:
+        return cls.status["running"]
+
+    @classmethod
+    def start(cls) -> tuple:
+        """ Start the cleanup job
+
+        Returns:
+            (done, msg)
+        """
+        with cls._lock:
+            if not cls._thread is None:
+                return (False, "Cleanup is already running")
+            tc = CameraCfg().triggerConfig
+            dr = datetime.now() - timedelta(days=tc.retentionPeriod)
+            dateRem = str(dr.isoformat()[:10])
+            cls.status = {
+                "running": True,
+                "dateRem": dateRem,
+                "phase": "log",
+                "lines": 0,
+                "files": 0,
+                "actions": 0,
+                "events": 0,
+                "start": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "end": "",
+                "error": "",
+            }
+            cls._thread = threading.Thread(target=cls._cleanupThread, args=(dateRem,), name="raspiCamSrv-cleanup", daemon=True)
+            cls._thread.start()
+        logger.debug("Thread %s: EventCleanup.start - removing %s and earlier", get_ident(), dateRem)
+        return (True, "Cleanup of events until " + dateRem + " started")
+
+    @classmethod
+    def _cleanupThread(cls, dateRem: str):
+        """ Cleanup thread
+        """
+        logger.debug("Thread %s: EventCleanup._cleanupThread - dateRem: %s", get_ident(), dateRem)
+        tc = CameraCfg().triggerConfig
+        try:
+            EventWriter.flush()
+            cls._cleanupLog(tc.logFilePath, dateRem)
+            db = get_dbx()
+            try:
+                cls.status["phase"] = "actions"
+                cls._cleanupActions(db, dateRem)
+                cls.status["phase"] = "events"
+                cls._cleanupEvents(db, dateRem)
+            finally:
+                db.close()
+            tc.resetCalendarCache()
+        except Exception as e:
+            logger.error("Error in event cleanup: %s", e)
+            cls.status["error"] = str(e)
+        cls.status["phase"] = ""
+        cls.status["end"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cls.status["running"] = False
+        logger.debug("Thread %s: EventCleanup._cleanupThread - done: %s", get_ident(), cls.status)
+        with cls._lock:
+            cls._thread = None
+
+    @classmethod
+    def _cleanupLog(cls, fpLog: str, dateRem: str):
+        """ Remove log lines up to dateRem
+
+            The log is streamed into a temporary file which replaces the log.
+            Lines appended meanwhile are taken over while the event writer is blocked.
+        """
+        if not os.path.exists(fpLog):
+            return
+        fpTmp = fpLog + ".tmp"
+        with open(fpLog, "r") as src, open(fpTmp, "w") as tgt:
+            for line in src:
+                if line[:10] > dateRem:
+                    tgt.write(line)
+                else:
+                    cls.status["lines"] += 1
+            with EventWriter.logLock:
+                # Lines written after the loop above are new and kept
+                for line in src:
+                    tgt.write(line)
+                tgt.flush()
+                os.replace(fpTmp, fpLog)
+        logger.debug("Thread %s: EventCleanup._cleanupLog - removed %s lines", get_ident(), cls.status["lines"])
+
+    @classmethod
+    def _cleanupActions(cls, db, dateRem: str):
+        """ Remove files of event actions up to dateRem and delete the eventactions
+        """
+        while True:
+            rows = db.execute("SELECT id, fullpath FROM eventactions WHERE date <= ? ORDER BY id LIMIT ?",
+                              (dateRem, cls.batchSize)
+            ).fetchall()
+            if len(rows) == 0:
+                break
+            ids = []
+            for row in rows:
+                fp = row["fullpath"]
+                if fp and os.path.exists(fp):
+                    os.remove(fp)
+                    cls.status["files"] += 1
+                ids.append(row["id"])
+            db.execute("DELETE FROM eventactions WHERE id IN (" + ",".join("?" * len(ids)) + ")", ids)
+            db.commit()
+            cls.status["actions"] += len(ids)
+            time.sleep(cls.batchPause)
+        logger.debug("Thread %s: EventCleanup._cleanupActions - removed %s files and %s actions", get_ident(), cls.status["files"], cls.status["actions"])
+
+    @classmethod
+    def _cleanupEvents(cls, db, dateRem: str):
+        """ Delete events up to dateRem
+        """
+        while True:
+            cur = db.execute("DELETE FROM events WHERE id IN (SELECT id FROM events WHERE date <= ? LIMIT ?)",
+                             (dateRem, cls.batchSize))
+            db.commit()
+            if cur.rowcount <= 0:
+                break
+            cls.status["events"] += cur.rowcount
+            time.sleep(cls.batchPause)
+        logger.debug("Thread %s: EventCleanup._cleanupEvents - removed %s events", get_ident(), cls.status["events"])
+
+    @classmethod
+    def startScheduler(cls):
+        """ Start the scheduler for automatic cleanup
+        """
+        if cls._scheduler is None:
+            cls._scheduler = threading.Thread(target=cls._schedulerThread, name="raspiCamSrv-cleanupscheduler", daemon=True)
+            cls._scheduler.start()
+            logger.debug("Thread %s: EventCleanup.startScheduler - scheduler started", get_ident())
+
+    @classmethod
+    def _schedulerThread(cls):
+        """ Start the cleanup job once a day at the configured time
+        """
+        while True:
+            try:
+                tc = CameraCfg().triggerConfig
+                if tc.cleanupAuto == True:
+                    now = datetime.now()
+                    today = now.isoformat()[:10]
+                    if tc.cleanupLastRun != today \
+                    and now.hour * 60 + now.minute >= tc.cleanupMinute:
+                        tc.cleanupLastRun = today
+                        (done, msg) = cls.start()
+                        logger.info("Automatic event cleanup: %s", msg)
+            except Exception as e:
+                logger.error("Error in cleanup scheduler: %s", e)
+            time.sleep(60)
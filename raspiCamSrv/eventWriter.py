@@ -0,0 +1,183 @@
+from raspiCamSrv.dbx import get_dbx
+from _thread import get_ident
+import threading
+import queue
+import atexit
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventWriter():
+    """ Background writer for the event log and the events database
+
+    Motion detection and trigger handling only queue text log lines and SQL statements.
+    A single writer thread collects queued entries for up to flushInterval seconds,
+    appends the log lines with one open per log file
+    and executes all statements in one transaction.
+    The database is used in WAL mode with synchronous=NORMAL,
+    so that a commit does not require an fsync of the database file.
+
+    Entries are processed in the order in which they were queued,
+    so that an UPDATE of an eventaction always follows its INSERT.
+
+    generation is incremented whenever statements have been written,
+    so that readers can invalidate cached query results.
+    logLock is held while log lines are appended, so that the log can be replaced safely.
+    """
+    flushInterval = 1.0
+    maxBatch = 200
+    generation = 0
+    _queue = queue.Queue()
+    _thread = None
+    _lock = threading.Lock()
+    logLock = threading.Lock()
+
+    @classmethod
+    def log(cls, logFilePath: str, line: str):
+        """ Queue a line for the text log
+
+            line : log line without line termination
+        """
+        cls._ensureThread()
+        cls._queue.put(("log", logFilePath, line + "\n"))
+
+    @classmethod
+    def execute(cls, sql: str, params: tuple = ()):
+        """ Queue a statement for the events database
+        """
+        cls._ensureThread()
+        cls._queue.put(("sql", sql, params))
+
+    @classmethod
+    def flush(cls, timeout: float = 5.0) -> bool:
+        """ Wait until all queued entries have been written
+
+            This is used before reading events so that the latest entries are included.
+
+        Returns:
+            bool: True if all entries were written within timeout
+        """
+        if cls._thread is None:
+            return True
+        done = threading.Event()
+        cls._queue.put(("flush", done, None))
+        return done.wait(timeout)
+
+    @classmethod
+    def stop(cls):
+        """ Write outstanding entries and stop the writer thread
+        """
+        with cls._lock:
+            thread = cls._thread
+            if thread is None:
+                return
+            cls._queue.put(("stop", None, None))
+        thread.join(10)
+        with cls._lock:
+            cls._thread = None
+        logger.debug("Thread %s: EventWriter.stop - writer thread stopped", get_ident())
+
+    @classmethod
+    def _ensureThread(cls):
+        """ Start the writer thread, if not yet running
+        """
+        if cls._thread is None:
+            with cls._lock:
+                if cls._thread is None:
+                    cls._thread = threading.Thread(target=cls._writerThread, name="raspiCamSrv-eventwriter", daemon=True)
+                    cls._thread.start()
+                    logger.debug("Thread %s: EventWriter._ensureThread - writer thread started", get_ident())
+
+    @classmethod
+    def _connect(cls):
+        """ Open the database connection of the writer thread
+        """
+        db = get_dbx()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @classmethod
+    def _writerThread(cls):
+        """ Writer thread
+        """
+        logger.debug("Thread %s: EventWriter._writerThread", get_ident())
+        db = None
+        stop = False
+        while not stop:
+            batch = [cls._queue.get()]
+            deadline = time.monotonic() + cls.flushInterval
+            while len(batch) < cls.maxBatch \
+            and batch[-1][0] not in ("flush", "stop"):
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    batch.append(cls._queue.get(timeout=wait))
+                except queue.Empty:
+                    break
+            if batch[-1][0] == "stop":
+                # Write everything queued before the stop request
+                while True:
+                    try:
+                        batch.append(cls._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = True
+            if db is None:
+                try:
+                    db = cls._connect()
+                except Exception as e:
+                    logger.error("EventWriter - database not available: %s", e)
+            cls._writeBatch(db, batch)
+        if not db is None:
+            db.close()
+        logger.debug("Thread %s: EventWriter._writerThread - exit", get_ident())
+
+    @classmethod
+    def _writeBatch(cls, db, batch: list):
+        """ Write a batch of entries
+        """
+        lines = {}
+        stmts = []
+        events = []
+        for (kind, a, b) in batch:
+            if kind == "log":
+                if a in lines:
+                    lines[a].append(b)
+                else:
+                    lines[a] = [b]
+            elif kind == "sql":
+                stmts.append((a, b))
+            elif kind == "flush":
+                events.append(a)
+        with cls.logLock:
+            for fp, fpLines in lines.items():
+                try:
+                    with open(fp, "a") as f:
+                        f.writelines(fpLines)
+                except Exception as e:
+                    logger.error("EventWriter - error writing %s: %s", fp, e)
+        if len(stmts) > 0 \
+        and not db is None:
+            try:
+                with db:
+                    for (sql, params) in stmts:
+                        db.execute(sql, params)
+            except Exception as e:
+                # Do not lose the entire batch because of a single statement
+                logger.error("EventWriter - error writing %s statements to database: %s", len(stmts), e)
+                for (sql, params) in stmts:
+                    try:
+                        with db:
+                            db.execute(sql, params)
+                    except Exception as e:
+                        logger.error("EventWriter - error executing %s: %s", sql, e)
+            cls.generation += 1
+        for event in events:
+            event.set()
+
+
+atexit.register(EventWriter.stop)
@@ -10,8 +10,11 @@ from flask import (
     url_for,
 )
 from werkzeug.exceptions import abort
+from werkzeug.security import safe_join
 from raspiCamSrv.auth import login_required, login_for_streaming
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, StreamClient
+from raspiCamSrv.metrics import Metrics
+from raspiCamSrv.media import sendMedia
 from raspiCamSrv.camCfg import CameraCfg, ServerConfig
 from raspiCamSrv.version import version
 from raspiCamSrv.triggerHandler import TriggerHandler
@@ -63,26 +66,60 @@ def index():
         return redirect(url_for("info.main"))
 
 
-def gen(camera):
-    """Video streaming generator function."""
-    # logger.debug("Thread %s: In gen", get_ident())
-    yield b"--frame\r\n"
-    while True:
-        frame, frameRaw = camera.get_frame()
-        if frame:
-            # logger.debug("Thread %s: gen - Got frame of length %s", get_ident(), len(frame))
-            yield b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n--frame\r\n"
-
+def gen(camera, ipaddr: str, stream: str, fps: float):
+    """Video streaming generator function.
 
-def gen2(camera):
-    """Video streaming generator function."""
+    The client is registered only when the generator runs,
+    so that it is always unregistered when the generator is closed.
+    """
+    # logger.debug("Thread %s: In gen", get_ident())
+    client = None
+    try:
+        client = StreamClient(ipaddr, stream, fps)
+        yield b"--frame\r\n"
+        seq = 0
+        while True:
+            client.pace()
+            # The chunk is shared with all other clients and must not be modified
+            seq, chunk = camera.get_chunk(seq, latest=True)
+            if chunk is not None:
+                # logger.debug("Thread %s: gen - Got chunk %s of length %s", get_ident(), seq, len(chunk))
+                client.delivered(seq)
+                mt = Metrics.enabled and time.perf_counter()
+                yield chunk
+                if mt:
+                    Metrics.record("stream_send", time.perf_counter() - mt)
+    finally:
+        if not client is None:
+            client.close()
+
+
+def gen2(camera, ipaddr: str, stream: str, fps: float):
+    """Video streaming generator function.
+
+    The client is registered only when the generator runs,
+    so that it is always unregistered when the generator is closed.
+    """
     # logger.debug("Thread %s: In gen", get_ident())
-    yield b"--frame\r\n"
-    while True:
-        frame, frameRaw = camera.get_frame2()
-        if frame:
-            # logger.debug("Thread %s: gen - Got frame of length %s", get_ident(), len(frame))
-            yield b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n--frame\r\n"
+    client = None
+    try:
+        client = StreamClient(ipaddr, stream, fps)
+        yield b"--frame\r\n"
+        seq = 0
+        while True:
+            client.pace()
+            # The chunk is shared with all other clients and must not be modified
+            seq, chunk = camera.get_chunk2(seq, latest=True)
+            if chunk is not None:
+                # logger.debug("Thread %s: gen - Got chunk %s of length %s", get_ident(), seq, len(chunk))
+                client.delivered(seq)
+                mt = Metrics.enabled and time.perf_counter()
+                yield chunk
+                if mt:
+                    Metrics.record("stream_send", time.perf_counter() - mt)
+    finally:
+        if not client is None:
+            client.close()
 
 
 @bp.route("/live_view_feed")
@@ -93,8 +130,9 @@ def live_view_feed():
     )
     sc = CameraCfg().serverConfig
     sc.registerStreamingClient(request.remote_addr, "live_view", get_ident())
+    fps = request.args.get("fps", type=float)
     Camera().startLiveStream()
-    return Response(gen(Camera()), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(gen(Camera(), request.remote_addr, "live_view", fps), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 
 @bp.route("/video_feed")
@@ -105,8 +143,9 @@ def video_feed():
     )
     sc = CameraCfg().serverConfig
     sc.registerStreamingClient(request.remote_addr, "video_feed", get_ident())
+    fps = request.args.get("fps", type=float)
     Camera().startLiveStream()
-    return Response(gen(Camera()), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(gen(Camera(), request.remote_addr, "video_feed", fps), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 
 @bp.route("/video_feed2")
@@ -117,21 +156,24 @@ def video_feed2():
     )
     sc = CameraCfg().serverConfig
     sc.registerStreamingClient(request.remote_addr, "video_feed2", get_ident())
+    fps = request.args.get("fps", type=float)
     Camera().startLiveStream2()
     return Response(
-        gen2(Camera()), mimetype="multipart/x-mixed-replace; boundary=frame"
+        gen2(Camera(), request.remote_addr, "video_feed2", fps), mimetype="multipart/x-mixed-replace; boundary=frame"
     )
 
 
-@bp.route("/photos/<photo>")
+@bp.route("/photos/<path:photo>")
 @login_required
 def displayImage(photo: str):
     logger.debug("In displayImage")
     logger.debug("photo=%s", photo)
-    logger.debug("current_app.root_path=%s", current_app.root_path)
-    fp = current_app.root_path + "/photos/" + photo
+    sc = CameraCfg().serverConfig
+    fp = safe_join(sc.photoRoot + "/photos", photo)
     logger.debug("fp = %s", fp)
-    return Response(fp, mimetype="image/jpg")
+    if fp is None:
+        abort(404)
+    return sendMedia(fp)
 
 
 @bp.route("/focus_control", methods=("GET", "POST"))
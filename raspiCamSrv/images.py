@@ -1,13 +1,16 @@
 from flask import Blueprint, Response, flash, g, redirect, render_template, request, url_for
 from flask import send_file, send_from_directory
 from werkzeug.exceptions import abort
+from werkzeug.security import safe_join
 from raspiCamSrv.camCfg import CameraCfg
 from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.mediaIndex import MediaIndex
+from raspiCamSrv.thumbnails import Thumbnails
+from raspiCamSrv.zipStream import zipStream
+from raspiCamSrv.media import sendMedia
 from raspiCamSrv.version import version
 import os
 from datetime import datetime, timedelta
-from io import BytesIO
-from zipfile import ZipFile
 
 from raspiCamSrv.auth import login_required
 import logging
@@ -16,73 +19,53 @@ bp = Blueprint("images", __name__)
 
 logger = logging.getLogger(__name__)
 
-def getFileList() -> list:
+def getFileList(force: bool = False):
+    """ Get the current page of media for the photo viewer from the media index
+
+    Args:
+        force: rescan the camera folder even if it seems unchanged
+    """
     logger.debug("In images/getFileList")
     cfg = CameraCfg()
     sc = cfg.serverConfig
-    # Get the filelist
-    fp = sc.photoRoot + "/" + "photos/" + "camera_" + str(sc.pvCamera)    
-    fl = os.listdir(fp)
-    # Sort reverse
-    fl.sort(reverse=True)
-    logger.debug("%s files found in %s", len(fl), fp)
-    
+    fp = sc.photoRoot + "/" + "photos/" + "camera_" + str(sc.pvCamera)
+    MediaIndex.refresh(fp, force)
+    sc.pvCount = MediaIndex.count(fp, sc.pvFrom, sc.pvTo)
+    if sc.pvPage >= sc.pvPages:
+        sc.pvPage = sc.pvPages - 1
+    logger.debug("%s distinct files in selected range. Page %s of %s", sc.pvCount, sc.pvPage + 1, sc.pvPages)
+    photos, others = MediaIndex.query(fp, sc.pvFrom, sc.pvTo, sc.pvPageSize, sc.pvPage * sc.pvPageSize)
+
     dl = []
-    p = 1
-    cnt = 0
-    for file in fl:
-        name, ext = os.path.splitext(file)
+    byName = {}
+    for photo in photos:
+        name = photo["name"]
+        file = photo["file"]
         path = "photos/" + "camera_" + str(sc.pvCamera) + "/" + file
-        fpath = os.path.join(fp, file)
-        if ext.lower() != ".dng" \
-        and ext.lower() != ".tiff" \
-        and ext.lower() != ".mp4" \
-        and ext.lower() != ".h264" \
-        and (not os.path.isdir(fpath)):
-            nameOK = False
-            try:
-                dat =  datetime.strptime(name, "%Y%m%d_%H%M%S")
-                nameOK = True
-            except ValueError:
-                nameOK = False
-            if nameOK == True:
-                include = False
-                if dat >= sc.pvFrom and dat <= sc.pvTo:
-                    include = True
-            else:
-                include = False
-            if include == True:
-                cnt += 1
-                entry = {}
-                entry["sel"] = False
-                entry["path"] = path
-                entry["file"] = file
-                entry["name"] = name
-                entry["type"] = "photo"
-                entry["detailPath"] = path
-                dl.append(entry)
-    logger.debug("%s distinct files in selected range", cnt)
+        entry = {}
+        entry["sel"] = False
+        entry["path"] = path
+        entry["file"] = file
+        entry["name"] = name
+        entry["type"] = "photo"
+        entry["detailPath"] = path
+        dl.append(entry)
+        if not name in byName:
+            byName[name] = entry
 
-    for file in fl:
-        name, ext = os.path.splitext(file)
-        path = "photos/" + "camera_" + str(sc.pvCamera) + "/" + file
-        if ext.lower() == ".dng" \
-        or ext.lower() == ".tiff" \
-        or ext.lower() == ".mp4" \
-        or ext.lower() == ".h264":
-            # For raw and video, search the placeholder and update
-            for entry in dl:
-                if entry["name"] == name:
-                    if ext.lower() == ".dng" \
-                    or ext.lower() == ".tiff":
-                        entry["type"] = "raw"
-                        entry["file"] = file
-                    else:
-                        entry["type"] = "video"
-                        entry["file"] = file
-                        if ext.lower() == ".mp4":
-                            entry["detailPath"] = path
-                    break
+    # For raw and video, update the placeholder
+    for other in others:
+        name = other["name"]
+        file = other["file"]
+        if name in byName:
+            entry = byName[name]
+            entry["file"] = file
+            if other["kind"] == "raw":
+                entry["type"] = "raw"
+            else:
+                entry["type"] = "video"
+                if file.lower().endswith(".mp4"):
+                    entry["detailPath"] = "photos/" + "camera_" + str(sc.pvCamera) + "/" + file
     sc.pvList = dl
 
 @bp.route("/images")
@@ -108,7 +91,7 @@ def main():
         pvTo = datetime.now()
         sc.pvTo = datetime(year=pvTo.year, month=pvTo.month, day=pvTo.day, hour=23, minute=59, second=59)
     getFileList()
-    l = len(sc.pvList)
+    l = sc.pvCount
     if l > 0:
         msg = f'{l} distinct media files found in specified range (placeholders not included)'
     else:
@@ -138,8 +121,11 @@ def control():
         sc.pvFromStr = pvFromStr
         pvToStr = request.form.get("pvto")
         sc.pvToStr = pvToStr
+        if not request.form.get("pvpagesize") is None:
+            sc.pvPageSize = int(request.form.get("pvpagesize"))
+        sc.pvPage = 0
         getFileList() 
-    l = len(sc.pvList)
+    l = sc.pvCount
     if l > 0:
         msg = f'{l} distinct media files found in specified range (placeholders not included)'
     else:
@@ -164,8 +150,9 @@ def today():
         sc.pvFrom = datetime(year=pvFrom.year, month=pvFrom.month, day=pvFrom.day, hour=0, minute=0, second=0)
         pvTo = datetime.now()
         sc.pvTo = datetime(year=pvTo.year, month=pvTo.month, day=pvTo.day, hour=23, minute=59, second=59)
+        sc.pvPage = 0
         getFileList()
-    l = len(sc.pvList)
+    l = sc.pvCount
     if l > 0:
         msg = f'{l} distinct media files found in specified range (placeholders not included)'
     else:
@@ -189,8 +176,9 @@ def all():
         sc.pvFrom = datetime(year=1970, month=1, day=1, hour=0, minute=0, second=0)
         pvTo = datetime.now()
         sc.pvTo = datetime(year=pvTo.year, month=pvTo.month, day=pvTo.day, hour=23, minute=59, second=59)
+        sc.pvPage = 0
         getFileList()
-    l = len(sc.pvList)
+    l = sc.pvCount
     if l > 0:
         msg = f'{l} distinct media files found in specified range (placeholders not included)'
     else:
@@ -198,6 +186,41 @@ def all():
     flash(msg)
     return render_template("images/main.html", sc=sc, cp=cp, cs=cs)
 
+@bp.route("/page_next", methods=("GET", "POST"))
+@login_required
+def page_next():
+    logger.debug("In images/page_next")
+    g.hostname = request.host
+    g.version = version
+    cam = Camera()
+    cfg = CameraCfg()
+    sc = cfg.serverConfig
+    cp = cfg.cameraProperties
+    cs = cfg.cameras
+    sc.curMenu = "photos"
+    if request.method == "POST":
+        if sc.pvPage < sc.pvPages - 1:
+            sc.pvPage = sc.pvPage + 1
+        getFileList()
+    return render_template("images/main.html", sc=sc, cp=cp, cs=cs)
+
+@bp.route("/page_prev", methods=("GET", "POST"))
+@login_required
+def page_prev():
+    logger.debug("In images/page_prev")
+    g.hostname = request.host
+    g.version = version
+    cam = Camera()
+    cfg = CameraCfg()
+    sc = cfg.serverConfig
+    cp = cfg.cameraProperties
+    cs = cfg.cameras
+    sc.curMenu = "photos"
+    if request.method == "POST":
+        sc.pvPage = sc.pvPage - 1
+        getFileList()
+    return render_template("images/main.html", sc=sc, cp=cp, cs=cs)
+
 @bp.route("/select_all", methods=("GET", "POST"))
 @login_required
 def select_all():
@@ -300,7 +323,7 @@ def delete_selected():
         if cntd > 0:
             sc.displayBufferCheck()
 
-        getFileList() 
+        getFileList(force=True)
                 
         msg = f"{cntd} distinct media removed: {cnt} successful deletions, {cntErr} failed deletions"
         flash(msg)
@@ -377,24 +400,18 @@ def download_selected():
                         logger.debug("images/download_selected - added %s", fn)
                         zl.append(fn)
         if len(zl) > 1:
-            logger.debug("images/download_selected - Preparing archive")
-            stream = BytesIO()
-            with ZipFile(stream, 'w') as zf:
-                for file in zl:
-                    zf.write(file, os.path.basename(file))
-            stream.seek(0)
-            logger.debug("images/download_selected - archive done")
-
             now = datetime.now()
             zipName = "raspiCamSrvMedia_" + now.strftime("%Y%m%d_%H%M%S") + ".zip"
             logger.debug("images/download_selected - downloading as %s", zipName)
             msg = f"Downloading archive {zipName} with {cntPhoto} photos, {cntRaw} raw photos and {cntVideo} videos."
             flash(msg)
-            return send_file(
-                stream,
-                as_attachment=True,
-                download_name=zipName
+            # The archive is streamed while it is generated
+            resp = Response(
+                zipStream([(file, os.path.basename(file)) for file in zl]),
+                mimetype="application/zip"
             )
+            resp.headers.set("Content-Disposition", "attachment", filename=zipName)
+            return resp
         elif len(zl) == 1:
             fp = zl[0]
             (path, file) = os.path.split(fp)
@@ -410,6 +427,23 @@ def download_selected():
     flash(msg)
     return render_template("images/main.html", sc=sc, cp=cp, cs=cs)
 
+@bp.route("/thumbnail/<path:relPath>")
+@login_required
+def thumbnail(relPath):
+    """ Thumbnail for a photo or video below the photo root
+    """
+    cfg = CameraCfg()
+    sc = cfg.serverConfig
+    fp = safe_join(sc.photoRoot, relPath)
+    if fp is None \
+    or not os.path.isfile(fp):
+        abort(404)
+    tp = Thumbnails.get(fp)
+    if tp is None:
+        # No thumbnail possible: deliver the original
+        return sendMedia(fp)
+    return sendMedia(tp, mimetype="image/jpeg")
+
 @bp.route("/media-viewer")
 @login_required
 def media_viewer():
@@ -0,0 +1,136 @@
+from flask import Response, abort, current_app, request
+from werkzeug.datastructures import ContentRange
+from werkzeug.security import safe_join
+from _thread import get_ident
+from datetime import datetime, timezone
+import mimetypes
+import re
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Block size for reading files if the server does not provide a file wrapper
+BLOCK_SIZE = 256 * 1024
+# Media with a timestamp in the name are never modified
+TIMESTAMPED = re.compile(r"\d{8}_\d{6}|\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}")
+MAX_AGE_IMMUTABLE = 365 * 24 * 3600
+# Files modified more recently may still be written (e.g. videos being recorded)
+IMMUTABLE_MIN_AGE = 300
+
+
+def _fileChunks(f, length: int):
+    """ Read length bytes from the current position of f
+    """
+    try:
+        while length > 0:
+            chunk = f.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def sendMedia(fp: str, mimetype: str = None, immutable: bool = None) -> Response:
+    """ Send a file with support for conditional and range requests
+
+    - The strong ETag is derived from inode, size and modification time.
+    - If-None-Match and If-Modified-Since are answered with 304.
+    - A single byte range is answered with 206, if If-Range (if any) matches.
+    - Files with a timestamp in the name, which have not been modified for IMMUTABLE_MIN_AGE seconds,
+      are cached by the browser without revalidation.
+      Other files are revalidated with the ETag.
+    - If the server provides a file wrapper (e.g. Gunicorn), the file is passed to the server,
+      which can use sendfile for zero-copy transfer.
+
+    Args:
+        fp: path of the file
+        mimetype: mimetype. If None, it is guessed from the file name
+        immutable: whether the file never changes. If None, this is derived from the file name
+    """
+    try:
+        st = os.stat(fp)
+    except OSError:
+        abort(404)
+    if not os.path.isfile(fp):
+        abort(404)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(fp)[0] or "application/octet-stream"
+    if immutable is None:
+        immutable = TIMESTAMPED.search(os.path.basename(fp)) is not None
+    if immutable \
+    and time.time() - st.st_mtime < IMMUTABLE_MIN_AGE:
+        immutable = False
+    etag = "%x-%x-%x" % (st.st_ino, st.st_size, st.st_mtime_ns)
+    mtime = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+
+    resp = Response(mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.last_modified = mtime
+    resp.headers["Accept-Ranges"] = "bytes"
+    if immutable:
+        resp.headers["Cache-Control"] = "public, max-age=%s, immutable" % MAX_AGE_IMMUTABLE
+    else:
+        resp.headers["Cache-Control"] = "no-cache"
+
+    # Conditional request
+    notModified = False
+    if request.if_none_match:
+        notModified = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since:
+        notModified = request.if_modified_since >= mtime
+    if notModified:
+        resp.status_code = 304
+        return resp
+
+    # Range request
+    size = st.st_size
+    start = 0
+    stop = size
+    rng = request.range
+    if not rng is None \
+    and len(rng.ranges) == 1:
+        ifRange = request.if_range
+        rangeOK = True
+        if ifRange.etag:
+            rangeOK = ifRange.etag == etag
+        elif ifRange.date:
+            rangeOK = ifRange.date >= mtime
+        if rangeOK:
+            r = rng.range_for_length(size)
+            if r is None:
+                resp.status_code = 416
+                resp.content_range = ContentRange("bytes", None, None, size)
+                return resp
+            (start, stop) = r
+            resp.status_code = 206
+            resp.content_range = ContentRange("bytes", start, stop, size)
+    resp.content_length = stop - start
+    if request.method == "HEAD":
+        return resp
+
+    f = open(fp, "rb")
+    if start > 0:
+        f.seek(start)
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if not wrapper is None \
+    and stop == size:
+        # The server sends from the current position with length limited by Content-Length
+        resp.response = wrapper(f, BLOCK_SIZE)
+    else:
+        resp.response = _fileChunks(f, stop - start)
+    resp.direct_passthrough = True
+    logger.debug("Thread %s: sendMedia - %s status: %s range: %s-%s", get_ident(), fp, resp.status_code, start, stop)
+    return resp
+
+
+def static(filename: str) -> Response:
+    """ View function for the static folder, replacing the Flask default
+    """
+    fp = safe_join(current_app.static_folder, filename)
+    if fp is None:
+        abort(404)
+    return sendMedia(fp)
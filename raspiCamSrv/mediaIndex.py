@@ -0,0 +1,145 @@
+from raspiCamSrv.dbx import get_dbx, MEDIA_SCHEMA
+from _thread import get_ident
+from datetime import datetime
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+RAW_EXTS = (".dng", ".tiff")
+VIDEO_EXTS = (".mp4", ".h264")
+NAME_FORMAT = "%Y%m%d_%H%M%S"
+
+
+class MediaIndex():
+    """ Persistent index of the media files in the photo folders
+
+    The index is kept in the mediafiles table of the database with one row per file.
+    Only files with names of the form YYYYMMDD_hhmmss are indexed.
+    The timestamp is parsed when a file is added to the index and stored in normalized form,
+    so that a date range is selected through an index range query.
+
+    A directory is only scanned if its modification time has changed since the last scan
+    or the last scan was too close to the modification time to be conclusive.
+    A scan lists the directory with os.scandir and only adds new and removes missing files.
+    """
+    _lock = threading.Lock()
+    _schemaOK = False
+    # Seconds between directory modification and scan for the scan to be trusted
+    mtimeSlack = 2.0
+
+    @classmethod
+    def _connect(cls):
+        """ Open a database connection and make sure that the index tables exist
+        """
+        db = get_dbx()
+        if not cls._schemaOK:
+            db.executescript(MEDIA_SCHEMA)
+            cls._schemaOK = True
+        return db
+
+    @staticmethod
+    def kindOf(ext: str) -> str:
+        """ Media kind for a file extension
+        """
+        e = ext.lower()
+        if e in RAW_EXTS:
+            return "raw"
+        if e in VIDEO_EXTS:
+            return "video"
+        return "photo"
+
+    @classmethod
+    def refresh(cls, fp: str, force: bool = False) -> bool:
+        """ Bring the index for directory fp up to date
+
+        Args:
+            fp: directory path
+            force: scan even if the directory modification time has not changed
+
+        Returns:
+            bool: True if the directory was scanned
+        """
+        try:
+            mtime = os.stat(fp).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with cls._lock:
+            db = cls._connect()
+            try:
+                row = db.execute("SELECT mtime, scanned FROM mediadirs WHERE dir = ?", (fp,)).fetchone()
+                if not force \
+                and not row is None \
+                and row["mtime"] == mtime \
+                and row["scanned"] - (mtime or 0) / 1e9 > cls.mtimeSlack:
+                    return False
+                scanned = time.time()
+                known = set(r[0] for r in db.execute("SELECT file FROM mediafiles WHERE dir = ?", (fp,)))
+                found = set()
+                new = []
+                if not mtime is None:
+                    with os.scandir(fp) as it:
+                        for entry in it:
+                            file = entry.name
+                            if file in known:
+                                found.add(file)
+                                continue
+                            if entry.is_dir():
+                                continue
+                            name, ext = os.path.splitext(file)
+                            try:
+                                dat = datetime.strptime(name, NAME_FORMAT)
+                            except ValueError:
+                                continue
+                            found.add(file)
+                            new.append((fp, file, name, ext, cls.kindOf(ext), dat.strftime(NAME_FORMAT)))
+                gone = [(fp, file) for file in known - found]
+                with db:
+                    if len(new) > 0:
+                        db.executemany("INSERT OR REPLACE INTO mediafiles (dir, file, name, ext, kind, ts) VALUES (?, ?, ?, ?, ?, ?)", new)
+                    if len(gone) > 0:
+                        db.executemany("DELETE FROM mediafiles WHERE dir = ? AND file = ?", gone)
+                    db.execute("INSERT OR REPLACE INTO mediadirs (dir, mtime, scanned) VALUES (?, ?, ?)", (fp, mtime, scanned))
+                logger.debug("Thread %s: MediaIndex.refresh - %s: %s added, %s removed in %s s", get_ident(), fp, len(new), len(gone), time.time() - scanned)
+                return True
+            finally:
+                db.close()
+
+    @classmethod
+    def count(cls, fp: str, dFrom: datetime, dTo: datetime) -> int:
+        """ Number of photos (including placeholders of raw photos and videos) in the range
+        """
+        db = cls._connect()
+        try:
+            row = db.execute("SELECT count(*) FROM mediafiles WHERE dir = ? AND kind = 'photo' AND ts BETWEEN ? AND ?",
+                             (fp, dFrom.strftime(NAME_FORMAT), dTo.strftime(NAME_FORMAT))
+            ).fetchone()
+        finally:
+            db.close()
+        return row[0]
+
+    @classmethod
+    def query(cls, fp: str, dFrom: datetime, dTo: datetime, limit: int, offset: int = 0) -> tuple:
+        """ Get a page of media in the range, latest first
+
+        For every photo or placeholder, the raw photo or video with the same name is included.
+
+        Returns:
+            (photos, others): rows (name, file) of photos and placeholders on the page
+            and rows (name, file, kind) of raw photos and videos with names on the page
+        """
+        db = cls._connect()
+        try:
+            photos = db.execute("SELECT name, file FROM mediafiles WHERE dir = ? AND kind = 'photo' AND ts BETWEEN ? AND ? ORDER BY ts DESC, file DESC LIMIT ? OFFSET ?",
+                                (fp, dFrom.strftime(NAME_FORMAT), dTo.strftime(NAME_FORMAT), limit, offset)
+            ).fetchall()
+            others = []
+            if len(photos) > 0:
+                others = db.execute("SELECT name, file, kind FROM mediafiles WHERE dir = ? AND kind <> 'photo' AND name BETWEEN ? AND ? ORDER BY file DESC",
+                                    (fp, min(p["name"] for p in photos), max(p["name"] for p in photos))
+                ).fetchall()
+        finally:
+            db.close()
+        return photos, others
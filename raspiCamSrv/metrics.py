@@ -0,0 +1,162 @@
+from _thread import get_ident, allocate_lock
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MetricWindow():
+    """Rolling window of the most recent samples of a single timer"""
+
+    def __init__(self, name: str, help: str, size: int = 1024):
+        self.name = name
+        self.help = help
+        self.size = size
+        self.values = [0.0] * size
+        self.times = [0.0] * size
+        self.idx = 0
+        self.count = 0
+        self.sum = 0.0
+        self.lock = allocate_lock()
+
+    def add(self, value: float):
+        """Add a sample (duration in sec)"""
+        now = time.monotonic()
+        with self.lock:
+            self.values[self.idx] = value
+            self.times[self.idx] = now
+            self.idx = (self.idx + 1) % self.size
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        """Compute percentiles and rate over the current window"""
+        with self.lock:
+            n = min(self.count, self.size)
+            if n == self.size:
+                values = self.values[self.idx:] + self.values[:self.idx]
+                times = self.times[self.idx:] + self.times[:self.idx]
+            else:
+                values = self.values[:n]
+                times = self.times[:n]
+            count = self.count
+            total = self.sum
+        res = {
+            "count": count,
+            "sum": total,
+            "window": n,
+            "p50": 0.0,
+            "p95": 0.0,
+            "p99": 0.0,
+            "max": 0.0,
+            "rate": 0.0,
+        }
+        if n > 0:
+            values = sorted(values)
+            res["p50"] = values[int(0.50 * (n - 1))]
+            res["p95"] = values[int(0.95 * (n - 1))]
+            res["p99"] = values[int(0.99 * (n - 1))]
+            res["max"] = values[-1]
+            if n > 1:
+                span = times[-1] - times[0]
+                if span > 0:
+                    res["rate"] = (n - 1) / span
+        return res
+
+
+class Metrics():
+    """ Lightweight hot-path timers for the camera pipelines
+
+    Instrumented code follows the pattern
+
+        mt = Metrics.enabled and time.perf_counter()
+        ...
+        if mt:
+            Metrics.record("name", time.perf_counter() - mt)
+
+    so that disabled metrics cost a single attribute check.
+    """
+    enabled = False
+    windows = {}
+    windowsLock = allocate_lock()
+
+    # Known timers with help text
+    TIMERS = {
+        "live_thread": "Processing per frame in the live stream thread of the active camera",
+        "live_thread2": "Processing per frame in the live stream thread of the second camera",
+        "live_interval": "Interval between frames in the live stream thread of the active camera",
+        "live_interval2": "Interval between frames in the live stream thread of the second camera",
+        "frames_encoder_wait": "Wait for the next MJPEG frame of the active camera encoder",
+        "frames2_encoder_wait": "Wait for the next MJPEG frame of the second camera encoder",
+        "frames_usb": "Capture, transformation and JPEG encoding of a USB frame (active camera)",
+        "frames2_usb": "Capture, transformation and JPEG encoding of a USB frame (second camera)",
+        "usb_apply_controls": "Application of controls to a USB frame",
+        "stereo_process": "Processing of a stereo image pair",
+        "stream_send": "Delivery of a frame to a streaming client",
+    }
+
+    @classmethod
+    def record(cls, name: str, value: float):
+        """Record a sample (duration in sec) for timer name"""
+        window = cls.windows.get(name)
+        if window is None:
+            with cls.windowsLock:
+                window = cls.windows.get(name)
+                if window is None:
+                    help = cls.TIMERS.get(name, name)
+                    if name.startswith("motion_detect_"):
+                        help = "Motion detection with algorithm " + name[14:]
+                    window = MetricWindow(name, help)
+                    cls.windows[name] = window
+        window.add(value)
+
+    @classmethod
+    def setEnabled(cls, value: bool):
+        """Switch metrics collection on or off"""
+        logger.debug("Thread %s: Metrics.setEnabled - %s", get_ident(), value)
+        if value == True and cls.enabled == False:
+            cls.reset()
+        cls.enabled = value
+
+    @classmethod
+    def reset(cls):
+        """Discard all collected samples"""
+        with cls.windowsLock:
+            cls.windows = {}
+
+    @classmethod
+    def toDict(cls) -> dict:
+        """Return a dict of all timers with durations in ms"""
+        res = {}
+        with cls.windowsLock:
+            windows = list(cls.windows.values())
+        for window in windows:
+            snap = window.snapshot()
+            res[window.name] = {
+                "count": snap["count"],
+                "window": snap["window"],
+                "p50_ms": round(snap["p50"] * 1000, 3),
+                "p95_ms": round(snap["p95"] * 1000, 3),
+                "p99_ms": round(snap["p99"] * 1000, 3),
+                "max_ms": round(snap["max"] * 1000, 3),
+                "rate_per_sec": round(snap["rate"], 2),
+            }
+        return res
+
+    @classmethod
+    def toPrometheus(cls) -> str:
+        """Return all timers in Prometheus text exposition format"""
+        lines = []
+        with cls.windowsLock:
+            windows = list(cls.windows.values())
+        for window in windows:
+            snap = window.snapshot()
+            metric = "raspicamsrv_" + window.name + "_seconds"
+            lines.append("# HELP " + metric + " " + window.help)
+            lines.append("# TYPE " + metric + " summary")
+            for q in ("0.5", "0.95", "0.99"):
+                key = "p" + q[2:].ljust(2, "0")
+                lines.append(metric + '{quantile="' + q + '"} ' + repr(snap[key]))
+            lines.append(metric + "_sum " + repr(snap["sum"]))
+            lines.append(metric + "_count " + str(snap["count"]))
+        return "\n".join(lines) + "\n"
@@ -5,6 +5,7 @@
 ##############################################################################################
 import cv2
 import os
+import time
 import shutil
 from glob import glob
 import copy
@@ -36,6 +37,8 @@ class MotionDetectAlgoIB():
         self._ronis = []
         self._currentRoI = None
         self._currentRoiIdx = None
+        self._analysisScale = 1
+        self._frameRows = None
         self._testFrame1 = None
         self._testFrame2 = None
         self._testFrame3 = None
@@ -141,6 +144,16 @@ class MotionDetectAlgoIB():
     def currentRoiIdx(self, value):
         self._currentRoiIdx = value
 
+    @property
+    def analysis_scale(self) -> int:
+        return self._analysisScale
+
+    @analysis_scale.setter
+    def analysis_scale(self, value: int):
+        if value not in (1, 2, 4):
+            value = 1
+        self._analysisScale = value
+
     @property
     def testFrame1(self):
         return self._testFrame1
@@ -292,13 +305,7 @@ class MotionDetectAlgoIB():
         """
         if self.recordingActive == True:
             #logger.debug("Thread %s: MotionDetectFrameDiff.recordMotion - recordIdx:%s", get_ident(), self.recordIdx)
-            # Restore RONIs
-            for roni in self.ronis:
-                x = roni[0]
-                y = roni[1]
-                w = roni[2]
-                h = roni[3]
-                self.frame2[y:y+h, x:x+w] = self.frame2o[y:y+h, x:x+w]
+            self._colorFrame()
             self._draw_bboxes()
             if self.videoWithRoi:
                 for roi in self.rois:
@@ -314,23 +321,112 @@ class MotionDetectAlgoIB():
                     h = roni[3]
                     cv2.rectangle(self.frame2, (x,y), (x+w,y+h), (255,0,0), 2)
                 if self.currentRoI is not None:
-                    x = self.currentRoI[0]
-                    y = self.currentRoI[1]
-                    w = self.currentRoI[2]
-                    h = self.currentRoI[3]
+                    s = self.analysis_scale
+                    x = self.currentRoI[0] * s
+                    y = self.currentRoI[1] * s
+                    w = self.currentRoI[2] * s
+                    h = self.currentRoI[3] * s
                     cv2.rectangle(self.frame2, (x,y), (x+w,y+h), (0,0,255), 2)  
-            if len(self.frame2.shape) == 2:
-                framergb = cv2.cvtColor(self.frame2, cv2.COLOR_YUV2RGB_I420)
-            elif len(self.frame2.shape) == 3:
-                if self.frame2.shape[2] == 4:
-                    framergb = cv2.cvtColor(self.frame2, cv2.COLOR_RGBA2RGB)
-                else:
-                    framergb = self.frame2
-            else:
-                framergb = self.frame2
-            self.video.write(framergb)
+            self.video.write(self.frame2)
             self.recordIdx += 1
 
+    def getResult(self) -> dict:
+        """ Return the state of the last detection which is required for drawing and testing
+
+            Used to transfer results from a motion detection worker process (see motionWorker)
+        """
+        res = {
+            "detections": self.detections,
+            "currentRoI": self.currentRoI,
+            "frameRows": self._frameRows,
+        }
+        if self.test == True:
+            res["testFrames"] = (self.testFrame1, self.testFrame2, self.testFrame3, self.testFrame4)
+        return res
+
+    def applyResult(self, res: dict, frameRaw, rois: list, ronis: list):
+        """ Take over the result of a detection done by a motion detection worker process
+
+            frameRaw : live view buffer of the analyzed frame
+        """
+        self.frame2 = None
+        self.frame2o = frameRaw
+        self.rois = rois
+        self.ronis = ronis
+        self.detections = res["detections"]
+        self.currentRoI = res["currentRoI"]
+        self._frameRows = res["frameRows"]
+        if "testFrames" in res:
+            (self.testFrame1, self.testFrame2, self.testFrame3, self.testFrame4) = res["testFrames"]
+
+    def saveBackground(self, fp: str) -> bool:
+        """ Save the state of the background model to file fp
+
+            Only algorithms with a background model persist a state.
+        """
+        return False
+
+    def restoreBackground(self, fp: str) -> bool:
+        """ Restore the state of the background model from file fp
+
+            Only algorithms with a background model persist a state.
+        """
+        return False
+
+    def _colorFrame(self):
+        """ Return the colour image of the current frame
+
+            Motion is analyzed on grayscale frames only.
+            The colour image is required just for drawing (test mode and video with bounding boxes).
+            It is converted from the live view buffer (frame2o) only once per frame.
+        """
+        if self.frame2 is None:
+            frame = self.frame2o
+            if len(frame.shape) == 2:
+                if self._frameRows is not None \
+                and frame.shape[0] > self._frameRows:
+                    # YUV420 buffer: Y plane followed by U and V planes
+                    frame = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
+                else:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            elif frame.shape[2] == 4:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            self.frame2 = frame
+        return self.frame2
+
+    def _maskRonis(self, frame, ronis: list):
+        """ Return a grayscale frame with Regions of No Interest cleared
+
+            The input frame is not modified. A copy is only made if RONIs exist.
+        """
+        if len(ronis) == 0:
+            return frame
+        frame = frame.copy()
+        for roni in ronis:
+            x = roni[0]
+            y = roni[1]
+            w = roni[2]
+            h = roni[3]
+            frame[y:y+h, x:x+w] = 0
+        return frame
+
+    def _toAnalysis(self, frame):
+        """ Reduce a grayscale frame to the analysis resolution
+
+            Each pyramid level halves width and height.
+        """
+        scale = self.analysis_scale
+        while scale > 1:
+            frame = cv2.pyrDown(frame)
+            scale = scale // 2
+        return frame
+
+    def _scaleRect(self, rect):
+        """ Convert a rectangle (x, y, w, h) from frame coordinates to analysis coordinates
+        """
+        s = self.analysis_scale
+        return (rect[0] // s, rect[1] // s, max(rect[2] // s, 1), max(rect[3] // s, 1))
+
     def _frameToStream(self, frame):
         """Convert frame to bytestream"""
         frameb = None
@@ -341,9 +437,13 @@ class MotionDetectAlgoIB():
         return frameb
 
     def _draw_bboxes(self):
-        """ Draw bounding boxes"""
+        """ Draw bounding boxes
+        
+            Detections are in analysis coordinates and are scaled to the frame
+        """
         #logger.debug("Thread %s: MotionDetectFrameDiff._draw_bboxes", get_ident())
         if not self.detections is None:
+            s = self.analysis_scale
             if self.currentRoI is None:
                 xo = 0
                 yo = 0
@@ -352,7 +452,7 @@ class MotionDetectAlgoIB():
                 yo = self.currentRoI[1]
             for det in self.detections:
                 x1,y1,x2,y2 = det
-                cv2.rectangle(self.frame2, (x1+xo,y1+yo), (x2+xo,y2+yo), (0,255,0), 2)
+                cv2.rectangle(self.frame2, (int(x1+xo)*s,int(y1+yo)*s), (int(x2+xo)*s,int(y2+yo)*s), (0,255,0), 2)
 
     def _get_contour_detections(self, mask, thresh=400):
         """ Obtains initial proposed detections from contours discoverd on the mask. 
@@ -391,24 +491,35 @@ class MotionDetectAlgoIB():
         boxes = boxes[np.argsort(scores)[::-1]]
 
         # remove all contained bounding boxes and get ordered index
-        order = self._remove_contained_bboxes(boxes)
-
+        order = np.array(self._remove_contained_bboxes(boxes), dtype=np.intp)
+        if len(order) == 0:
+            return boxes[order]
+
+        # IoU matrix of all remaining boxes
+        b = boxes[order].astype(np.float64)
+        area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        iw = np.clip(np.minimum(b[:, None, 2], b[None, :, 2]) - np.maximum(b[:, None, 0], b[None, :, 0]), 0, None)
+        ih = np.clip(np.minimum(b[:, None, 3], b[None, :, 3]) - np.maximum(b[:, None, 1], b[None, :, 1]), 0, None)
+        intersection = iw * ih
+        union = area[:, None] + area[None, :] - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            iou = np.where(union > 0, intersection / union, 0.0)
+
+        # Suppression in score order: the best remaining box is kept and suppresses lower ranked boxes.
+        # As in the original list based implementation, a box directly following a suppressed box
+        # is not compared in the same round. So, within a run of overlapping boxes,
+        # only every second box is suppressed.
+        remaining = np.arange(len(order))
         keep = []
-        while order:
-            i = order.pop(0)
-            keep.append(i)
-            for j in order:
-                # Calculate the IoU between the two boxes
-                intersection = max(0, min(boxes[i][2], boxes[j][2]) - max(boxes[i][0], boxes[j][0])) * \
-                            max(0, min(boxes[i][3], boxes[j][3]) - max(boxes[i][1], boxes[j][1]))
-                union = (boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]) + \
-                        (boxes[j][2] - boxes[j][0]) * (boxes[j][3] - boxes[j][1]) - intersection
-                iou = intersection / union
-
-                # Remove boxes with IoU greater than the threshold
-                if iou > threshold:
-                    order.remove(j)
-                    
+        while len(remaining) > 0:
+            k = remaining[0]
+            keep.append(order[k])
+            rest = remaining[1:]
+            over = iou[k, rest] > threshold
+            idx = np.arange(len(rest))
+            runStart = np.maximum.accumulate(np.where(over & ~np.r_[False, over[:-1]], idx, 0))
+            remaining = rest[~(over & ((idx - runStart) % 2 == 0))]
+
         return boxes[keep]
 
     def _remove_contained_bboxes(self, boxes):
@@ -422,16 +533,26 @@ class MotionDetectAlgoIB():
                 keep - indexes of bounding boxes that are not entirely contained 
                     in another box
             """
-        check_array = np.array([True, True, False, False])
-        keep = list(range(0, len(boxes)))
-        for i in keep: # range(0, len(bboxes)):
-            for j in range(0, len(boxes)):
-                # check if box j is completely contained in box i
-                if np.all((np.array(boxes[j]) >= np.array(boxes[i])) == check_array):
-                    try:
-                        keep.remove(j)
-                    except ValueError:
-                        continue
+        if len(boxes) == 0:
+            return []
+        b = np.asarray(boxes)
+        # contained[i, j] is True if box j is completely contained in box i
+        contained = (b[None, :, 0] >= b[:, None, 0]) \
+                  & (b[None, :, 1] >= b[:, None, 1]) \
+                  & (b[None, :, 2] <  b[:, None, 2]) \
+                  & (b[None, :, 3] <  b[:, None, 3])
+        # Same sequence as the original implementation: boxes are removed while iterating over keep,
+        # so that the box following a removed box is not used as container
+        keep = list(range(0, len(b)))
+        kept = set(keep)
+        it = 0
+        while it < len(keep):
+            i = keep[it]
+            it += 1
+            for j in np.flatnonzero(contained[i]):
+                if j in kept:
+                    keep.remove(j)
+                    kept.discard(j)
         return keep
 
 class MotionDetectFrameDiff(MotionDetectAlgoIB):
@@ -468,12 +589,13 @@ class MotionDetectFrameDiff(MotionDetectAlgoIB):
     def nms_threshold(self, value):
         self._nms_threshold = value
 
-    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list):
+    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list, frameRaw=None):
         """ Use frame differencing method to detect motion
         
             Inputs:
-                frame2 : frame at t+1
-                frame1 : frame at t
+                frame2  : grayscale frame at t+1
+                frame1  : grayscale frame at t
+                frameRaw: live view buffer of frame2 (used for colour output only)
             Returns:
                 motion : True/False if motion has been detected (#bboxes > 0)
                 trigger: Dict describing trigger
@@ -486,33 +608,25 @@ class MotionDetectFrameDiff(MotionDetectAlgoIB):
         triggerParams["cam"] = camInfo
         roiDetected = 0
 
-        self.frame2 = copy.copy(frame2)
-        self.frame1 = copy.copy(frame1)
-
-        self.frame2o = frame2
+        self.frame2 = None
+        self.frame2o = frame2 if frameRaw is None else frameRaw
+        self._frameRows = frame2.shape[0]
         self.rois = rois
         self.ronis = ronis
 
+        self.frame2g = self._toAnalysis(self._maskRonis(frame2, ronis))
+        self.frame1g = self._toAnalysis(self._maskRonis(frame1, ronis))
+
         if self.test == True:
-            self.testFrame1 = self._frameToStream(self.frame2)
-            self.testFrame2 = copy.copy(self.frame2)[ :, :, 0]
-            self.testFrame3 = copy.copy(self.frame2)[ :, :, 0]
+            self.testFrame1 = self._frameToStream(frame2)
+            self.testFrame2 = copy.copy(self.frame2g)
+            self.testFrame3 = copy.copy(self.frame2g)
+            self._colorFrame()
             #logger.debug("Thread %s: MotionDetectFrameDiff.detectMotion - staged frame_gray", get_ident())
 
-        for roni in ronis:
-            x = roni[0]
-            y = roni[1]
-            w = roni[2]
-            h = roni[3]
-            self.frame2[y:y+h, x:x+w] = (255,0,0)
-            self.frame1[y:y+h, x:x+w] = (255,0,0)
-
-        self.frame2g = cv2.cvtColor(self.frame2, cv2.COLOR_RGB2GRAY)
-        self.frame1g = cv2.cvtColor(self.frame1, cv2.COLOR_RGB2GRAY)
-
         if len(rois) == 0:
             self.currentRoI = None
-            self.detections = self._get_detections(self.frame1g, self.frame2g, bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold)
+            self.detections = self._get_detections(self.frame1g, self.frame2g, bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold)
             #logger.debug("Thread %s: MotionDetectFrameDiff.detectMotion - got detections: %s", get_ident(), self.detections)
             if self.test == True:
                 if not self.detections is None:
@@ -530,14 +644,13 @@ class MotionDetectFrameDiff(MotionDetectAlgoIB):
             idx = 0
             for roi in rois:
                 idx += 1
-                self.currentRoI = roi
+                self.currentRoI = self._scaleRect(roi)
+                (xa, ya, wa, ha) = self.currentRoI
                 x = roi[0]
                 y = roi[1]
                 w = roi[2]
                 h = roi[3]
-                self.frame2g = cv2.cvtColor(self.frame2[y:y+h, x:x+w], cv2.COLOR_RGB2GRAY)
-                self.frame1g = cv2.cvtColor(self.frame1[y:y+h, x:x+w], cv2.COLOR_RGB2GRAY)
-                self.detections = self._get_detections(self.frame1g, self.frame2g, bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold)
+                self.detections = self._get_detections(self.frame1g[ya:ya+ha, xa:xa+wa], self.frame2g[ya:ya+ha, xa:xa+wa], bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold)
                 #logger.debug("Thread %s: MotionDetectFrameDiff.detectMotion - got detections: %s", get_ident(), self.detections)
                 if self.test == True:
                     color = (0,255,0)
@@ -661,12 +774,13 @@ class MotionDetectOpticalFlow(MotionDetectAlgoIB):
         self.nms_threshold = 0.001
         self.motion_threshold = 1
 
-    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list):
-        """ Use frame differencing method to detect motion
+    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list, frameRaw=None):
+        """ Use optical flow method to detect motion
         
             Inputs:
-                frame2 : frame at t+1
-                frame1 : frame at t
+                frame2  : grayscale frame at t+1
+                frame1  : grayscale frame at t
+                frameRaw: live view buffer of frame2 (used for colour output only)
             Returns:
                 motion : True/False if motion has been detected
                 trigger: Dict describing trigger
@@ -679,37 +793,25 @@ class MotionDetectOpticalFlow(MotionDetectAlgoIB):
         triggerParams["cam"] = camInfo
         roiDetected = 0
 
-        self.frame2 = copy.copy(frame2)
-        self.frame1 = copy.copy(frame1)
-
-        self.frame2o = frame2
+        self.frame2 = None
+        self.frame2o = frame2 if frameRaw is None else frameRaw
+        self._frameRows = frame2.shape[0]
         self.rois = rois
         self.ronis = ronis
 
-        if self.test == True and len(ronis) > 0:
-            self.testFrame1 = copy.copy(self.frame2)
-            self.testFrame2 = copy.copy(self.frame2)
-            self.testFrame3 = copy.copy(self.frame2)
-            self.testFrame3 = self.testFrame3[:, :, 0]
-            self.testFrame4 = copy.copy(self.frame2)
+        self.frame2g = self._toAnalysis(self._maskRonis(frame2, ronis))
+        self.frame1g = self._toAnalysis(self._maskRonis(frame1, ronis))
 
         if self.test == True:
-            # convert to grayscale
-            self.testFrame1 = cv2.cvtColor(self.frame2, cv2.COLOR_RGB2GRAY)
+            self._colorFrame()
+            self.testFrame2 = cv2.resize(self.frame2, (self.frame2g.shape[1], self.frame2g.shape[0]), interpolation=cv2.INTER_AREA)
+            self.testFrame3 = copy.copy(self.frame2g)
             # blurr image
-            self.testFrame1 = cv2.GaussianBlur(self.testFrame1, dst=None, ksize=(3,3), sigmaX=5)
-
-        for roni in ronis:
-            x = roni[0]
-            y = roni[1]
-            w = roni[2]
-            h = roni[3]
-            self.frame2[y:y+h, x:x+w] = (255,0,0)
-            self.frame1[y:y+h, x:x+w] = (255,0,0)
+            self.testFrame1 = cv2.GaussianBlur(self.frame2g, dst=None, ksize=(3,3), sigmaX=5)
 
         if len(rois) == 0:
             self.currentRoI = None
-            self.detections = self._get_detections(self.frame1, self.frame2, motion_thresh=self.motion_threshold, bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold)
+            self.detections = self._get_detections(self.frame1g, self.frame2g, motion_thresh=self.motion_threshold / self.analysis_scale, bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold)
             #logger.debug("Thread %s: MotionDetectOpticalFlow.detectMotion - got detections: %s", get_ident(), self.detections)
             if self.test == True:
                 if not self.detections is None:
@@ -729,13 +831,14 @@ class MotionDetectOpticalFlow(MotionDetectAlgoIB):
             idx = 0
             for roi in rois:
                 idx += 1
-                self.currentRoI = roi
+                self.currentRoI = self._scaleRect(roi)
+                (xa, ya, wa, ha) = self.currentRoI
                 x = roi[0]
                 y = roi[1]
                 w = roi[2]
                 h = roi[3]
                 #logger.debug("Thread %s: MotionDetectOpticalFlow.detectMotion - checking ROI: %s", get_ident(), self.currentRoI)
-                self.detections = self._get_detections(self.frame1[y:y+h, x:x+w], self.frame2[y:y+h, x:x+w], motion_thresh=self.motion_threshold, bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold)
+                self.detections = self._get_detections(self.frame1g[ya:ya+ha, xa:xa+wa], self.frame2g[ya:ya+ha, xa:xa+wa], motion_thresh=self.motion_threshold / self.analysis_scale, bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold)
                 #logger.debug("Thread %s: MotionDetectOpticalFlow.detectMotion - got detections: %s", get_ident(), self.detections)
                 if self.test == True:
                     color = (0,255,0)
@@ -823,15 +926,9 @@ class MotionDetectOpticalFlow(MotionDetectAlgoIB):
     
     def _compute_flow(self, frame1, frame2):
         #logger.debug("Thread %s: MotionDetectOpticalFlow._compute_flow", get_ident())
-        # convert to grayscale
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_RGB2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_RGB2GRAY)
-        self.frame1g = gray1
-        self.frame2g = gray2
-
         # blurr image
-        gray1 = cv2.GaussianBlur(gray1, dst=None, ksize=(3,3), sigmaX=5)
-        gray2 = cv2.GaussianBlur(gray2, dst=None, ksize=(3,3), sigmaX=5)
+        gray1 = cv2.GaussianBlur(frame1, dst=None, ksize=(3,3), sigmaX=5)
+        gray2 = cv2.GaussianBlur(frame2, dst=None, ksize=(3,3), sigmaX=5)
 
         flow = cv2.calcOpticalFlowFarneback(gray1, gray2, None,
                                             pyr_scale=0.75,
@@ -908,6 +1005,8 @@ class MotionDetectOpticalFlow(MotionDetectAlgoIB):
 class MotionDetectBgSubtract(MotionDetectAlgoIB):
     """ Motion detection by Background Subtraction
     """
+    # Keys of the saved background file describing the layout for which the images are valid
+    LAYOUT_KEYS = ["layout_frame", "layout_rois", "layout_ronis"]
     def __init__(self) -> None:
         super().__init__()
         
@@ -925,6 +1024,9 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         self._backSubModel = "MOG2"
         self._backSub = cv2.createBackgroundSubtractorMOG2(varThreshold=16, detectShadows=True)
         self._backSub.setShadowThreshold(0.5)
+        self.learning_rate = -1
+        self.warmup_frames = 10
+        self.snapshot_interval = 300
 
         # For ROIs, each ROI will have its own background model
         cfg = CameraCfg()
@@ -935,6 +1037,16 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
                 backSub = cv2.createBackgroundSubtractorMOG2(varThreshold=16, detectShadows=True)
                 backSub.setShadowThreshold(0.5)
                 self._roiBackSubs.append(backSub)
+
+        # Warm-up and persistence of background models
+        # Model keys are "full" for the entire frame and "roi<n>" for ROI n
+        self._warmingUp = True
+        self._modelFrames = {}
+        self._restoredKeys = set()
+        self._restored = {}
+        self._restoredLayout = None
+        self._backgroundPath = None
+        self._lastSnapshot = None
     
     @property
     def backSubModel(self):
@@ -973,13 +1085,17 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
                     backSub.setShadowThreshold(0.5)
                     self._roiBackSubs.append(backSub)
         self._backSubModel = value
+        self._warmingUp = True
+        self._modelFrames = {}
+        self._restoredKeys = set()
 
-    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list):
-        """ Use frame differencing method to detect motion
+    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list, frameRaw=None):
+        """ Use background subtraction method to detect motion
         
             Inputs:
-                frame2 : frame at t+1
-                frame1 : frame at t
+                frame2  : grayscale frame at t+1
+                frame1  : grayscale frame at t
+                frameRaw: live view buffer of frame2 (used for colour output only)
             Returns:
                 motion : True/False if motion has been detected
                 trigger: Dict describing trigger
@@ -992,31 +1108,27 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         triggerParams["cam"] = camInfo
         roiDetected = 0
 
-        self.frame2 = copy.copy(frame2)
-        self.frame1 = copy.copy(frame1)
-
-        self.frame2o = frame2
+        self.frame2 = None
+        self.frame2o = frame2 if frameRaw is None else frameRaw
+        self._frameRows = frame2.shape[0]
         self.rois = rois
         self.ronis = ronis
 
+        self.frame2g = self._toAnalysis(self._maskRonis(frame2, ronis))
+        self._warmingUp = False
+        if self._restoredLayout is not None:
+            self._checkRestoredLayout()
+
         if self.test == True:
-            self.testFrame1 = self._frameToStream(self.frame2)
-            self.testFrame2 = copy.copy(self.frame2)
-            self.testFrame3 = copy.copy(self.frame2)[ :, :, 0]
+            self.testFrame1 = self._frameToStream(self._colorFrame())
+            self.testFrame2 = copy.copy(self.frame2g)
+            self.testFrame3 = copy.copy(self.frame2g)
             #logger.debug("Thread %s: MotionDetectBgSubtract.detectMotion - staged frame_gray", get_ident())
 
-        for roni in ronis:
-            x = roni[0]
-            y = roni[1]
-            w = roni[2]
-            h = roni[3]
-            self.frame2[y:y+h, x:x+w] = (255,0,0)
-            self.frame1[y:y+h, x:x+w] = (255,0,0)
-
         if len(rois) == 0:
             self.currentRoI = None
             kernel=np.array((9,9), dtype=np.uint8)
-            self.detections = self._get_detections(self._backSub, self.frame2, bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold, kernel=kernel)
+            self.detections = self._get_detections(self._backSub, self.frame2g, bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold, kernel=kernel)
             #logger.debug("Thread %s: MotionDetectBgSubtract.detectMotion - got detections: %s", get_ident(), self.detections)
             if self.test == True:
                 if not self.detections is None:
@@ -1027,7 +1139,7 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
             else:
                 if not self.detections is None:
                     if len(self.detections) > 0:
-                        triggerParams["Model"] = self.backSubMod
+                        triggerParams["Model"] = self.backSubModel
                         triggerParams["BBox_thr"] = self.bbox_threshold
                         triggerParams["IOU_thr"] = self.nms_threshold
                         motion = True
@@ -1035,14 +1147,15 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
             idx = 0
             for roi in rois:
                 idx += 1
-                self.currentRoI = roi
+                self.currentRoI = self._scaleRect(roi)
+                (xa, ya, wa, ha) = self.currentRoI
                 self.currentRoiIdx = idx
                 x = roi[0]
                 y = roi[1]
                 w = roi[2]
                 h = roi[3]
                 kernel=np.array((9,9), dtype=np.uint8)
-                self.detections = self._get_detections(self._backSub, self.frame2[y:y+h, x:x+w], bbox_thresh=self.bbox_threshold, nms_thresh=self.nms_threshold, kernel=kernel)
+                self.detections = self._get_detections(self._backSub, self.frame2g[ya:ya+ha, xa:xa+wa], bbox_thresh=self.bbox_threshold / self.analysis_scale**2, nms_thresh=self.nms_threshold, kernel=kernel)
                 #logger.debug("Thread %s: MotionDetectBgSubtract.detectMotion - got detections: %s", get_ident(), self.detections)
                 if self.test == True:
                     color = (0,255,0)
@@ -1056,7 +1169,7 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
                     if not self.detections is None:
                         if len(self.detections) > 0:
                             triggerParams["roi"] = idx
-                            triggerParams["Model"] = self.backSubMod
+                            triggerParams["Model"] = self.backSubModel
                             triggerParams["BBox_thr"] = self.bbox_threshold
                             triggerParams["IOU_thr"] = self.nms_threshold
                             motion = True
@@ -1068,6 +1181,14 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
                 self.testFrame3 = self._frameToStream(self.testFrame3)
                 self.testFrame4 = self._frameToStream(self.frame2)
 
+        if self._warmingUp:
+            # A background model is still warming up
+            motion = False
+            roiDetected = 0
+        elif self._backgroundPath is not None \
+        and (self._lastSnapshot is None or time.monotonic() - self._lastSnapshot >= self.snapshot_interval):
+            self.saveBackground(self._backgroundPath)
+
         trigger = {"trigger":"Motion Detection", "triggertype":"BG Subtraction", "triggerparam":triggerParams}    
         #logger.debug("Thread %s: MotionDetectBgSubtract.detectMotion - motion:%s", get_ident(), motion)
         return (motion, trigger, roiDetected)
@@ -1076,7 +1197,7 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         """ Main function to get detections via Frame Differencing
             Inputs:
                 backSub - Background Subtraction Model
-                frame - Current BGR Frame
+                frame - Current grayscale Frame
                 bbox_thresh - Minimum threshold area for declaring a bounding box
                 nms_thresh - IOU threshold for computing Non-Maximal Supression
                 kernel - kernel for morphological operations on motion mask
@@ -1087,10 +1208,11 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         #logger.debug("Thread %s: MotionDetectBgSubtract._get_detections - backSub %s", get_ident(), backSub)
         # Update Background Model and get foreground mask
         if self.currentRoI is None:
-            fg_mask = backSub.apply(frame)
+            key = "full"
         else:
+            key = "roi" + str(self.currentRoiIdx)
             backSub = self._roiBackSubs[self.currentRoiIdx - 1]
-            fg_mask = backSub.apply(frame)
+        fg_mask = backSub.apply(frame, learningRate=self._learningRate(key, backSub, frame))
 
         if self.test == True:
             if self.currentRoI is None:
@@ -1128,6 +1250,127 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         # perform Non-Maximal Supression on initial detections
         return self._non_max_suppression(bboxes, scores, nms_thresh)
     
+    def _learningRate(self, key: str, backSub, frame) -> float:
+        """ Return the learning rate for the next update of a background model
+
+            A restored background is fed into a new model first.
+            The model is then considered as warmed up and uses the configured learning rate
+            or, for the automatic rate, the rate of a model with full history.
+            Without restored background, the model averages all frames seen so far (rate 1/n)
+            during warm-up, so that it adapts within a few frames, and motion is not reported.
+            Afterwards the configured learning rate is used (-1: automatic).
+        """
+        n = self._modelFrames.get(key, 0)
+        if n == 0:
+            bg = self._restored.pop(key, None)
+            if bg is not None:
+                if bg.shape == frame.shape:
+                    backSub.apply(bg, learningRate=1.0)
+                    # Skip warm-up, so that the restored model is not diluted by the first live frames
+                    n = self.warmup_frames
+                    self._restoredKeys.add(key)
+                    logger.debug("Thread %s: MotionDetectBgSubtract._learningRate - restored background for %s", get_ident(), key)
+                else:
+                    logger.debug("Thread %s: MotionDetectBgSubtract._learningRate - restored background for %s ignored. Shape %s != %s", get_ident(), key, bg.shape, frame.shape)
+        n += 1
+        self._modelFrames[key] = n
+        if n <= self.warmup_frames:
+            self._warmingUp = True
+            rate = 1.0 / n
+            if self.learning_rate > rate:
+                rate = self.learning_rate
+            return rate
+        if self.learning_rate < 0 \
+        and key in self._restoredKeys:
+            # The automatic rate of OpenCV restarts with 1/2 for a model with few frames
+            return 1.0 / backSub.getHistory()
+        return self.learning_rate
+
+    def saveBackground(self, fp: str) -> bool:
+        """ Save the current background images of all used models to file fp (.npz)
+        """
+        self._backgroundPath = fp
+        self._lastSnapshot = time.monotonic()
+        images = {}
+        for key in self._modelFrames:
+            if key == "full":
+                bg = self._backSub.getBackgroundImage()
+            else:
+                idx = int(key[3:])
+                if idx > len(self._roiBackSubs):
+                    continue
+                bg = self._roiBackSubs[idx - 1].getBackgroundImage()
+            if bg is not None:
+                images[key] = bg
+        if len(images) == 0:
+            return False
+        images.update(self._layout())
+        try:
+            fpTmp = fp + ".tmp"
+            with open(fpTmp, "wb") as f:
+                np.savez_compressed(f, **images)
+            os.replace(fpTmp, fp)
+            logger.debug("Thread %s: MotionDetectBgSubtract.saveBackground - saved %s to %s", get_ident(), list(images.keys()), fp)
+            return True
+        except Exception as e:
+            logger.error("Thread %s: MotionDetectBgSubtract.saveBackground - error saving background: %s", get_ident(), e)
+            return False
+
+    def restoreBackground(self, fp: str) -> bool:
+        """ Restore background images from file fp (.npz)
+
+            The images are fed into the models with the first frame
+            if frame size, ROIs and RONIs are the same as when they were saved.
+            Subsequent snapshots are written to the same file.
+        """
+        self._backgroundPath = fp
+        self._lastSnapshot = time.monotonic()
+        self._warmingUp = True
+        self._modelFrames = {}
+        self._restoredKeys = set()
+        self._restored = {}
+        self._restoredLayout = None
+        if not os.path.exists(fp):
+            return False
+        try:
+            with np.load(fp) as data:
+                for key in data.files:
+                    self._restored[key] = data[key]
+            self._restoredLayout = {}
+            for key in MotionDetectBgSubtract.LAYOUT_KEYS:
+                self._restoredLayout[key] = self._restored.pop(key, None)
+            logger.debug("Thread %s: MotionDetectBgSubtract.restoreBackground - restored %s from %s", get_ident(), list(self._restored.keys()), fp)
+            return True
+        except Exception as e:
+            logger.error("Thread %s: MotionDetectBgSubtract.restoreBackground - error restoring background: %s", get_ident(), e)
+            return False
+
+    def _layout(self) -> dict:
+        """ Return the analysis frame size, ROIs and RONIs of the current frame
+
+            The background images are only valid for this layout.
+        """
+        return {
+            "layout_frame": np.array(self.frame2g.shape, dtype=np.int32),
+            "layout_rois": np.array(self.rois, dtype=np.int32).reshape(-1, 4),
+            "layout_ronis": np.array(self.ronis, dtype=np.int32).reshape(-1, 4),
+        }
+
+    def _checkRestoredLayout(self) -> bool:
+        """ Discard restored background images if they were saved for a different layout
+
+            The models will then warm up as without restored background.
+        """
+        saved = self._restoredLayout
+        self._restoredLayout = None
+        for key, value in self._layout().items():
+            if saved.get(key) is None \
+            or not np.array_equal(saved[key], value):
+                logger.debug("Thread %s: MotionDetectBgSubtract._checkRestoredLayout - restored background discarded. %s has changed", get_ident(), key)
+                self._restored = {}
+                return False
+        return True
+
     def _get_motion_mask(self, fg_mask, min_thresh=0, kernel=np.array((9,9), dtype=np.uint8)):
         """ Obtains image mask
             Inputs: 
@@ -1144,4 +1387,233 @@ class MotionDetectBgSubtract(MotionDetectAlgoIB):
         motion_mask = cv2.morphologyEx(motion_mask, cv2.MORPH_CLOSE, kernel, iterations=1)
 
         return motion_mask    
-    
\ No newline at end of file
+    
+class MotionDetectSparseFlow(MotionDetectAlgoIB):
+    """ Motion detection by sparse Optical Flow
+
+        Corner features are tracked with pyramidal Lucas-Kanade.
+        Tracks moving faster than the motion threshold are grouped into bounding boxes.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        
+        # Algorithn reference and testing
+        self.algoReferenceTit = "OpenCV - Optical Flow (Lucas-Kanade)"
+        self.algoReferenceURL = "https://docs.opencv.org/4.x/d4/dee/tutorial_optical_flow.html"
+        self.testFrame1Title = "Gray Scale Video"
+        self.testFrame2Title = "Feature Tracks"
+        self.testFrame3Title = "Motion Mask"
+        self.testFrame4Title = "Bounding Boxes after Non-Maximal Suppression"
+
+        # Algorithm parameters
+        self.bbox_threshold = 400
+        self.nms_threshold = 0.001
+        self.motion_threshold = 1
+        self.max_corners = 200
+        self.reseed_interval = 30
+        self.track_radius = 8
+
+        # Tracking state
+        self._points = None
+        self._seedCount = 0
+        self._frameCount = 0
+        self._featureMask = None
+        self._featureMaskKey = None
+
+    def detectMotion(self, frame2, frame1, camInfo: str, rois: list, ronis: list, frameRaw=None):
+        """ Use sparse optical flow to detect motion
+        
+            Inputs:
+                frame2  : grayscale frame at t+1
+                frame1  : grayscale frame at t
+                frameRaw: live view buffer of frame2 (used for colour output only)
+            Returns:
+                motion : True/False if motion has been detected
+                trigger: Dict describing trigger
+        """
+        #logger.debug("Thread %s: MotionDetectSparseFlow.detectMotion", get_ident())
+        motion = False
+        roiDetected = 0
+
+        triggerParams = {}
+        triggerParams["cam"] = camInfo
+        roiDetected = 0
+
+        self.frame2 = None
+        self.frame2o = frame2 if frameRaw is None else frameRaw
+        self._frameRows = frame2.shape[0]
+        self.rois = rois
+        self.ronis = ronis
+
+        self.frame2g = self._toAnalysis(frame2)
+        self.frame1g = self._toAnalysis(frame1)
+        s = self.analysis_scale
+
+        # Track features from t to t+1
+        (p0, p1) = self._track(self.frame1g, self.frame2g, ronis)
+        d = p1 - p0
+        speed = np.hypot(d[:, 0], d[:, 1])
+        moving = speed > self.motion_threshold / s
+        motion_mask = self._get_track_mask(self.frame2g.shape, p1[moving])
+
+        if self.test == True:
+            self._colorFrame()
+            self.testFrame1 = self._frameToStream(self.frame2g)
+            tracks = cv2.cvtColor(self.frame2g, cv2.COLOR_GRAY2BGR)
+            for (a, b), (c, e), m in zip(p0, p1, moving):
+                color = (0,0,255) if m else (0,255,0)
+                cv2.line(tracks, (int(a), int(b)), (int(c), int(e)), color, 1)
+                cv2.circle(tracks, (int(c), int(e)), 2, color, -1)
+            self.testFrame2 = self._frameToStream(tracks)
+            self.testFrame3 = self._frameToStream(motion_mask)
+
+        if len(rois) == 0:
+            self.currentRoI = None
+            self.detections = self._get_detections(motion_mask, bbox_thresh=self.bbox_threshold / s**2, nms_thresh=self.nms_threshold)
+            if self.test == True:
+                if not self.detections is None:
+                    if len(self.detections) > 0:
+                        self._draw_bboxes()
+                self.testFrame4 = self._frameToStream(self.frame2)
+            else:
+                if not self.detections is None:
+                    if len(self.detections) > 0:
+                        triggerParams.update(self._get_track_params(d[moving], s))
+                        triggerParams["Motion_thr"] = self.motion_threshold
+                        triggerParams["BBox_thr"] = self.bbox_threshold
+                        triggerParams["IOU_thr"] = self.nms_threshold
+                        motion = True
+        else:
+            idx = 0
+            for roi in rois:
+                idx += 1
+                self.currentRoI = self._scaleRect(roi)
+                (xa, ya, wa, ha) = self.currentRoI
+                x = roi[0]
+                y = roi[1]
+                w = roi[2]
+                h = roi[3]
+                self.detections = self._get_detections(motion_mask[ya:ya+ha, xa:xa+wa], bbox_thresh=self.bbox_threshold / s**2, nms_thresh=self.nms_threshold)
+                if self.test == True:
+                    color = (0,255,0)
+                    if not self.detections is None:
+                        if len(self.detections) > 0:
+                            color = (0,0,255)
+                            self._draw_bboxes()
+                    cv2.rectangle(self.frame2, (x,y), (x+w,y+h), color, 2)
+                else:
+                    if not self.detections is None:
+                        if len(self.detections) > 0:
+                            inRoi = moving \
+                                  & (p1[:, 0] >= xa) & (p1[:, 0] < xa + wa) \
+                                  & (p1[:, 1] >= ya) & (p1[:, 1] < ya + ha)
+                            triggerParams["roi"] = idx
+                            triggerParams.update(self._get_track_params(d[inRoi], s))
+                            triggerParams["Motion_thr"] = self.motion_threshold
+                            triggerParams["BBox_thr"] = self.bbox_threshold
+                            triggerParams["IOU_thr"] = self.nms_threshold
+                            motion = True
+                            roiDetected = idx
+                            break
+            if self.test == True:
+                self.testFrame4 = self._frameToStream(self.frame2)
+
+        trigger = {"trigger":"Motion Detection", "triggertype":"Sparse Optical Flow", "triggerparam":triggerParams}
+        #logger.debug("Thread %s: MotionDetectSparseFlow.detectMotion - motion:%s", get_ident(), motion)
+        return (motion, trigger, roiDetected)
+
+    def _get_feature_mask(self, shape: tuple, ronis: list):
+        """ Return the mask for feature detection with RONIs excluded (in analysis coordinates)
+        """
+        if len(ronis) == 0:
+            return None
+        key = (shape, tuple(ronis), self.analysis_scale)
+        if self._featureMaskKey != key:
+            mask = np.full(shape, 255, dtype=np.uint8)
+            for roni in ronis:
+                (x, y, w, h) = self._scaleRect(roni)
+                mask[y:y+h, x:x+w] = 0
+            self._featureMask = mask
+            self._featureMaskKey = key
+        return self._featureMask
+
+    def _track(self, frame1, frame2, ronis: list):
+        """ Track features from frame1 to frame2
+
+            Features are re-seeded periodically or when half of the features found at the last seeding have been lost.
+            Inputs:
+                frame1 - Grayscale frame at time t
+                frame2 - Grayscale frame at time t + 1
+                ronis - Regions of No Interest in frame coordinates
+            Outputs:
+                p0, p1 - arrays (N, 2) with positions of successfully tracked features at t and t + 1
+        """
+        self._frameCount += 1
+        mask = self._get_feature_mask(frame1.shape, ronis)
+        if self._points is None \
+        or len(self._points) < self._seedCount / 2 \
+        or self._frameCount % self.reseed_interval == 0 \
+        or self._points.size > 0 and (self._points[:, 0, 0].max() >= frame1.shape[1] or self._points[:, 0, 1].max() >= frame1.shape[0]):
+            self._points = cv2.goodFeaturesToTrack(frame1, maxCorners=self.max_corners, qualityLevel=0.01, minDistance=7, mask=mask, blockSize=7)
+            if self._points is None:
+                self._points = np.empty((0, 1, 2), dtype=np.float32)
+            self._seedCount = len(self._points)
+        if len(self._points) == 0:
+            empty = np.empty((0, 2), dtype=np.float32)
+            return (empty, empty)
+
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(frame1, frame2, self._points, None,
+                                             winSize=(15, 15),
+                                             maxLevel=2,
+                                             criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        good = st.reshape(-1) == 1
+        p0 = self._points.reshape(-1, 2)[good]
+        p1 = p1.reshape(-1, 2)[good]
+        self._points = p1.reshape(-1, 1, 2)
+        return (p0, p1)
+
+    def _get_track_mask(self, shape: tuple, points):
+        """ Obtains a motion mask by drawing moving features and closing gaps between neighbours
+        """
+        mask = np.zeros(shape, dtype=np.uint8)
+        r = self.track_radius
+        for (x, y) in points:
+            cv2.circle(mask, (int(x), int(y)), r, 255, -1)
+        if len(points) > 0:
+            kernel = np.ones((2 * r + 1, 2 * r + 1), dtype=np.uint8)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
+        return mask
+
+    def _get_detections(self, mask, bbox_thresh=400, nms_thresh=1e-3):
+        """ Main function to get detections from the motion mask of moving tracks
+            Inputs:
+                mask - motion mask with moving tracks
+                bbox_thresh - Minimum threshold area for declaring a bounding box 
+                nms_thresh - IOU threshold for computing Non-Maximal Supression
+            Outputs:
+                detections - list with bounding box locations of all detections
+                    bounding boxes are in the form of: (xmin, ymin, xmax, ymax)
+            """
+        detections = self._get_contour_detections(mask, bbox_thresh)
+        if len(detections) == 0:
+            return None
+
+        # separate bboxes and scores
+        bboxes = detections[:, :4]
+        scores = detections[:, -1]
+
+        # perform Non-Maximal Supression on initial detections
+        return self._non_max_suppression(bboxes, scores, nms_thresh)
+
+    def _get_track_params(self, d, scale: int) -> dict:
+        """ Return direction and speed of moving tracks for the trigger parameters
+
+            direction: direction of the mean displacement in degrees (0=right, 90=up, 180=left, 270=down)
+            speed    : mean speed in pixels of the live view frame per analyzed frame
+        """
+        params = {"Tracks": int(len(d))}
+        if len(d) > 0:
+            mean = d.mean(axis=0)
+            params["Direction"] = int(round(np.degrees(np.arctan2(-mean[1], mean[0])))) % 360
+            params["Speed"] = round(float(np.hypot(d[:, 0], d[:, 1]).mean()) * scale, 1)
+        return params
@@ -1,13 +1,16 @@
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, FrameRing
+from raspiCamSrv.metrics import Metrics
 from raspiCamSrv.camCfg import CameraCfg
+from raspiCamSrv.motionWorker import MotionWorker
 import numpy as np
 from _thread import get_ident, allocate_lock
 import threading
 import time
+import os
 from datetime import datetime
 from datetime import timedelta
 import logging
-from raspiCamSrv.dbx import get_dbx
+from raspiCamSrv.eventWriter import EventWriter
 import smtplib
 from email.message import EmailMessage
 import mimetypes
@@ -77,7 +80,6 @@ class MotionDetector():
     """
     logger.debug("Thread %s: MotionDetector - setting class variables", get_ident())
     _instance = None
-    db = None
     mThread = None
     mThreadStop = False
     camInfo = ""
@@ -99,7 +101,12 @@ class MotionDetector():
     notifyBuffer = []
     notifyBufferLock = allocate_lock()      # lock for making access to notifyBuffer thread-safe
     mdAlgo = None
+    worker = None
+    idleStep = 4                            # subsampling of live view frames in idle mode
+    msdMask = None
+    msdMaskKey = None
     event = MotionEvent()
+    testRings = [FrameRing("test_frame1_feed"), FrameRing("test_frame2_feed"), FrameRing("test_frame3_feed"), FrameRing("test_frame4_feed")]
 
     # Callbacks
     when_motion_detected = None
@@ -111,13 +118,15 @@ class MotionDetector():
             cls._instance = super(MotionDetector, cls).__new__(cls)
             cfg = CameraCfg()
             tc = cfg.triggerConfig
-            if tc.motionDetectAlgo in range(2, 5):
+            if tc.motionDetectAlgo in range(2, 6):
                 if CameraCfg().serverConfig.supportsExtMotionDetection == True:
                     import raspiCamSrv.motionAlgoIB as mda
                     if tc.motionDetectAlgo == 2:
                         cls.mdAlgo = mda.MotionDetectFrameDiff()
                     elif tc.motionDetectAlgo == 3:
                         cls.mdAlgo = mda.MotionDetectOpticalFlow()
+                    elif tc.motionDetectAlgo == 5:
+                        cls.mdAlgo = mda.MotionDetectSparseFlow()
                     else:
                         cls.mdAlgo = mda.MotionDetectBgSubtract()
                 else:
@@ -144,13 +153,15 @@ class MotionDetector():
         logger.debug("Thread %s: MotionDetector.setAlgorithm - set algorithm to %s", get_ident(), tc.motionDetectAlgo)
         if tc.motionDetectAlgo == 1:
             ret = True
-        if tc.motionDetectAlgo in range(2, 5):
+        if tc.motionDetectAlgo in range(2, 6):
             if CameraCfg().serverConfig.supportsExtMotionDetection == True:
                 import raspiCamSrv.motionAlgoIB as mda
                 if tc.motionDetectAlgo == 2:
                     cls.mdAlgo = mda.MotionDetectFrameDiff()
                 elif tc.motionDetectAlgo == 3:
                     cls.mdAlgo = mda.MotionDetectOpticalFlow()
+                elif tc.motionDetectAlgo == 5:
+                    cls.mdAlgo = mda.MotionDetectSparseFlow()
                 else:
                     cls.mdAlgo = mda.MotionDetectBgSubtract()
                     cls.mdAlgo.backSubModel = tc.backSubModel
@@ -200,6 +211,8 @@ class MotionDetector():
 
         cls.rois = []
         cls.ronis = []
+        cls.msdMask = None
+        cls.msdMaskKey = None
 
         cfg = CameraCfg()
         sc = cfg.serverConfig
@@ -294,9 +307,12 @@ class MotionDetector():
                 cls.ronis.append(roni)
 
     @classmethod
-    def _motionDetected(cls, fCur, fPrv) -> tuple:
+    def _motionDetected(cls, fCur, fPrv, fRaw=None) -> tuple:
         """ Analyze input frames to detect motion
-        
+
+            fCur : grayscale frame at t+1
+            fPrv : grayscale frame at t
+            fRaw : live view buffer of fCur, used by algorithms for colour output
         """
         tc = CameraCfg().triggerConfig
         # logger.debug("Thread %s: MotionDetector._motionDetected - algo: %s", get_ident(), tc.motionDetectAlgo)
@@ -304,62 +320,174 @@ class MotionDetector():
         trigger = {}
 
         if tc.motionDetectAlgo == 1:
+            mt = Metrics.enabled and time.perf_counter()
             (motion, trigger, roiDetected) = cls._motionAlgo_MeanSquare(fCur, fPrv, cls.camInfo, cls.rois, cls.ronis)
+            if mt:
+                Metrics.record("motion_detect_MeanSquare", time.perf_counter() - mt)
             cls.roiDetected = roiDetected
         if tc.motionDetectAlgo > 1:
-            (motion, trigger, roiDetected) = cls.mdAlgo.detectMotion(fCur, fPrv, cls.camInfo, cls.rois, cls.ronis)
+            mt = Metrics.enabled and time.perf_counter()
+            (motion, trigger, roiDetected) = cls.mdAlgo.detectMotion(fCur, fPrv, cls.camInfo, cls.rois, cls.ronis, fRaw)
+            if mt:
+                Metrics.record("motion_detect_" + type(cls.mdAlgo).__name__, time.perf_counter() - mt)
             cls.roiDetected = roiDetected
             cls.event.set()
+            if cls.mdAlgo.test == True \
+            and len(FrameRing.listeners) > 0:
+                cls._publishTestFrames()
 
         return (motion, trigger)
 
-    @staticmethod
-    def _motionAlgo_MeanSquare(fCur, fPrv, camInfo: str, rois: list, ronis: list) -> tuple:
-        """ Mean Square algorithm for motion detection
+    @classmethod
+    def _backgroundPath(cls) -> str:
+        """ Return the path of the saved background models for the active camera
+        """
+        sc = CameraCfg().serverConfig
+        if not sc.cfgPath:
+            return None
+        if sc.activeCameraIsUsb == True:
+            cam = os.path.basename(sc.activeCameraUsbDev)
+        else:
+            cam = str(sc.activeCamera)
+        return sc.cfgPath + "/motionBackground_" + cam + ".npz"
+
+    @classmethod
+    def _startWorker(cls, fRaw):
+        """ Start a worker process for the motion detection algorithm
         
+            fRaw : live view buffer which determines the size of the shared memory
+        """
+        cfg = CameraCfg()
+        tc = cfg.triggerConfig
+        (w, h) = cfg.liveViewConfig.stream_size
+        bgPath = cls._backgroundPath()
+        cls.worker = MotionWorker(fRaw, (h, w), Camera.camIsUsb, tc.motionDetectAlgo, cls.mdAlgo, tc.cameraSettings, bgPath)
+        logger.debug("Thread %s: MotionDetector._startWorker - worker started", get_ident())
+
+    @classmethod
+    def _stopWorker(cls):
+        """ Stop the worker process, if any
+        
+            The worker saves the background model before it terminates.
+        """
+        if not cls.worker is None:
+            cls.worker.stop()
+            cls.worker = None
+            logger.debug("Thread %s: MotionDetector._stopWorker - worker stopped", get_ident())
+
+    @classmethod
+    def _motionDetectedByWorker(cls, fRaw):
+        """ Analyze frames in the worker process
+        
+            fRaw : live view buffer of the current frame
+            
+            The result refers to the previous frame.
+            Returns (motion, trigger) or None if no result is available, yet.
+        """
+        if not cls.worker is None \
+        and not cls.worker.accepts(fRaw):
+            logger.debug("Thread %s: MotionDetector._motionDetectedByWorker - buffer changed. Restarting worker", get_ident())
+            cls._stopWorker()
+        if cls.worker is None:
+            cls._startWorker(fRaw)
+        mt = Metrics.enabled and time.perf_counter()
+        (res, resRaw) = cls.worker.process_frame(fRaw, cls.camInfo, cls.rois, cls.ronis)
+        if res is None:
+            return None
+        if mt:
+            Metrics.record("motion_detect_worker", time.perf_counter() - mt)
+        cls.mdAlgo.applyResult(res, resRaw, cls.rois, cls.ronis)
+        cls.roiDetected = res["roiDetected"]
+        cls.event.set()
+        if cls.mdAlgo.test == True \
+        and len(FrameRing.listeners) > 0:
+            cls._publishTestFrames()
+        return (res["motion"], res["trigger"])
+
+    @classmethod
+    def _publishTestFrames(cls):
+        """ Publish the current test frames to the test frame rings
+        
+        """
+        testFrames = (cls.mdAlgo.testFrame1, cls.mdAlgo.testFrame2, cls.mdAlgo.testFrame3, cls.mdAlgo.testFrame4)
+        for ring, frame in zip(cls.testRings, testFrames):
+            if isinstance(frame, bytes):
+                ring.publish(frame)
+
+    @classmethod
+    def _msdMask(cls, shape: tuple, ronis: list):
+        """ Return the mask (1.0 / 0.0) for Regions of No Interest for the given frame shape
+
+            The mask is computed once and cached until frame shape or RONIs change.
+        """
+        key = (shape, tuple(ronis))
+        if cls.msdMaskKey != key:
+            mask = np.ones(shape, dtype=np.float32)
+            for roni in ronis:
+                x = roni[0]
+                y = roni[1]
+                w = roni[2]
+                h = roni[3]
+                mask[y:y+h, x:x+w] = 0.0
+            cls.msdMask = mask
+            cls.msdMaskKey = key
+            logger.debug("Thread %s: MotionDetector._msdMask - new mask for shape %s with %s ronis", get_ident(), shape, len(ronis))
+        return cls.msdMask
+
+    @classmethod
+    def _motionAlgo_MeanSquare(cls, fCur, fPrv, camInfo: str, rois: list, ronis: list, threshold: float = None) -> tuple:
+        """ Mean Square algorithm for motion detection
+
+            The squared difference is computed once for the entire frame.
+            For ROIs, a summed-area table allows scoring each ROI with 4 lookups,
+            so that all ROIs are scored and reported.
+            Input frames are not modified.
+            If threshold is not specified, the configured Mean Square Threshold is used.
         """
         # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare", get_ident())
 
         triggerParams = {}
         triggerParams["cam"] = camInfo
         roiDetected = 0
+        if threshold is None:
+            threshold = CameraCfg().triggerConfig.msdThreshold
 
-        for roni in ronis:
-            x = roni[0]
-            y = roni[1]
-            w = roni[2]
-            h = roni[3]
-            fCur[y:y+h, x:x+w] = 0
-            fPrv[y:y+h, x:x+w] = 0
-        # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare - cleared %s ronis", get_ident(), len(ronis))
+        # Squared difference without uint8 wrap-around
+        diff = np.subtract(fCur, fPrv, dtype=np.int16)
+        sqd = np.square(diff, dtype=np.float32)
+        if sqd.ndim == 3:
+            sqd = sqd.mean(axis=2)
+        if len(ronis) > 0:
+            sqd *= cls._msdMask(sqd.shape, ronis)
 
         motion = False
         if len(rois) == 0:
-            msd = np.square(np.subtract(fCur, fPrv)).mean()
+            msd = float(sqd.mean())
             # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare msd: %s", get_ident(), msd)
-            if msd > CameraCfg().triggerConfig.msdThreshold:
+            if msd > threshold:
                 triggerParams["msd"] = str(round(msd, 3))
                 motion = True
         else:
-            idx = 0
-            for roi in rois:
-                idx += 1
-                x = roi[0]
-                y = roi[1]
-                w = roi[2]
-                h = roi[3]
-                rCur = fCur[y:y+h, x:x+w]
-                rPrv = fPrv[y:y+h, x:x+w]
-                msd = np.square(np.subtract(rCur, rPrv)).mean()
-                # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare shape(fCur)=%s", get_ident(), fCur.shape)
-                # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare shape(rCur)=%s", get_ident(), rCur.shape)
-                # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare roi (%s,%s,%s,%s) msd: %s", get_ident(), x, y, w, h, msd)
-                if msd > CameraCfg().triggerConfig.msdThreshold:
-                    triggerParams["roi"] = idx
-                    triggerParams["msd"] = str(round(msd, 3))
-                    motion = True
-                    roiDetected = idx
-                    break
+            (hf, wf) = sqd.shape
+            sat = np.zeros((hf + 1, wf + 1), dtype=np.float64)
+            np.cumsum(sqd, axis=0, dtype=np.float64, out=sat[1:, 1:])
+            np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+            r = np.array(rois, dtype=np.int64).reshape(-1, 4)
+            x1 = np.clip(r[:, 0], 0, wf)
+            y1 = np.clip(r[:, 1], 0, hf)
+            x2 = np.clip(r[:, 0] + r[:, 2], 0, wf)
+            y2 = np.clip(r[:, 1] + r[:, 3], 0, hf)
+            area = np.maximum((x2 - x1) * (y2 - y1), 1)
+            scores = (sat[y2, x2] - sat[y1, x2] - sat[y2, x1] + sat[y1, x1]) / area
+            # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare roi scores: %s", get_ident(), scores)
+            hits = np.flatnonzero(scores > threshold)
+            if len(hits) > 0:
+                roiDetected = int(hits[0]) + 1
+                triggerParams["roi"] = roiDetected
+                triggerParams["msd"] = str(round(float(scores[hits[0]]), 3))
+                triggerParams["msd_rois"] = [round(float(score), 3) for score in scores]
+                triggerParams["msd_frame"] = round(float(sat[hf, wf]) / (hf * wf), 3)
+                motion = True
         # logger.debug("Thread %s: MotionDetector._motionAlgo_MeanSquare - motion: %s", get_ident(), motion)
         return (motion, {"trigger":"Motion Detection", "triggertype":"Mean Square Diff", "triggerparam":triggerParams}, roiDetected)
 
@@ -452,15 +580,13 @@ class MotionDetector():
                 MotionDetector().when_motion_detected()
 
         if logEvent:
-            with open(tc.logFilePath, "a") as f:
-                f.write(logTS + " Event  detected       Trigger: " + trigger["trigger"] + " - '" + trigger["triggertype"] + "' " + str(trigger["triggerparam"]) + "\n")
+            EventWriter.log(tc.logFilePath, logTS + " Event  detected       Trigger: " + trigger["trigger"] + " - '" + trigger["triggertype"] + "' " + str(trigger["triggerparam"]))
             key = cls.eventKey
             # logger.debug("Thread %s: MotionDetector._doAction - INSERT INTO events - timestamp: %s", get_ident(), key)
-            cls.db.execute(
+            EventWriter.execute(
                 "INSERT INTO events (timestamp, date, minute, time, type, trigger, triggertype, triggerparam) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (key, key[:10], key[11:16], key[11:19], "Motion", trigger["trigger"], trigger["triggertype"], str(trigger["triggerparam"]))
             )
-            cls.db.commit()
             # logger.debug("Thread %s: MotionDetector._doAction - DB committed", get_ident())
 
         if startVideo:
@@ -481,19 +607,16 @@ class MotionDetector():
                 if encoder:
                     cls.videoEncoder = encoder
                 cls.videoName = fnVideo
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " started" + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " started")
                 cls.videoKey = logTS
                 # logger.debug("Thread %s: MotionDetector._doAction - INSERT INTO eventactions - Video", get_ident())
-                cls.db.execute(
+                EventWriter.execute(
                     "INSERT INTO eventactions (event, timestamp, date, time, actiontype, actionduration, filename, fullpath) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (cls.eventKey, logTS, logTS[:10], logTS[11:19], "Video", tc.actionVideoDuration, fnVideo, tc.actionPath + "/" + fnVideo)
                 )
-                cls.db.commit()
                 # logger.debug("Thread %s: MotionDetector._doAction - DB committed", get_ident())
             else:
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " Start   Error: " + err + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " Start   Error: " + err)
 
         photoDone = False
         if doPhoto:
@@ -503,14 +626,12 @@ class MotionDetector():
                 (done, err) = cls.savePhotoWithRois(frame, fpPhoto, cls.rois, cls.ronis, cls.roiDetected)
             photoDone = done
             if done:
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Photo: " + fnPhoto + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Photo: " + fnPhoto)
                 # logger.debug("Thread %s: MotionDetector._doAction - INSERT INTO eventactions - Photo", get_ident())
-                cls.db.execute(
+                EventWriter.execute(
                     "INSERT INTO eventactions (event, timestamp, date, time, actiontype, actionduration, filename, fullpath) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (cls.eventKey, logTS, logTS[:10], logTS[11:19], "Photo", 0, fnPhoto, tc.actionPath + "/" + fnPhoto)
                 )
-                cls.db.commit()
                 # logger.debug("Thread %s: MotionDetector._doAction - DB committed", get_ident())
                 if not cls.notifyMail is None:
                     if tc.notifyIncludePhoto == True:
@@ -523,8 +644,7 @@ class MotionDetector():
                                 cls._sendNotification()
             else:
                 if err != "":
-                    with open(tc.logFilePath, "a") as f:
-                        f.write(logTS + " Photo: " + fnPhoto + " Error:  " + err + "\n")
+                    EventWriter.log(tc.logFilePath, logTS + " Photo: " + fnPhoto + " Error:  " + err)
 
         if doNotify:
             cls.notificationDone = now
@@ -662,6 +782,21 @@ class MotionDetector():
         cls.notifyMail = None
         logger.debug("Thread %s: MotionDetector._sendNotification - done", get_ident())
 
+    @classmethod
+    def _preDetected(cls, fCur, fPrv) -> bool:
+        """ Cheap check for changes in idle mode of the duty cycle
+
+            fCur, fPrv : subsampled grayscale frames
+            
+            Mean Square Diff is evaluated against the pre-threshold
+            with RoIs and RoNIs scaled to the subsampled frames.
+        """
+        s = cls.idleStep
+        rois = [(r[0] // s, r[1] // s, max(r[2] // s, 1), max(r[3] // s, 1)) for r in cls.rois]
+        ronis = [(r[0] // s, r[1] // s, max(r[2] // s, 1), max(r[3] // s, 1)) for r in cls.ronis]
+        (pre, trigger, roiDetected) = cls._motionAlgo_MeanSquare(fCur, fPrv, cls.camInfo, rois, ronis, CameraCfg().triggerConfig.motionPreThreshold)
+        return pre
+
     @classmethod
     def _cleanupEvent(cls):
         """ Cleanup event data
@@ -711,14 +846,12 @@ class MotionDetector():
                         logTS = now.strftime("%Y-%m-%d %H:%M:%S")
                         if done:
                             cls.videoEncoder = None
-                            with open(tc.logFilePath, "a") as f:
-                                f.write(logTS + " Video: " + cls.videoName + " stopped" + "\n")
+                            EventWriter.log(tc.logFilePath, logTS + " Video: " + cls.videoName + " stopped")
                             logger.debug("Thread %s: MotionDetector._stopAction - UPDATE eventactions", get_ident())
-                            cls.db.execute(
+                            EventWriter.execute(
                                 "UPDATE eventactions set actionduration = ? WHERE event = ? AND timestamp = ? AND actiontype = ?",
                                 (round(durSec,0), cls.eventKey, cls.videoKey, "Video")
                             )
-                            cls.db.commit()
                             logger.debug("Thread %s: MotionDetector._stopAction - DB committed", get_ident())
                             if not cls.notifyMail is None:
                                 if tc.notifyIncludeVideo == True:
@@ -730,8 +863,7 @@ class MotionDetector():
                                 if noWait:
                                     cls._sendNotification()
                         else:
-                            with open(tc.logFilePath, "a") as f:
-                                f.write(logTS + " Video: " + cls.videoName + " Stop     Error" + err + "\n")
+                            EventWriter.log(tc.logFilePath, logTS + " Video: " + cls.videoName + " Stop     Error" + err)
                         cls.videoStop = now
                     else:
                         waitForVideo = True
@@ -786,8 +918,6 @@ class MotionDetector():
         """ Motion detection thread
         """
         logger.debug("Thread %s: MotionDetector._motionThread", get_ident())
-        cls.db = get_dbx()
-        logger.debug("Thread %s: MotionDetector._motionThread - got database", get_ident())
         cam = Camera()
         cfg = CameraCfg()
         tc = cfg.triggerConfig
@@ -795,8 +925,26 @@ class MotionDetector():
         count = 0
         tc.motionTestFramerate = 0
         prv = None
+        useWorker = tc.motionWorkerProcess == True \
+            and tc.motionDetectAlgo > 1 \
+            and not cls.mdAlgo is None
+        # Duty cycle: analyze subsampled frames at idle rate until a change is detected,
+        # then run the configured algorithm at full rate until the scene is quiet again
+        dutyCycle = tc.motionDutyCycle == True \
+            and cfg.serverConfig.isTriggerTesting == False
+        if dutyCycle:
+            tc.motionMode = "idle"
+        else:
+            tc.motionMode = "continuous"
+        idlePrv = None
+        lastMotion = time.monotonic()
+        if cfg.triggerConfig.actionVR == 2 \
+        and cfg.serverConfig.activeCameraIsUsb == False:
+            # The setting may remain from a USB camera
+            logger.warning("Circular output is only supported for USB cameras. Using normal video recording")
+            cfg.triggerConfig.actionVR = 1
         if cfg.triggerConfig.actionVR == 2:
-            (done, circ, encoder, err) = cam.startCircular()
+            (done, circ, encoder, err) = cam.startCircular(buffersizeSec=tc.actionCircSize)
             if done:
                 logger.debug("Thread %s: MotionDetector._motionThread - Encoder for circular output started", get_ident())
                 cls.videoCircOutput = circ
@@ -812,28 +960,54 @@ class MotionDetector():
                 try:
                     # Just to keep the live stream running
                     frame, frameRaw = cam.get_frame()
-                    cur = cam.getLiveViewImageForMotionDetection()
+                    raw = cam.getLiveViewImageForMotionDetection()
                     # logger.debug("Thread %s: MotionDetector._motionThread - got live view buffer", get_ident())
-                    if prv is not None:
-                        (motion, trigger) = cls._motionDetected(cur, prv)
-                        if not cls.mdAlgo is None:
-                            if cls.mdAlgo.test == True:
-                                count += 1
-                                timeDelta = datetime.now() - startTime
-                                timeDeltaSec = timeDelta.total_seconds()
-                                if timeDeltaSec > 0.5:
-                                    tc.motionTestFramerate = count / timeDeltaSec
+                    detected = None
+                    if tc.motionMode == "idle":
+                        tick = time.monotonic()
+                        small = Camera.motionGray(raw)[::cls.idleStep, ::cls.idleStep]
+                        if idlePrv is not None \
+                        and cls._preDetected(small, idlePrv):
+                            logger.debug("Thread %s: MotionDetector._motionThread - change detected. Switching to burst mode", get_ident())
+                            tc.motionMode = "burst"
+                            lastMotion = tick
+                            prv = None
+                            if not cls.worker is None:
+                                cls.worker.reset()
+                            count = 0
+                            startTime = datetime.now()
+                            idlePrv = None
                         else:
+                            idlePrv = small
                             count += 1
-                            timeDelta = datetime.now() - startTime
-                            timeDeltaSec = timeDelta.total_seconds()
+                            timeDeltaSec = (datetime.now() - startTime).total_seconds()
                             if timeDeltaSec > 0.5:
                                 tc.motionTestFramerate = count / timeDeltaSec
-                            if timeDeltaSec > 3600:
-                                count = 0
-                                startTime = datetime.now()
+                            # Finish a pending event and notification
+                            cls._stopAction()
+                            wait = 1.0 / tc.motionIdleRate - (time.monotonic() - tick)
+                            if wait > 0:
+                                time.sleep(wait)
+                    elif useWorker:
+                        detected = cls._motionDetectedByWorker(raw)
+                    else:
+                        cur = Camera.motionGray(raw)
+                        if prv is not None:
+                            detected = cls._motionDetected(cur, prv, raw)
+                        prv = cur
+                    if detected is not None:
+                        (motion, trigger) = detected
+                        count += 1
+                        timeDelta = datetime.now() - startTime
+                        timeDeltaSec = timeDelta.total_seconds()
+                        if timeDeltaSec > 0.5:
+                            tc.motionTestFramerate = count / timeDeltaSec
+                        if timeDeltaSec > 3600:
+                            count = 0
+                            startTime = datetime.now()
                         if motion:
                             # logger.debug("Thread %s: MotionDetector._motionThread - motion detected", get_ident())
+                            lastMotion = time.monotonic()
                             cls._doAction(trigger)
                         cls._stopAction()
                         # logger.debug("Thread %s: MotionDetector._motionThread - stopAction done", get_ident())
@@ -842,7 +1016,13 @@ class MotionDetector():
                             if not cls.videoStart is None \
                             and cls.videoStop is None:
                                 cls.mdAlgo.recordMotion()
-                    prv = cur
+                    if tc.motionMode == "burst" \
+                    and time.monotonic() - lastMotion > tc.motionQuietPeriod \
+                    and (cls.videoStart is None or not cls.videoStop is None):
+                        logger.debug("Thread %s: MotionDetector._motionThread - quiet period elapsed. Switching to idle mode", get_ident())
+                        tc.motionMode = "idle"
+                        count = 0
+                        startTime = datetime.now()
                     if cls.mThreadStop:
                         logger.debug("Thread %s: MotionDetector._motionThread - stop requested", get_ident())
                         cls._stopAction(force=True)
@@ -867,6 +1047,17 @@ class MotionDetector():
                 cls.videoEncoder = None
             else:
                 logger.error("Circular output not stopped: %s", err)
+        if not cls.worker is None:
+            try:
+                cls._stopWorker()
+            except Exception as e:
+                logger.error("Worker process not stopped: %s", e)
+                cls.worker = None
+        elif not cls.mdAlgo is None \
+        and cfg.serverConfig.cfgPath:
+            cls.mdAlgo.saveBackground(cls._backgroundPath())
+        tc.motionMode = ""
+        EventWriter.flush()
         cls.mThread = None
 
     @classmethod
@@ -881,6 +1072,8 @@ class MotionDetector():
             sc.error = None
             tc.error = None
             cls.prepareRoIs()
+            if tc.motionDetectAlgo in range(2, 6):
+                cls.mdAlgo.analysis_scale = tc.motionAnalysisScale
             if tc.motionDetectAlgo == 2:
                 cls.mdAlgo.bbox_threshold = tc.bboxThreshold
                 cls.mdAlgo.nms_threshold = tc.nmsThreshold
@@ -898,6 +1091,16 @@ class MotionDetector():
                 cls.mdAlgo.backSubMod = tc.backSubModel
                 cls.mdAlgo.frameSize = CameraCfg().liveViewConfig.stream_size
                 cls.mdAlgo.framerate = 15
+                cls.mdAlgo.learning_rate = tc.bgLearningRate
+                cls.mdAlgo.warmup_frames = tc.bgWarmupFrames
+                if sc.cfgPath:
+                    cls.mdAlgo.restoreBackground(cls._backgroundPath())
+            if tc.motionDetectAlgo == 5:
+                cls.mdAlgo.motion_threshold = tc.motionThreshold
+                cls.mdAlgo.bbox_threshold = tc.bboxThreshold
+                cls.mdAlgo.nms_threshold = tc.nmsThreshold
+                cls.mdAlgo.frameSize = CameraCfg().liveViewConfig.stream_size
+                cls.mdAlgo.framerate = 15
             if sc.isTriggerTesting == True:
                 logger.debug("Thread %s: MotionDetector.startMotionDetection - Activating test mode", get_ident())
                 cls.mdAlgo.test = True
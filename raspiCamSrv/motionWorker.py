@@ -0,0 +1,199 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from _thread import get_ident
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Algorithm parameters which are transferred to the worker process
+WORKER_PARAMS = (
+    "bbox_threshold",
+    "nms_threshold",
+    "motion_threshold",
+    "analysis_scale",
+    "learning_rate",
+    "warmup_frames",
+    "test",
+)
+
+
+def _toGray(frameRaw, grayShape: tuple, isUsb: bool):
+    """Return the grayscale image of a live view buffer (see Camera.motionGray)"""
+    if len(frameRaw.shape) == 2:
+        return frameRaw[:grayShape[0], :grayShape[1]]
+    import cv2
+    if isUsb == True:
+        return cv2.cvtColor(frameRaw, cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(frameRaw, cv2.COLOR_RGB2GRAY)
+
+
+def _workerMain(conn, shmName: str, shape: tuple, dtype: str, grayShape: tuple, isUsb: bool,
+                algo: int, cameraSettings: dict, params: dict, backgroundPath: str):
+    """Entry point of the motion detection worker process
+
+    Frames are taken from the shared memory double buffer.
+    The slot to be processed is received through the pipe
+    and the detection result is returned through the same pipe.
+    Only the frame of the current slot is accessed while it is processed.
+    """
+    from raspiCamSrv.camCfg import CameraCfg
+    import raspiCamSrv.motionAlgoIB as mda
+
+    tc = CameraCfg().triggerConfig
+    tc.cameraSettings = cameraSettings
+    if algo == 2:
+        mdAlgo = mda.MotionDetectFrameDiff()
+    elif algo == 3:
+        mdAlgo = mda.MotionDetectOpticalFlow()
+    elif algo == 5:
+        mdAlgo = mda.MotionDetectSparseFlow()
+    else:
+        mdAlgo = mda.MotionDetectBgSubtract()
+        mdAlgo.backSubModel = tc.backSubModel
+    for key, value in params.items():
+        setattr(mdAlgo, key, value)
+    if backgroundPath:
+        mdAlgo.restoreBackground(backgroundPath)
+
+    shm = shared_memory.SharedMemory(name=shmName)
+    frames = np.ndarray((MotionWorker.SLOTS,) + shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    prv = None
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            if msg == "reset":
+                # Analysis continues with a new sequence of frames
+                prv = None
+                continue
+            (slot, camInfo, rois, ronis) = msg
+            try:
+                raw = frames[slot]
+                cur = _toGray(raw, grayShape, isUsb)
+                if prv is None:
+                    res = None
+                else:
+                    (motion, trigger, roiDetected) = mdAlgo.detectMotion(cur, prv, camInfo, rois, ronis, raw)
+                    res = mdAlgo.getResult()
+                    res["motion"] = motion
+                    res["trigger"] = trigger
+                    res["roiDetected"] = roiDetected
+                # The slot will be overwritten with the next frame but one
+                if cur.base is None:
+                    prv = cur
+                else:
+                    prv = cur.copy()
+                conn.send(("ok", res))
+            except Exception as e:
+                conn.send(("error", str(e)))
+        if backgroundPath:
+            mdAlgo.saveBackground(backgroundPath)
+    finally:
+        del frames
+        shm.close()
+        conn.close()
+
+
+class MotionWorker():
+    """Motion detection in a separate process
+
+    The algorithms of motionAlgoIB are CPU bound and compete with the web server
+    and camera threads for the GIL if run in the motion detection thread.
+    With a MotionWorker, the algorithm runs in a separate process.
+    Live view buffers are passed through a shared memory double buffer:
+    while the worker analyzes the frame in one slot, the next frame is written to the other.
+    Results are returned through a pipe, delayed by one frame.
+    """
+    SLOTS = 2
+
+    def __init__(self, frameRaw, grayShape: tuple, isUsb: bool, algo: int, mdAlgo,
+                 cameraSettings: dict, backgroundPath: str = None):
+        logger.debug("Thread %s: MotionWorker.__init__ - shape: %s dtype: %s algo: %s", get_ident(), frameRaw.shape, frameRaw.dtype, algo)
+        self.shape = frameRaw.shape
+        self.dtype = frameRaw.dtype
+        self.seq = 0
+        self.pending = None
+        self.shm = shared_memory.SharedMemory(create=True, size=self.SLOTS * frameRaw.nbytes)
+        self.frames = np.ndarray((self.SLOTS,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        params = {}
+        for key in WORKER_PARAMS:
+            if hasattr(mdAlgo, key):
+                params[key] = getattr(mdAlgo, key)
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, childConn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_workerMain,
+            args=(childConn, self.shm.name, self.shape, self.dtype.str, grayShape, isUsb,
+                  algo, cameraSettings, params, backgroundPath),
+            name="raspiCamSrv-motion",
+            daemon=True,
+        )
+        self.process.start()
+        childConn.close()
+        logger.debug("Thread %s: MotionWorker.__init__ - worker process started: pid %s", get_ident(), self.process.pid)
+
+    def accepts(self, frameRaw) -> bool:
+        """Check whether a frame fits into the shared memory slots"""
+        return frameRaw.shape == self.shape and frameRaw.dtype == self.dtype
+
+    def process_frame(self, frameRaw, camInfo: str, rois: list, ronis: list):
+        """Submit a frame for analysis and return the result for the previous frame
+
+        The slot for the new frame is free because the result of the frame
+        which was written there before has already been received.
+
+        Returns:
+            (result, frameRaw) for the previously submitted frame
+            or (None, None) if no frame has been submitted before
+        """
+        slot = self.seq % self.SLOTS
+        self.frames[slot][...] = frameRaw
+        self.conn.send((slot, camInfo, rois, ronis))
+        self.seq += 1
+        prevRaw = self.pending
+        self.pending = frameRaw
+        if prevRaw is None:
+            return (None, None)
+        return (self._receive(), prevRaw)
+
+    def reset(self):
+        """Discard the result for the pending frame and let the worker start with a new sequence of frames
+
+        This is used when frames have not been analyzed for a while (idle mode),
+        so that the first result does not refer to a frame from before the interruption.
+        """
+        logger.debug("Thread %s: MotionWorker.reset", get_ident())
+        if self.pending is not None:
+            self._receive()
+            self.pending = None
+        self.conn.send("reset")
+
+    def _receive(self):
+        """Receive the next reply from the worker"""
+        (status, value) = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError("Motion detection worker: " + value)
+        return value
+
+    def stop(self):
+        """Stop the worker process and release the shared memory"""
+        logger.debug("Thread %s: MotionWorker.stop", get_ident())
+        try:
+            if self.pending is not None:
+                self._receive()
+                self.pending = None
+            self.conn.send(None)
+        except Exception as e:
+            logger.error("Thread %s: MotionWorker.stop - error: %s", get_ident(), e)
+        self.process.join(10)
+        if self.process.is_alive():
+            logger.error("Thread %s: MotionWorker.stop - worker did not stop. Terminating", get_ident())
+            self.process.terminate()
+            self.process.join(2)
+        self.conn.close()
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
+        logger.debug("Thread %s: MotionWorker.stop - done", get_ident())
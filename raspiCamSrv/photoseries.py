@@ -6,6 +6,7 @@ from raspiCamSrv.photoseriesCfg import PhotoSeriesCfg
 from raspiCamSrv.photoseriesCfg import Series
 from raspiCamSrv.camera_pi import Camera
 from raspiCamSrv.sun import Sun
+from raspiCamSrv.zipStream import zipStream
 from raspiCamSrv.version import version
 import os
 import copy
@@ -13,8 +14,6 @@ from pathlib import Path
 from datetime import datetime
 from datetime import timedelta
 from zoneinfo import ZoneInfo
-from io import BytesIO
-from zipfile import ZipFile
 import time
 
 from raspiCamSrv.auth import login_required
@@ -433,26 +432,25 @@ def download_series():
         dt = datetime(year=dt.year, month=dt.month, day=dt.day, hour=dt.hour, minute=dt.minute)
         sr.downloaded = dt
         sr.persist()
-        stream = BytesIO()
-        with ZipFile(stream, 'w') as zf:
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    zf.write(os.path.join(root, file), 
-                            os.path.relpath(os.path.join(root, file), 
-                                            os.path.join(path, '..')))
-        stream.seek(0)
-        logger.debug("download_series - archive done")
+        zl = []
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                zl.append((os.path.join(root, file), 
+                           os.path.relpath(os.path.join(root, file), 
+                                           os.path.join(path, '..'))))
 
         now = datetime.now()
         zipName = "raspiCamSrvSeries_" + nam + "_" + now.strftime("%Y%m%d_%H%M%S") + ".zip"
         logger.debug("images/download_selected - downloading as %s", zipName)
         msg = f"Downloading archive {zipName}."
         flash(msg)
-        return send_file(
-            stream,
-            as_attachment=True,
-            download_name=zipName
+        # The archive is streamed while it is generated
+        resp = Response(
+            zipStream(zl),
+            mimetype="application/zip"
         )
+        resp.headers.set("Content-Disposition", "attachment", filename=zipName)
+        return resp
     return render_template("photoseries/main.html", sc=sc, tl=tl, sr=sr, cp=cp)
 
 @bp.route("/series_properties", methods=("GET", "POST"))
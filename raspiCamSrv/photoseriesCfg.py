@@ -11,6 +11,7 @@ import shutil
 from pathlib import Path
 import json
 import math
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -1594,6 +1595,8 @@ class PhotoSeriesCfg():
             cls._rootPath = None
             cls._tlSeries = []
             cls._curSeries: Series = None
+            # Serializes changes of the series list, which are also done by the retention thread
+            cls._lock = threading.RLock()
         return cls._instance
     
     @property
@@ -1604,6 +1607,10 @@ class PhotoSeriesCfg():
     def rootPath(self, value: str):
         self._rootPath = value
     
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
     @property
     def tlSeries(self) -> list:
         return self._tlSeries
@@ -1632,7 +1639,8 @@ class PhotoSeriesCfg():
         return self._curSeries is not None
         
     def appendSeries(self, s:Series):
-        self._tlSeries.append(s)
+        with self._lock:
+            self._tlSeries.append(s)
 
     def nameExists(self, name: str) -> bool:
         ne = False
@@ -1689,19 +1697,46 @@ class PhotoSeriesCfg():
             self.curSeries = lastSer
         logger.debug("initFromTlFolder - # series: %s", len(self.tlSeries))
         
+    def removeSeries(self, ser: Series) -> bool:
+        """ Remove a series which is not the active one
+
+        Returns:
+            bool: True if the series folder has been deleted
+        """
+        with self._lock:
+            if not ser in self.tlSeries:
+                return False
+            sp = ser.path
+            try:
+                if os.path.exists(sp):
+                    if os.path.isdir(sp):
+                        shutil.rmtree(sp)
+            except Exception as e:
+                logger.error("Failed to delete folder %s. Reason: %s", sp, e)
+                return False
+
+            self.tlSeries.remove(ser)
+            if self.curSeries is ser:
+                if len(self.tlSeries) > 0:
+                    self.curSeries = self.tlSeries[0]
+                else:
+                    self.curSeries = None
+        return True
+
     def removeCurrentSeries(self):
         """ Remove the current series and set current series to last one in list
         """
-        sp = self.curSeries.path
-        try:
-            if os.path.exists(sp):
-                if os.path.isdir(sp):
-                    shutil.rmtree(sp)
-        except Exception as e:
-            logger.error("Failed to delete folder %s. Reason: %s", sp, e)
-            
-        self.tlSeries.remove(self.curSeries)
-        if len(self.tlSeries) > 0:
-            self.curSeries = self.tlSeries[0]
-        else:
-            self.curSeries = None
\ No newline at end of file
+        with self._lock:
+            sp = self.curSeries.path
+            try:
+                if os.path.exists(sp):
+                    if os.path.isdir(sp):
+                        shutil.rmtree(sp)
+            except Exception as e:
+                logger.error("Failed to delete folder %s. Reason: %s", sp, e)
+                
+            self.tlSeries.remove(self.curSeries)
+            if len(self.tlSeries) > 0:
+                self.curSeries = self.tlSeries[0]
+            else:
+                self.curSeries = None
\ No newline at end of file
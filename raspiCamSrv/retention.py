@@ -0,0 +1,354 @@
+from raspiCamSrv.camCfg import CameraCfg
+from raspiCamSrv.eventWriter import EventWriter
+from _thread import get_ident
+from collections import deque
+from datetime import datetime
+import threading
+import shutil
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("events", "photos", "photoseries")
+
+
+class Retention():
+    """ Background manager for storage usage
+
+    The manager keeps a cache of the files in the media folders
+    (events, photos/camera_*, photoseries).
+    A folder is only listed again if its modification time has changed.
+    Files which have been modified recently (e.g. videos being recorded) are checked in every cycle.
+    From the changes, the ingest rate in bytes per day is estimated.
+
+    If retention is active and the usage of the file system exceeds the high watermark,
+    media are deleted, oldest first, until usage is below the low watermark.
+    Categories are processed in the order of their priority. Protected categories are skipped.
+    - events: event photos and videos together with their eventactions
+    - photos: photos with their raw photos, videos and histograms
+    - photoseries: entire finished photo series
+    """
+    interval = 60
+    # Files modified within minAge seconds are never deleted
+    minAge = 300
+    # Files modified within hotAge seconds are checked in every cycle
+    hotAge = 900
+    # Time window for the ingest rate
+    rateWindow = 24 * 3600
+    _thread = None
+    _lock = threading.Lock()
+    _dirs = {}
+    _ingested = 0
+    # Files found in the first cycle are not counted as ingest
+    _primed = False
+    _samples = deque()
+    status = {
+        "active": False,
+        "total": 0,
+        "used": 0,
+        "free": 0,
+        "used_pct": 0.0,
+        "categories": {},
+        "ingest_per_day": None,
+        "days_to_full": None,
+        "days_to_high_watermark": None,
+        "deleted_files": 0,
+        "deleted_bytes": 0,
+        "last_run": "",
+        "error": "",
+    }
+
+    @classmethod
+    def start(cls):
+        """ Start the retention manager
+        """
+        with cls._lock:
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=cls._retentionThread, name="raspiCamSrv-retention", daemon=True)
+                cls._thread.start()
+                logger.debug("Thread %s: Retention.start - retention manager started", get_ident())
+
+    @classmethod
+    def getStatus(cls) -> dict:
+        """ Current storage status (see status)
+        """
+        st = dict(cls.status)
+        st["categories"] = dict(cls.status["categories"])
+        return st
+
+    @classmethod
+    def categoryRoots(cls) -> dict:
+        """ Root folders of the categories
+        """
+        from raspiCamSrv.photoseriesCfg import PhotoSeriesCfg
+        cfg = CameraCfg()
+        sc = cfg.serverConfig
+        return {
+            "events": cfg.triggerConfig.actionPath,
+            "photos": sc.photoRoot + "/photos",
+            "photoseries": PhotoSeriesCfg().rootPath,
+        }
+
+    @classmethod
+    def _retentionThread(cls):
+        """ Retention thread
+        """
+        logger.debug("Thread %s: Retention._retentionThread", get_ident())
+        while True:
+            try:
+                cls.runCycle()
+            except Exception as e:
+                logger.error("Error in retention manager: %s", e)
+                cls.status["error"] = str(e)
+            time.sleep(cls.interval)
+
+    @classmethod
+    def runCycle(cls):
+        """ Update usage and enforce watermarks
+        """
+        sc = CameraCfg().serverConfig
+        roots = cls.categoryRoots()
+        cats = {}
+        for cat, root in roots.items():
+            cats[cat] = cls._update(root)
+        cls._primed = True
+        now = time.time()
+        cls._samples.append((now, cls._ingested))
+        while len(cls._samples) > 1 \
+        and cls._samples[0][0] < now - cls.rateWindow:
+            cls._samples.popleft()
+
+        usage = shutil.disk_usage(sc.photoRoot)
+        if sc.retentionActive == True \
+        and usage.used * 100 / usage.total >= sc.retentionHighWater:
+            need = usage.used - usage.total * sc.retentionLowWater / 100
+            cls._enforce(roots, int(need))
+            usage = shutil.disk_usage(sc.photoRoot)
+            for cat, root in roots.items():
+                cats[cat] = cls._update(root)
+
+        rate = None
+        (t0, i0) = cls._samples[0]
+        (t1, i1) = cls._samples[-1]
+        if t1 - t0 >= 600:
+            rate = (i1 - i0) / (t1 - t0) * 86400
+        st = cls.status
+        st["active"] = sc.retentionActive
+        st["total"] = usage.total
+        st["used"] = usage.used
+        st["free"] = usage.free
+        st["used_pct"] = round(usage.used * 100 / usage.total, 1)
+        st["categories"] = cats
+        st["ingest_per_day"] = None if rate is None else int(rate)
+        st["days_to_full"] = None
+        st["days_to_high_watermark"] = None
+        if rate:
+            st["days_to_full"] = round(usage.free / rate, 1)
+            if sc.retentionActive == True:
+                st["days_to_high_watermark"] = round(max(0, usage.total * sc.retentionHighWater / 100 - usage.used) / rate, 1)
+        st["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        st["error"] = ""
+
+    @classmethod
+    def _update(cls, root: str) -> dict:
+        """ Update the cache for the folder tree below root
+
+        Returns:
+            dict: bytes and files in the tree
+        """
+        total = 0
+        count = 0
+        now = time.time()
+        stack = [root]
+        seen = set()
+        while len(stack) > 0:
+            d = stack.pop()
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(d)
+            entry = cls._dirs.get(d)
+            hot = [] if entry is None else entry["hot"]
+            if entry is None \
+            or entry["mtime"] != mtime:
+                entry = cls._scanDir(d, mtime, entry)
+                cls._dirs[d] = entry
+            # Check files which are possibly still growing
+            for name in hot:
+                cls._restat(entry, d, name)
+            entry["hot"] = [name for name, (size, fmtime) in entry["files"].items() if fmtime > now - cls.hotAge]
+            for name, (size, fmtime) in entry["files"].items():
+                total += size
+            count += len(entry["files"])
+            stack.extend(entry["subdirs"])
+        # Forget folders which no longer exist
+        for d in [d for d in cls._dirs if d.startswith(root + "/") and not d in seen]:
+            del cls._dirs[d]
+        return {"bytes": total, "files": count}
+
+    @classmethod
+    def _scanDir(cls, d: str, mtime: int, old: dict) -> dict:
+        """ List folder d, keeping cached data for known files
+        """
+        oldFiles = {} if old is None else old["files"]
+        files = {}
+        subdirs = []
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    subdirs.append(e.path)
+                elif e.is_file(follow_symlinks=False):
+                    if e.name in oldFiles:
+                        files[e.name] = oldFiles[e.name]
+                    else:
+                        st = e.stat()
+                        files[e.name] = (st.st_size, st.st_mtime)
+                        if cls._primed:
+                            cls._ingested += st.st_size
+        return {"mtime": mtime, "files": files, "subdirs": subdirs, "hot": []}
+
+    @classmethod
+    def _restat(cls, entry: dict, d: str, name: str):
+        """ Update size and modification time of a file in the cache
+        """
+        if not name in entry["files"]:
+            return
+        try:
+            st = os.stat(d + "/" + name)
+        except OSError:
+            return
+        (size, fmtime) = entry["files"][name]
+        if st.st_size > size:
+            cls._ingested += st.st_size - size
+        entry["files"][name] = (st.st_size, st.st_mtime)
+
+    @classmethod
+    def _enforce(cls, roots: dict, need: int):
+        """ Delete media until need bytes have been freed
+        """
+        sc = CameraCfg().serverConfig
+        logger.debug("Thread %s: Retention._enforce - need to free %s bytes", get_ident(), need)
+        cats = sc.retentionCategories
+        order = sorted([c for c in CATEGORIES if c in cats], key=lambda c: cats[c]["priority"])
+        freed = 0
+        for cat in order:
+            if freed >= need:
+                break
+            if cats[cat]["protect"] == True:
+                continue
+            if cat == "photoseries":
+                freed += cls._reduceSeries(need - freed)
+            else:
+                freed += cls._reduceMedia(cat, roots[cat], need - freed)
+        if freed < need:
+            logger.warning("Retention: only %s of %s bytes could be freed", freed, need)
+        logger.debug("Thread %s: Retention._enforce - freed %s bytes", get_ident(), freed)
+
+    @classmethod
+    def _mediaGroups(cls, root: str) -> list:
+        """ Media below root, grouped by folder and file name without extension
+
+        Files in a "hist" subfolder belong to the media in the parent folder.
+
+        Returns:
+            list of (mtime, [(path, size)]), oldest first
+        """
+        groups = {}
+        for d, entry in cls._dirs.items():
+            if d != root \
+            and not d.startswith(root + "/"):
+                continue
+            base = d[:-5] if d.endswith("/hist") else d
+            for name, (size, fmtime) in entry["files"].items():
+                key = (base, os.path.splitext(name)[0])
+                g = groups.get(key)
+                if g is None:
+                    g = [0, []]
+                    groups[key] = g
+                g[0] = max(g[0], fmtime)
+                g[1].append((d + "/" + name, size))
+        gl = [tuple(g) for g in groups.values()]
+        gl.sort(key=lambda g: g[0])
+        return gl
+
+    @classmethod
+    def _reduceMedia(cls, cat: str, root: str, need: int) -> int:
+        """ Delete the oldest media of a category
+
+        Returns:
+            int: freed bytes
+        """
+        sc = CameraCfg().serverConfig
+        limit = time.time() - cls.minAge
+        freed = 0
+        files = 0
+        for (mtime, paths) in cls._mediaGroups(root):
+            if freed >= need \
+            or mtime > limit:
+                break
+            for (fp, size) in paths:
+                try:
+                    os.remove(fp)
+                    files += 1
+                    freed += size
+                    if cat == "events":
+                        EventWriter.execute("DELETE FROM eventactions WHERE fullpath = ?", (fp,))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error("Retention: error deleting %s: %s", fp, e)
+        if files > 0:
+            logger.info("Retention: deleted %s %s files with %s bytes", files, cat, freed)
+            if cat == "photos":
+                sc.displayBufferCheck()
+        cls.status["deleted_files"] += files
+        cls.status["deleted_bytes"] += freed
+        return freed
+
+    @classmethod
+    def _reduceSeries(cls, need: int) -> int:
+        """ Delete the oldest finished photo series
+
+        Returns:
+            int: freed bytes
+        """
+        from raspiCamSrv.photoseriesCfg import PhotoSeriesCfg
+        tl = PhotoSeriesCfg()
+        limit = time.time() - cls.minAge
+        candidates = []
+        with tl.lock:
+            series = list(tl.tlSeries)
+        for ser in series:
+            if ser.status != "FINISHED":
+                continue
+            size = 0
+            mtime = 0
+            files = 0
+            for d, entry in cls._dirs.items():
+                if d == ser.path \
+                or d.startswith(ser.path + "/"):
+                    for name, (fsize, fmtime) in entry["files"].items():
+                        size += fsize
+                        mtime = max(mtime, fmtime)
+                    files += len(entry["files"])
+            if mtime < limit:
+                candidates.append((mtime, size, files, ser))
+        candidates.sort(key=lambda c: c[0])
+        freed = 0
+        for (mtime, size, files, ser) in candidates:
+            if freed >= need:
+                break
+            with tl.lock:
+                # The series may have been restarted or removed in the meantime
+                if ser.status != "FINISHED":
+                    continue
+                logger.info("Retention: deleting photo series %s with %s bytes", ser.name, size)
+                if not tl.removeSeries(ser):
+                    continue
+            freed += size
+            cls.status["deleted_files"] += files
+        cls.status["deleted_bytes"] += freed
+        return freed
@@ -2,6 +2,9 @@ DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS config;
 DROP TABLE IF EXISTS events;
 DROP TABLE IF EXISTS eventactions;
+DROP TABLE IF EXISTS eventdays;
+DROP TABLE IF EXISTS mediadirs;
+DROP TABLE IF EXISTS mediafiles;
 
 CREATE TABLE IF NOT EXISTS user (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -52,3 +55,62 @@ CREATE INDEX IF NOT EXISTS eventactions_type_idx ON eventactions(
   actiontype
 );
 
+CREATE INDEX IF NOT EXISTS events_date_ts_idx ON events(
+  date,
+  timestamp
+);
+
+CREATE INDEX IF NOT EXISTS eventactions_event_ts_idx ON eventactions(
+  event,
+  actiontype,
+  timestamp
+);
+
+CREATE INDEX IF NOT EXISTS eventactions_date_idx ON eventactions(
+  date
+);
+
+CREATE TABLE IF NOT EXISTS eventdays (
+  date TEXT PRIMARY KEY,
+  nrevents INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS events_insert_trg AFTER INSERT ON events
+BEGIN
+  INSERT INTO eventdays (date, nrevents) VALUES (NEW.date, 1)
+    ON CONFLICT(date) DO UPDATE SET nrevents = nrevents + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS events_delete_trg AFTER DELETE ON events
+BEGIN
+  UPDATE eventdays SET nrevents = nrevents - 1 WHERE date = OLD.date;
+  DELETE FROM eventdays WHERE date = OLD.date AND nrevents <= 0;
+END;
+
+CREATE TABLE IF NOT EXISTS mediadirs (
+  dir TEXT PRIMARY KEY,
+  mtime INTEGER,
+  scanned REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mediafiles (
+  dir TEXT NOT NULL,
+  file TEXT NOT NULL,
+  name TEXT NOT NULL,
+  ext TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  ts TEXT NOT NULL,
+  PRIMARY KEY (dir, file)
+);
+
+CREATE INDEX IF NOT EXISTS mediafiles_ts_idx ON mediafiles(
+  dir,
+  kind,
+  ts,
+  file
+);
+
+CREATE INDEX IF NOT EXISTS mediafiles_name_idx ON mediafiles(
+  dir,
+  name
+);
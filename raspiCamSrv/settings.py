@@ -2,7 +2,8 @@ from flask import Blueprint, Response, flash, g, render_template, request, curre
 from werkzeug.exceptions import abort
 from raspiCamSrv.camCfg import CameraCfg, CameraControls, CameraProperties, CameraConfig, ServerConfig, TriggerConfig, TuningConfig, vButton, ActionButton, AiConfig, LiveButton
 from raspiCamSrv.camCfg import GPIODevice
-from raspiCamSrv.camera_pi import Camera, CameraEvent
+from raspiCamSrv.camera_pi import Camera, CameraEvent, FrameRing
+from raspiCamSrv.metrics import Metrics
 from raspiCamSrv.photoseriesCfg import PhotoSeriesCfg
 from raspiCamSrv.motionDetector import MotionDetector
 from raspiCamSrv.triggerHandler import TriggerHandler
@@ -176,9 +177,31 @@ def serverconfig():
                                 reloadCamInfoNeeded = True
                     sc.useUsbCameras = useUsbCameras
                     cfg.setSupportedCameras()
+            usbMjpegPassthrough = not request.form.get("usbmjpegpassthrough") is None
+            if usbMjpegPassthrough != sc.usbMjpegPassthrough:
+                sc.usbMjpegPassthrough = usbMjpegPassthrough
+                if sc.activeCameraIsUsb == True:
+                    restartLiveStream = True
 
             useAPI = not request.form.get("useapi") is None
             sc.useAPI = useAPI
+            sc.useAsyncStreaming = not request.form.get("useasyncstreaming") is None
+            sc.asyncStreamingPort = int(request.form["asyncstreamingport"])
+            streamLatencyHistogram = not request.form.get("streamlatencyhistogram") is None
+            if streamLatencyHistogram != FrameRing.latency.enabled:
+                FrameRing.latency.reset()
+                FrameRing.latency.enabled = streamLatencyHistogram
+            sc.streamLatencyHistogram = streamLatencyHistogram
+            sc.collectMetrics = not request.form.get("collectmetrics") is None
+            Metrics.setEnabled(sc.collectMetrics)
+            sc.retentionActive = not request.form.get("retentionactive") is None
+            sc.retentionHighWater = int(request.form["retentionhighwater"])
+            sc.retentionLowWater = int(request.form["retentionlowwater"])
+            cats = sc.retentionCategories
+            for cat in cats:
+                if not request.form.get("retentionprio_" + cat) is None:
+                    cats[cat]["priority"] = int(request.form.get("retentionprio_" + cat))
+                cats[cat]["protect"] = not request.form.get("retentionprotect_" + cat) is None
             sc.locLatitude = float(request.form["loclatitude"])
             sc.locLongitude = float(request.form["loclongitude"])
             sc.locElevation = float(request.form["locelevation"])
@@ -397,6 +420,8 @@ def resetServer():
         Camera.stopPhotoSeriesRequested = False
         Camera.event = CameraEvent()
         Camera.event2 = None
+        Camera.frameRing = FrameRing("video_feed")
+        Camera.frameRing2 = FrameRing("video_feed2")
         Camera._instance = None
         
         msg = "Server configuration has been reset to default values"
@@ -1,4 +1,5 @@
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, FrameRing
+from raspiCamSrv.metrics import Metrics
 from raspiCamSrv.camCfg import CameraCfg
 from raspiCamSrv.camCfg import StereoConfig
 from _thread import get_ident
@@ -86,6 +87,7 @@ class StereoCam():
             cls.stereoFrameA = None
             cls.stereoFrame = None
             cls.event = StereoEvent()
+            cls.frameRing = FrameRing("stereo_feed")
             cls.camL = None
             cls.camR = None
             cls.leftStereoMap_x = None
@@ -210,6 +212,7 @@ class StereoCam():
         """ Process stereo image
         """
         # logger.debug("Thread %s: StereoCam._processStereoImage", get_ident())
+        mt = Metrics.enabled and time.perf_counter()
 
         cfg = CameraCfg()
         stc = cfg.stereoCfg
@@ -266,6 +269,10 @@ class StereoCam():
 
         # Signal that a new stereo frame is available
         self.event.set()
+        if self.stereoFrame:
+            self.frameRing.publish(self.stereoFrame)
+        if mt:
+            Metrics.record("stereo_process", time.perf_counter() - mt)
 
     def _stereoThread(self):
         """ Stereo camera thread
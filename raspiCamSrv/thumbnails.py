@@ -0,0 +1,254 @@
+from raspiCamSrv.camCfg import CameraCfg
+from _thread import get_ident
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hashlib
+import os
+import logging
+
+# Try to import PIL
+try:
+    from PIL import Image
+    pilAvailable = True
+except ImportError:
+    pilAvailable = False
+
+# Try to import cv2
+try:
+    import cv2
+    cv2Available = True
+except ImportError:
+    cv2Available = False
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTS = (".mp4", ".h264")
+PHOTO_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class Thumbnails():
+    """ Thumbnails for photos and videos with an on-disk cache
+
+    The cache file name is derived from path, modification time and size of the source
+    and from the thumbnail size, so that a modified source gets a new thumbnail
+    and stale thumbnails are removed by eviction.
+
+    Thumbnails are generated in a small thread pool,
+    either on request of a thumbnail or after a photo has been saved.
+    JPEG photos are decoded in draft mode at reduced resolution.
+    Videos get the thumbnail from their first frame.
+
+    The cache is limited to cacheLimit bytes.
+    If the limit is exceeded, the least recently used thumbnails are removed.
+    """
+    maxSize = 320
+    quality = 80
+    cacheLimit = 200 * 1024 * 1024
+    workers = 2
+    _pool = None
+    _lock = threading.Lock()
+    _pending = {}
+    _cacheSize = None
+
+    @classmethod
+    def cacheDir(cls) -> str:
+        return CameraCfg().serverConfig.photoRoot + "/thumbnails"
+
+    @classmethod
+    def isSupported(cls, fp: str) -> bool:
+        """ Whether a thumbnail can be generated for the file
+        """
+        ext = os.path.splitext(fp)[1].lower()
+        if ext in PHOTO_EXTS:
+            return pilAvailable or cv2Available
+        if ext in VIDEO_EXTS:
+            return cv2Available
+        return False
+
+    @classmethod
+    def _cachePath(cls, fp: str, st) -> str:
+        """ Path of the cached thumbnail for a source with stat result st
+        """
+        key = "%s|%s|%s|%s" % (fp, st.st_mtime_ns, st.st_size, cls.maxSize)
+        h = hashlib.sha1(key.encode()).hexdigest()
+        return cls.cacheDir() + "/" + h[:2] + "/" + h + ".jpg"
+
+    @classmethod
+    def _getPool(cls) -> ThreadPoolExecutor:
+        if cls._pool is None:
+            with cls._lock:
+                if cls._pool is None:
+                    cls._pool = ThreadPoolExecutor(max_workers=cls.workers, thread_name_prefix="raspiCamSrv-thumb")
+        return cls._pool
+
+    @classmethod
+    def get(cls, fp: str) -> str:
+        """ Get the path of the thumbnail for file fp
+
+        The thumbnail is generated if it is not yet in the cache.
+
+        Returns:
+            str: path of the thumbnail or None if no thumbnail can be generated
+        """
+        fp = os.path.normpath(fp)
+        if not cls.isSupported(fp):
+            return None
+        try:
+            st = os.stat(fp)
+        except FileNotFoundError:
+            return None
+        tp = cls._cachePath(fp, st)
+        if os.path.exists(tp):
+            # Update the modification time which is used for LRU eviction
+            try:
+                os.utime(tp)
+            except OSError:
+                pass
+            return tp
+        try:
+            return cls._submit(fp, tp).result(timeout=30)
+        except Exception as e:
+            logger.error("Thumbnails.get - error for %s: %s", fp, e)
+            return None
+
+    @classmethod
+    def submit(cls, fp: str):
+        """ Queue generation of the thumbnail for file fp
+
+        This is used after a photo has been saved.
+        """
+        try:
+            fp = os.path.normpath(fp)
+            if not cls.isSupported(fp):
+                return
+            tp = cls._cachePath(fp, os.stat(fp))
+            if not os.path.exists(tp):
+                cls._submit(fp, tp)
+        except Exception as e:
+            logger.error("Thumbnails.submit - error for %s: %s", fp, e)
+
+    @classmethod
+    def _submit(cls, fp: str, tp: str):
+        """ Submit generation to the pool unless it is already pending
+        """
+        with cls._lock:
+            future = cls._pending.get(tp)
+            if future is None:
+                future = cls._getPool().submit(cls._generate, fp, tp)
+                cls._pending[tp] = future
+        return future
+
+    @classmethod
+    def _generate(cls, fp: str, tp: str) -> str:
+        """ Generate the thumbnail for fp and store it as tp
+        """
+        tmp = tp + ".tmp"
+        try:
+            ext = os.path.splitext(fp)[1].lower()
+            os.makedirs(os.path.dirname(tp), exist_ok=True)
+            if ext in VIDEO_EXTS:
+                done = cls._fromVideo(fp, tmp)
+            elif pilAvailable:
+                done = cls._fromPhotoPIL(fp, tmp)
+            else:
+                done = cls._fromPhotoCv2(fp, tmp)
+            if not done:
+                return None
+            os.replace(tmp, tp)
+            logger.debug("Thread %s: Thumbnails._generate - %s", get_ident(), tp)
+            cls._evict(os.path.getsize(tp))
+            return tp
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with cls._lock:
+                cls._pending.pop(tp, None)
+
+    @classmethod
+    def _fromPhotoPIL(cls, fp: str, tp: str) -> bool:
+        with Image.open(fp) as img:
+            # For JPEG, decode at the smallest scale which is still larger than the thumbnail
+            img.draft("RGB", (cls.maxSize, cls.maxSize))
+            img.thumbnail((cls.maxSize, cls.maxSize))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(tp, "JPEG", quality=cls.quality)
+        return True
+
+    @classmethod
+    def _fromPhotoCv2(cls, fp: str, tp: str) -> bool:
+        img = cv2.imread(fp, cv2.IMREAD_REDUCED_COLOR_4)
+        if img is None:
+            return False
+        return cls._writeCv2(img, tp)
+
+    @classmethod
+    def _fromVideo(cls, fp: str, tp: str) -> bool:
+        cap = cv2.VideoCapture(fp)
+        try:
+            ok, img = cap.read()
+        finally:
+            cap.release()
+        if not ok:
+            return False
+        return cls._writeCv2(img, tp)
+
+    @classmethod
+    def _writeCv2(cls, img, tp: str) -> bool:
+        (h, w) = img.shape[:2]
+        scale = cls.maxSize / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        # The file name has no image extension, so encode explicitly
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, cls.quality])
+        if ok:
+            with open(tp, "wb") as f:
+                f.write(buf.tobytes())
+        return ok
+
+    @classmethod
+    def _evict(cls, added: int):
+        """ Remove least recently used thumbnails if the cache exceeds cacheLimit
+        """
+        with cls._lock:
+            if cls._cacheSize is None:
+                cls._cacheSize = sum(e[1] for e in cls._scan())
+            else:
+                cls._cacheSize += added
+            if cls._cacheSize <= cls.cacheLimit:
+                return
+            entries = cls._scan()
+            entries.sort(key=lambda e: e[2])
+            total = sum(e[1] for e in entries)
+            target = cls.cacheLimit * 0.9
+            removed = 0
+            for (path, size, mtime) in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            cls._cacheSize = total
+        logger.debug("Thread %s: Thumbnails._evict - removed %s thumbnails. Cache size: %s", get_ident(), removed, total)
+
+    @classmethod
+    def _scan(cls) -> list:
+        """ List (path, size, mtime) of all cached thumbnails
+        """
+        entries = []
+        cd = cls.cacheDir()
+        if not os.path.isdir(cd):
+            return entries
+        with os.scandir(cd) as dirs:
+            for d in dirs:
+                if not d.is_dir():
+                    continue
+                with os.scandir(d.path) as files:
+                    for f in files:
+                        if f.name.endswith(".jpg"):
+                            st = f.stat()
+                            entries.append((f.path, st.st_size, st.st_mtime))
+        return entries
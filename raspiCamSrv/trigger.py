@@ -1,10 +1,11 @@
 from flask import Blueprint, Response, flash, g, redirect, render_template, request, url_for
 from flask import send_file, send_from_directory
 from werkzeug.exceptions import abort
-from raspiCamSrv.camera_pi import Camera
+from raspiCamSrv.camera_pi import Camera, StreamClient
 from raspiCamSrv.camCfg import CameraCfg, Trigger, Action, ServerConfig, TriggerConfig
 from raspiCamSrv.motionDetector import MotionDetector
 from raspiCamSrv.triggerHandler import TriggerHandler
+from raspiCamSrv.eventWriter import EventWriter
 from raspiCamSrv.version import version
 from _thread import get_ident
 from datetime import datetime
@@ -46,15 +47,26 @@ def trigger():
     return render_template("trigger/trigger.html", tc=tc, sc=sc, tmp=tmp)
 
 
-def trg_gen(camera):
+def trg_gen(camera, ipaddr: str, stream: str, fps: float):
     """Video streaming generator function."""
     # logger.debug("Thread %s: In trg_gen", get_ident())
-    yield b"--frame\r\n"
-    while True:
-        frame, frameRaw = camera.get_frame()
-        if frame is not None:
-            # logger.debug("Thread %s: trg_gen - Got frame of length %s", get_ident(), len(frame))
-            yield b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n--frame\r\n"
+    client = None
+    try:
+        # Register the client inside the generator, so that closing it always unregisters the client
+        client = StreamClient(ipaddr, stream, fps)
+        yield b"--frame\r\n"
+        seq = 0
+        while True:
+            client.pace()
+            # The chunk is shared with all other clients and must not be modified
+            seq, chunk = camera.get_chunk(seq, latest=True)
+            if chunk is not None:
+                # logger.debug("Thread %s: trg_gen - Got chunk %s of length %s", get_ident(), seq, len(chunk))
+                client.delivered(seq)
+                yield chunk
+    finally:
+        if not client is None:
+            client.close()
 
 @bp.route("/live_view_feed")
 @login_required
@@ -64,8 +76,9 @@ def trg_live_view_feed():
     )
     sc = CameraCfg().serverConfig
     sc.registerStreamingClient(request.remote_addr, "live_view", get_ident())
+    fps = request.args.get("fps", type=float)
     Camera().startLiveStream()
-    return Response(trg_gen(Camera()), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(trg_gen(Camera(), request.remote_addr, "live_view", fps), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @bp.route("/trgcontrol", methods=("GET", "POST"))
 @login_required
@@ -126,6 +139,15 @@ def trgcontrol():
             tc.detectionPauseSec = detectPause
         retPeriod = int(request.form["retentionperiod"])
         tc.retentionPeriod = retPeriod
+        if request.form.get("cleanupauto") is None:
+            tc.cleanupAuto = False
+        else:
+            tc.cleanupAuto = True
+        if not request.form.get("cleanuptime") is None:
+            try:
+                tc.cleanupTimeStr = request.form["cleanuptime"]
+            except ValueError:
+                err = "Cleanup time must be in the format HH:MM. The previous value has been kept."
 
         if sc.noCamera == False:
             if tc.triggeredByEvents == True \
@@ -170,13 +192,39 @@ def motion():
         if not request.form.get("motionthreshold") is None:
             motionThreshold = int(request.form["motionthreshold"])
             tc.motionThreshold = motionThreshold
+        if not request.form.get("motionanalysisscale") is None:
+            motionAnalysisScale = int(request.form["motionanalysisscale"])
+            tc.motionAnalysisScale = motionAnalysisScale
         if not request.form.get("backsubmodel") is None:
             backSubModel = int(request.form["backsubmodel"])
             tc.backSubModel = backSubModel
+        if not request.form.get("bglearningrate") is None:
+            bgLearningRate = float(request.form["bglearningrate"])
+            tc.bgLearningRate = bgLearningRate
+        if not request.form.get("bgwarmupframes") is None:
+            bgWarmupFrames = int(request.form["bgwarmupframes"])
+            tc.bgWarmupFrames = bgWarmupFrames
         if request.form.get("videobboxes") is None:
             tc.videoBboxes = False
         else:
             tc.videoBboxes = True
+        if request.form.get("motiondutycycle") is None:
+            tc.motionDutyCycle = False
+        else:
+            tc.motionDutyCycle = True
+        if not request.form.get("motionidlerate") is None:
+            motionIdleRate = float(request.form["motionidlerate"])
+            tc.motionIdleRate = motionIdleRate
+        if not request.form.get("motionprethreshold") is None:
+            motionPreThreshold = float(request.form["motionprethreshold"])
+            tc.motionPreThreshold = motionPreThreshold
+        if not request.form.get("motionquietperiod") is None:
+            motionQuietPeriod = int(request.form["motionquietperiod"])
+            tc.motionQuietPeriod = motionQuietPeriod
+        if request.form.get("motionworkerprocess") is None:
+            tc.motionWorkerProcess = False
+        else:
+            tc.motionWorkerProcess = True
         if request.form.get("photorois") is None:
             tc.photoRois = False
         else:
@@ -377,9 +425,14 @@ def action():
         if vr == 1:
             tc.actionVR = vr
         else:
-            err = "Circular output is currently not supported"
+            if sc.activeCameraIsUsb == True:
+                tc.actionVR = vr
+            else:
+                err = "Circular output is currently only supported for USB cameras"
         cbs = int(request.form["actioncircsize"])
         tc.actionCircSize = cbs
+        if not request.form.get("actioncircmaxmb") is None:
+            tc.actionCircMaxMB = int(request.form["actioncircmaxmb"])
         dur = int(request.form["actionvideoduration"])
         tc.actionVideoDuration = dur
         pb = int(request.form["actionphotoburst"])
@@ -788,6 +841,36 @@ def do_refresh():
         pass
     return redirect(url_for("trigger.trigger"))
 
+@bp.route("/events_next_page", methods=("GET", "POST"))
+@login_required
+def events_next_page():
+    logger.debug("In events_next_page")
+    cfg = CameraCfg()
+    g.hostname = request.host
+    g.version = version
+    sc = cfg.serverConfig
+    tc = cfg._triggerConfig
+    if tc.useRoI == True:
+        Camera().startLiveStream()
+    sc.lastTriggerTab = "trgevents"
+    tc.evPageAfter = tc.evPageLast
+    return redirect(url_for("trigger.trigger"))
+
+@bp.route("/events_first_page", methods=("GET", "POST"))
+@login_required
+def events_first_page():
+    logger.debug("In events_first_page")
+    cfg = CameraCfg()
+    g.hostname = request.host
+    g.version = version
+    sc = cfg.serverConfig
+    tc = cfg._triggerConfig
+    if tc.useRoI == True:
+        Camera().startLiveStream()
+    sc.lastTriggerTab = "trgevents"
+    tc.evPageAfter = ("", 0)
+    return redirect(url_for("trigger.trigger"))
+
 @bp.route("/prev_cal_month", methods=("GET", "POST"))
 @login_required
 def prev_cal_month():
@@ -898,14 +981,10 @@ def do_cleanup():
     sc.lastTriggerTab = "trgcalendar"
     if request.method == "POST":
         err = None
-        if sc.isTriggerRecording:
-            err = "You need to stop trigger recording before cleanup!"
-        if not err:
-            try:
-                tc.cleanupEvents()
-                err = "Cleanup successfull"
-            except Exception as e:
-                err = "Cleanup error: " + str(e)
+        try:
+            (done, err) = tc.cleanupEvents()
+        except Exception as e:
+            err = "Cleanup error: " + str(e)
         flash(err)
     return redirect(url_for("trigger.trigger"))
 
@@ -923,6 +1002,7 @@ def do_download_log():
     sc.lastTriggerTab = "trgcalendar"
     if request.method == "POST":
         err = None
+        EventWriter.flush()
         fp = tc.logFilePath
         (path, file) = os.path.split(fp)
         msg = f"Downloading {file}"
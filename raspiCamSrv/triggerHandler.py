@@ -6,8 +6,7 @@ from raspiCamSrv.motionDetector import MotionDetector
 from raspiCamSrv.camCfg import CameraCfg, TriggerConfig, ServerConfig, GPIODevice, Trigger, Action
 from _thread import get_ident
 from datetime import datetime, timedelta
-from raspiCamSrv.dbx import get_dbx
-from sqlite3 import Connection
+from raspiCamSrv.eventWriter import EventWriter
 from uuid import uuid4, UUID
 import smtplib
 import json
@@ -258,7 +257,6 @@ class TriggerHandler():
                 event_log = triggerCtrl["event_log"]
                 if event_log == True:
                     isEvent = True
-                    db = get_dbx()
 
         deviceId = action.device
         
@@ -271,8 +269,6 @@ class TriggerHandler():
                 acquired, reg = cls._findDeviceInRegistry("GPIO", deviceId, sc, busy=True)
 
         if acquired:
-            if isEvent == True:
-                db = get_dbx()
             deviceClass = reg["deviceClass"]
             deviceObj = reg["deviceObject"]
             method = action.method
@@ -324,12 +320,12 @@ class TriggerHandler():
 
                 # Log
                 if isEvent == True:
-                    cls._logEvent(db, "gpio_action", tc, eCtx, ctx)
+                    cls._logEvent("gpio_action", tc, eCtx, ctx)
             except Exception as e:
                 logger.error("TriggerHandler._doGpioAction - Error %s: %s", type(e), e)
                 err = f"Error {type(e)} while executing action: {e}"
                 if isEvent == True:
-                    cls._logEvent(db, "gpio_action_error", tc, eCtx, ctx, err=err)
+                    cls._logEvent("gpio_action_error", tc, eCtx, ctx, err=err)
                 tc.error = f"Error {type(e)} while executing action {action.id}: {e}"
                 
             # Wait for the specified duration
@@ -360,7 +356,7 @@ class TriggerHandler():
             ctx["action_stop"] = datetime.now()
             # Log stop
             if isEvent == True:
-                cls._logEvent(db, "gpio_action_finished", tc, eCtx, ctx)
+                cls._logEvent("gpio_action_finished", tc, eCtx, ctx)
             done = True
         else:
             logger.debug("Thread %s: TriggerHandler._doGpioAction - action=%s trigger.id=%s - Not executing. Device busy", get_ident(), action.id, triggerDisp)
@@ -395,12 +391,7 @@ class TriggerHandler():
             duration = actionCtrl["duration"]
             time.sleep(duration)
         
-        if isEvent:
-            db = get_dbx()
-        else:
-            db = None
-        
-        cls._doStopVideo(action, isEvent, sc, tc, eventId, db)
+        cls._doStopVideo(action, isEvent, sc, tc, eventId)
 
         thread = threading.current_thread()
         with cls._list_lock:
@@ -411,7 +402,7 @@ class TriggerHandler():
 
     
     @classmethod
-    def _doRecordVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID, db:Connection) -> tuple[bool, str]:
+    def _doRecordVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID) -> tuple[bool, str]:
         """ Record video according to action details
 
         Args:
@@ -429,7 +420,7 @@ class TriggerHandler():
         
         done = False
         
-        done, msg = cls._doStartVideo(action, isEvent, sc, tc, eventId, db)
+        done, msg = cls._doStartVideo(action, isEvent, sc, tc, eventId)
         
         recordingThread = threading.Thread(target=cls._videoTimer, args=(action, isEvent, sc, tc, eventId))
         ctx = cls._getActionContext(eventId, action.id)
@@ -440,7 +431,7 @@ class TriggerHandler():
         return done,msg
     
     @classmethod
-    def _doStartVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID, db:Connection) -> tuple[bool, str]:
+    def _doStartVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID) -> tuple[bool, str]:
         """ Start video recording according to action details
 
         Args:
@@ -504,7 +495,7 @@ class TriggerHandler():
                     msg = f"Video recording started {fp}"
 
                     if isEvent == True:
-                        cls._logEvent(db, "video_start",tc, eCtx, ctx)
+                        cls._logEvent("video_start",tc, eCtx, ctx)
                     done = True
                 else:
                     logger.debug("Thread %s: TriggerHandler._doStartVideo - Video recording did not start", get_ident())
@@ -522,12 +513,12 @@ class TriggerHandler():
 
         if done == False:
             if isEvent == True:
-                cls._logEvent(db, "video_start_err", tc, eCtx, ctx, err=msg)
+                cls._logEvent("video_start_err", tc, eCtx, ctx, err=msg)
             
         return done, msg
         
     @classmethod
-    def _doStopVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID, db:Connection) -> tuple[bool, str]:
+    def _doStopVideo(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID) -> tuple[bool, str]:
         """ Stop video recording according to action details
 
         Args:
@@ -559,7 +550,7 @@ class TriggerHandler():
                 sc.isVideoRecording = False
                 sc.isAudioRecording = False
                 if isEvent == True:
-                    cls._logEvent(db, "video_stop", tc, eCtx, ctx)
+                    cls._logEvent("video_stop", tc, eCtx, ctx)
                 done = True
                 logger.debug("Thread %s: TriggerHandler._doStopVideo - Video recording stopped", get_ident())
                 msg="Video recording stopped"
@@ -573,14 +564,14 @@ class TriggerHandler():
             
         if done == False:
             if isEvent == True:
-                cls._logEvent(db, "video_stop_err", tc, eCtx, ctx, err=msg)
+                cls._logEvent("video_stop_err", tc, eCtx, ctx, err=msg)
 
         ctx["action_stop"] = datetime.now()
 
         return done, msg
     
     @classmethod
-    def _doTakePhoto(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID, db:Connection) -> tuple[bool, str]:
+    def _doTakePhoto(cls, action:Action, isEvent:bool, sc:ServerConfig, tc:TriggerConfig, eventId:UUID) -> tuple[bool, str]:
         """ Take photo(s) according to action details
 
         Args:
@@ -659,7 +650,7 @@ class TriggerHandler():
                         msg = f"{msg}{burstCount} photos taken: {fp} ..."
                 # log
                 if isEvent == True:
-                    cls._logEvent(db, "photo_taken", tc, eCtx, ctx, photoCtx)                     
+                    cls._logEvent("photo_taken", tc, eCtx, ctx, photoCtx)                     
                 done = True
         except Exception as e:
             logger.error("TriggerHandler._doTakePhoto - error %s: %s", type(e), e)
@@ -668,7 +659,7 @@ class TriggerHandler():
         
         if done == False:
             if isEvent == True:
-                cls._logEvent(db, "photo_error", tc, eCtx, ctx, photoCtx, err=msg)
+                cls._logEvent("photo_error", tc, eCtx, ctx, photoCtx, err=msg)
 
         ctx["action_stop"] = datetime.now()
 
@@ -704,7 +695,6 @@ class TriggerHandler():
         done = False
         msg = ""
 
-        db = None
         isEvent = False
         if trigger:
             triggerCtrl = trigger.control
@@ -712,7 +702,6 @@ class TriggerHandler():
                 event_log = triggerCtrl["event_log"]
                 if event_log == True:
                     isEvent = True
-                    db = get_dbx()
         logger.debug("Thread %s: TriggerHandler._doCameraAction - isEvent=%s", get_ident(), isEvent)
 
         acquired = True
@@ -747,13 +736,13 @@ class TriggerHandler():
             if action.device == "CAM-1":
                 method = action.method
                 if method == "take_photo":
-                    done, msg = cls._doTakePhoto(action, isEvent, sc, tc, eventId, db)
+                    done, msg = cls._doTakePhoto(action, isEvent, sc, tc, eventId)
                 elif action.method == "record_video":
-                    done, msg = cls._doRecordVideo(action, isEvent, sc, tc, eventId, db)
+                    done, msg = cls._doRecordVideo(action, isEvent, sc, tc, eventId)
                 elif action.method == "start_video":
-                    done, msg = cls._doStartVideo(action, isEvent, sc, tc, eventId, db)
+                    done, msg = cls._doStartVideo(action, isEvent, sc, tc, eventId)
                 elif action.method == "stop_video":
-                    done, msg = cls._doStopVideo(action, isEvent, sc, tc, eventId, db)
+                    done, msg = cls._doStopVideo(action, isEvent, sc, tc, eventId)
                 else:
                     logger.error("TriggerHandler._doCameraAction - Method %s not supported for device %s/%s", action.method, action.source, action.device)
                     msg = f"Method {action.method} not supported for device {action.source}/{action.device}"
@@ -1164,7 +1153,7 @@ class TriggerHandler():
         logger.debug("Thread %s: TriggerHandler._waitForCompletion - exit", get_ident())
         
     @classmethod
-    def _logEvent(cls, db:Connection, logType:str, tc:TriggerConfig, eventCtx:dict, actionCtx:dict=None, photoCtx:dict=None, err:str=""):
+    def _logEvent(cls, logType:str, tc:TriggerConfig, eventCtx:dict, actionCtx:dict=None, photoCtx:dict=None, err:str=""):
         logger.debug("Thread %s: TriggerHandler._logEvent - entry", get_ident())
         
         triggerId = eventCtx["trigger"]
@@ -1175,13 +1164,11 @@ class TriggerHandler():
             # Event start
             logTS = eventTS
             key = eventTS
-            with open(tc.logFilePath, "a") as f:
-                f.write(eventCtx["event_TS"] + " Event  detected       Trigger: " + trigger.id + " - '" + trigger.source + "' " + str(trigger.params) + "\n")
-            db.execute(
+            EventWriter.log(tc.logFilePath, eventCtx["event_TS"] + " Event  detected       Trigger: " + trigger.id + " - '" + trigger.source + "' " + str(trigger.params))
+            EventWriter.execute(
                 "INSERT INTO events (timestamp, date, minute, time, type, trigger, triggertype, triggerparam) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (key, key[:10], key[11:16], key[11:19], "Motion", trigger.id, trigger.source, str(trigger.params))
             )
-            db.commit()
             
         elif logType == "gpio_action":
             # GPIO action
@@ -1195,16 +1182,14 @@ class TriggerHandler():
                     if duration > 0:
                         hasDuration = True
                 logTS = actionCtx["action_start"].strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    if hasDuration == True:
-                        f.write(logTS + "  GPIO: " + actionId + " started\n")
-                    else:
-                        f.write(logTS + "  GPIO: " + actionId + "\n")
-                db.execute(
+                if hasDuration == True:
+                    EventWriter.log(tc.logFilePath, logTS + "  GPIO: " + actionId + " started")
+                else:
+                    EventWriter.log(tc.logFilePath, logTS + "  GPIO: " + actionId)
+                EventWriter.execute(
                     "INSERT INTO eventactions (event, timestamp, date, time, actiontype, actionduration, filename, fullpath) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (eventTS, logTS, logTS[:10], logTS[11:19], actionId, duration, "", "")
                 )
-                db.commit()
             
         elif logType == "gpio_action_finished":
             # GPIO action finished
@@ -1215,21 +1200,18 @@ class TriggerHandler():
                 logTS = actionCtx["action_stop"].strftime("%Y-%m-%dT%H:%M:%S")
                 duration = actionCtx["action_stop"] - actionCtx["action_start"]
                 actionDuration = duration.total_seconds()
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + "  GPIO: " + actionId + " stopped\n")
-                db.execute(
+                EventWriter.log(tc.logFilePath, logTS + "  GPIO: " + actionId + " stopped")
+                EventWriter.execute(
                     "UPDATE eventactions set actionduration = ? WHERE event = ? AND timestamp = ? AND actiontype = ?",
                     (actionDuration, eventTS, actionTS, actionId)
                 )
-                db.commit()
         
         elif logType == "gpio_action_error":
             # GPIO Error
             if "action" in actionCtx:
                 actionId = actionCtx["action"]
                 logTS = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + "  GPIO: " + actionId + " Error:  " + err + "\n")
+                EventWriter.log(tc.logFilePath, logTS + "  GPIO: " + actionId + " Error:  " + err)
             
         elif logType == "photo_taken":
             # Photo taken
@@ -1237,21 +1219,18 @@ class TriggerHandler():
                 fnPhoto = photoCtx["photo_file"]
                 fpPhoto = photoCtx["photo_path"]
                 logTS = photoCtx["photo_time"].strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Photo: " + fnPhoto + "\n")
-                db.execute(
+                EventWriter.log(tc.logFilePath, logTS + " Photo: " + fnPhoto)
+                EventWriter.execute(
                     "INSERT INTO eventactions (event, timestamp, date, time, actiontype, actionduration, filename, fullpath) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (eventTS, logTS, logTS[:10], logTS[11:19], "Photo", 0, fnPhoto, fpPhoto)
                 )
-                db.commit()
         
         elif logType == "photo_error":
             # Photo Error
             if "photo_file" in photoCtx:
                 fnPhoto = photoCtx["photo_file"]
                 logTS = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Photo: " + fnPhoto + " Error:  " + err + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Photo: " + fnPhoto + " Error:  " + err)
 
         elif logType == "video_start":
             # Video Start
@@ -1265,21 +1244,18 @@ class TriggerHandler():
                     actionDuration = action.control["duration"]
                 else:
                     actionDuration = 0
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " started" + "\n")
-                db.execute(
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " started")
+                EventWriter.execute(
                     "INSERT INTO eventactions (event, timestamp, date, time, actiontype, actionduration, filename, fullpath) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (eventTS, logTS, logTS[:10], logTS[11:19], "Video", actionDuration, fnVideo, fpVideo)
                 )
-                db.commit()
         
         elif logType == "video_start_err":
             # Video Start error
             if "video" in actionCtx:
                 fnVideo = actionCtx["video"]["video_file"]
                 logTS = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " Start   Error: " + err + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " Start   Error: " + err)
             
         elif logType == "video_stop":
             # Video stopped
@@ -1294,22 +1270,19 @@ class TriggerHandler():
                     actionDuration = action.control["duration"]
                 else:
                     actionDuration = 0
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " stopped" + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " stopped")
                 logger.debug("Thread %s: MotionDetector._stopAction - UPDATE eventactions", get_ident())
-                db.execute(
+                EventWriter.execute(
                     "UPDATE eventactions set actionduration = ? WHERE event = ? AND timestamp = ? AND actiontype = ?",
                     (round(actionDuration,0), eventTS, videoKey, "Video")
                 )
-                db.commit()
         
         elif logType == "video_stop_err":
             # Video stop error
             if "video" in actionCtx:
                 fnVideo = actionCtx["video"]["video_file"]
                 logTS = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-                with open(tc.logFilePath, "a") as f:
-                    f.write(logTS + " Video: " + fnVideo + " Stop     Error" + err + "\n")
+                EventWriter.log(tc.logFilePath, logTS + " Video: " + fnVideo + " Stop     Error" + err)
         else:
             logger.error("TriggerHandler._logEvent - Unknown logType %s", logType)
         
@@ -1390,8 +1363,7 @@ class TriggerHandler():
 
                 # log event start
                 if isEvent == True:
-                    db = get_dbx()
-                    cls._logEvent(db, "start", tc, eventCtx)
+                    cls._logEvent("start", tc, eventCtx)
                 
                 # Search SMTP action in order to set it as last one
                 setAsLast = True
@@ -1773,6 +1745,7 @@ class TriggerHandler():
         cls._sub_threads = []
         cls._event_contexts = []
         cls._unregisterTriggers()
+        EventWriter.flush()
         cls.triggerThread = None
 
     @classmethod
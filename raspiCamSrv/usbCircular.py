@@ -0,0 +1,162 @@
+from _thread import get_ident
+from collections import deque
+import threading
+import time
+import logging
+
+# Try to import cv2
+try:
+    import cv2
+    cv2Available = True
+except ImportError:
+    cv2Available = False
+
+# Try to import numpy
+try:
+    import numpy as np
+    numpyAvailable = True
+except ImportError:
+    numpyAvailable = False
+
+logger = logging.getLogger(__name__)
+
+
+class UsbCircularOutput():
+    """ Circular buffer for video recording with USB cameras
+
+    The buffer is fed with the JPEG frames which are encoded anyway for the live stream,
+    so that buffering does not need additional encoding.
+    Frames are kept for bufferSec seconds, but the buffer never holds more than maxBytes.
+
+    When recording is started, the buffered frames are written to the video file,
+    followed by the live frames until recording is stopped.
+    Frames are decoded and written to the video in a separate thread.
+    If the thread cannot keep up, the oldest frames waiting to be written are dropped,
+    so that memory usage stays below maxBytes.
+
+    The interface corresponds to that of Picamera2 CircularOutput:
+    set fileoutput, then start() and stop() recording.
+    """
+    # Frame rate if it cannot be derived from the buffer
+    defaultFps = 30
+
+    def __init__(self, bufferSec: int = 5, maxBytes: int = 50 * 1024 * 1024):
+        self.bufferSec = bufferSec
+        self.maxBytes = maxBytes
+        self.fileoutput = None
+        self._frames = deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._recording = False
+        self._thread = None
+        self.dropped = 0
+
+    @property
+    def recording(self) -> bool:
+        return self._recording
+
+    def _popleft(self):
+        (ts, frame) = self._frames.popleft()
+        self._bytes -= len(frame)
+
+    def write(self, frame: bytes):
+        """ Add a JPEG encoded frame
+
+        This is called for every frame of the live stream.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._frames.append((now, frame))
+            self._bytes += len(frame)
+            if self._recording:
+                while self._bytes > self.maxBytes \
+                and len(self._frames) > 1:
+                    self._popleft()
+                    self.dropped += 1
+                self._cond.notify()
+            else:
+                limit = now - self.bufferSec
+                while len(self._frames) > 1 \
+                and (self._frames[0][0] < limit or self._bytes > self.maxBytes):
+                    self._popleft()
+
+    def start(self):
+        """ Start recording to fileoutput, beginning with the buffered frames
+        """
+        logger.debug("Thread %s: UsbCircularOutput.start - file: %s", get_ident(), self.fileoutput)
+        if not cv2Available \
+        or not numpyAvailable:
+            raise RuntimeError("Recording from USB camera requires OpenCV and numpy")
+        if self.fileoutput is None:
+            raise RuntimeError("No output file specified")
+        with self._cond:
+            if self._recording:
+                raise RuntimeError("Recording is already active")
+            self._recording = True
+            self.dropped = 0
+            fps = self.defaultFps
+            if len(self._frames) > 1:
+                span = self._frames[-1][0] - self._frames[0][0]
+                if span > 0:
+                    fps = min(max((len(self._frames) - 1) / span, 1), 60)
+            logger.debug("Thread %s: UsbCircularOutput.start - %s frames with %s bytes buffered. fps: %s", get_ident(), len(self._frames), self._bytes, fps)
+        self._thread = threading.Thread(target=self._recordThread, args=(self.fileoutput, fps), name="raspiCamSrv-usbCircular", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop recording
+
+        Frames received until now are written before the video file is closed.
+        """
+        logger.debug("Thread %s: UsbCircularOutput.stop", get_ident())
+        with self._cond:
+            if not self._recording:
+                return
+            self._recording = False
+            self._cond.notify()
+        if not self._thread is None:
+            self._thread.join()
+            self._thread = None
+        if self.dropped > 0:
+            logger.warning("USB circular recording: %s frames dropped because the buffer was full", self.dropped)
+
+    def _recordThread(self, fp: str, fps: float):
+        """ Write buffered and live frames to the video file
+        """
+        logger.debug("Thread %s: UsbCircularOutput._recordThread - started", get_ident())
+        out = None
+        size = None
+        count = 0
+        try:
+            while True:
+                with self._cond:
+                    while len(self._frames) == 0 \
+                    and self._recording:
+                        self._cond.wait(1)
+                    batch = list(self._frames)
+                    self._frames.clear()
+                    self._bytes = 0
+                    last = not self._recording
+                for (ts, frame) in batch:
+                    img = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if img is None:
+                        continue
+                    if out is None:
+                        size = (img.shape[1], img.shape[0])
+                        out = cv2.VideoWriter(fp, cv2.VideoWriter_fourcc(*"avc1"), fps, size)
+                        if not out.isOpened():
+                            logger.error("USB circular recording: VideoWriter for %s not opened", fp)
+                    elif (img.shape[1], img.shape[0]) != size:
+                        img = cv2.resize(img, size)
+                    out.write(img)
+                    count += 1
+                if last:
+                    break
+        except Exception as e:
+            logger.error("USB circular recording: error writing %s: %s", fp, e)
+            with self._cond:
+                self._recording = False
+        finally:
+            if not out is None:
+                out.release()
+        logger.debug("Thread %s: UsbCircularOutput._recordThread - %s frames written to %s", get_ident(), count, fp)
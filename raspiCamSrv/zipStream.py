@@ -0,0 +1,135 @@
+import os
+import struct
+import time
+import zlib
+from _thread import get_ident
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Files with these extensions are already compressed and are stored as is
+STORED_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".mp4", ".h264", ".mjpeg", ".zip", ".dng")
+
+CHUNK_SIZE = 64 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+_FLAGS = 0x0008 | 0x0800   # data descriptor follows the data, UTF-8 file names
+
+
+def _dosDateTime(mtime: float) -> tuple:
+    """ DOS date and time of a timestamp
+    """
+    t = time.localtime(mtime)
+    year = max(t.tm_year, 1980)
+    dosTime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dosDate = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return (dosTime, dosDate)
+
+
+def zipStream(files: list, chunkSize: int = CHUNK_SIZE):
+    """ Generate a ZIP archive for the given files
+
+    The archive is generated on the fly while files are read in chunks,
+    so that memory usage does not depend on the number and size of the files.
+    Each entry has a local header without sizes, followed by the data and a data descriptor.
+    Already compressed media are stored, other files are deflated.
+    ZIP64 extensions are used for large files and archives.
+
+    Args:
+        files: list of (path, name in archive)
+
+    Yields:
+        bytes of the archive
+    """
+    logger.debug("Thread %s: zipStream - %s files", get_ident(), len(files))
+    offset = 0
+    central = []
+    for (fp, arcName) in files:
+        try:
+            st = os.stat(fp)
+        except OSError as e:
+            logger.error("zipStream - skipping %s: %s", fp, e)
+            continue
+        name = arcName.encode("utf-8")
+        ext = os.path.splitext(fp)[1].lower()
+        method = ZIP_STORED if ext in STORED_EXTS else ZIP_DEFLATED
+        (dosTime, dosDate) = _dosDateTime(st.st_mtime)
+        # Sizes are not known in advance. Use ZIP64 if the file might exceed 4 GB
+        zip64 = st.st_size >= ZIP64_LIMIT - 0x100000
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+        header = struct.pack("<IHHHHHIIIHH",
+                             0x04034b50, 45 if zip64 else 20, _FLAGS, method, dosTime, dosDate,
+                             0, ZIP64_MARKER if zip64 else 0, ZIP64_MARKER if zip64 else 0,
+                             len(name), len(extra))
+        yield header + name + extra
+        headerOffset = offset
+        offset += len(header) + len(name) + len(extra)
+
+        crc = 0
+        usize = 0
+        csize = 0
+        comp = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+        with open(fp, "rb") as f:
+            while True:
+                chunk = f.read(chunkSize)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                usize += len(chunk)
+                if comp:
+                    chunk = comp.compress(chunk)
+                if chunk:
+                    csize += len(chunk)
+                    yield chunk
+        if comp:
+            chunk = comp.flush()
+            csize += len(chunk)
+            yield chunk
+        offset += csize
+
+        if zip64:
+            descriptor = struct.pack("<IIQQ", 0x08074b50, crc, csize, usize)
+        else:
+            descriptor = struct.pack("<IIII", 0x08074b50, crc, csize, usize)
+        yield descriptor
+        offset += len(descriptor)
+        central.append((name, method, dosTime, dosDate, crc, csize, usize, headerOffset))
+
+    # Central directory
+    cdOffset = offset
+    cdSize = 0
+    for (name, method, dosTime, dosDate, crc, csize, usize, headerOffset) in central:
+        ext64 = b""
+        if usize >= ZIP64_LIMIT:
+            ext64 += struct.pack("<Q", usize)
+            usize = ZIP64_MARKER
+        if csize >= ZIP64_LIMIT:
+            ext64 += struct.pack("<Q", csize)
+            csize = ZIP64_MARKER
+        if headerOffset >= ZIP64_LIMIT:
+            ext64 += struct.pack("<Q", headerOffset)
+            headerOffset = ZIP64_MARKER
+        extra = struct.pack("<HH", 0x0001, len(ext64)) + ext64 if ext64 else b""
+        version = 45 if ext64 else 20
+        entry = struct.pack("<IHHHHHHIIIHHHHHII",
+                            0x02014b50, version, version, _FLAGS, method, dosTime, dosDate,
+                            crc, csize, usize, len(name), len(extra), 0, 0, 0, 0o100644 << 16, headerOffset)
+        entry += name + extra
+        cdSize += len(entry)
+        yield entry
+
+    # End of central directory
+    count = len(central)
+    if count >= 0xFFFF \
+    or cdSize >= ZIP64_LIMIT \
+    or cdOffset >= ZIP64_LIMIT:
+        eocd64Offset = cdOffset + cdSize
+        yield struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, count, count, cdSize, cdOffset)
+        yield struct.pack("<IIQI", 0x07064b50, 0, eocd64Offset, 1)
+        yield struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, 0xFFFF, 0xFFFF, ZIP64_MARKER, ZIP64_MARKER, 0)
+    else:
+        yield struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, count, count, cdSize, cdOffset, 0)
+    logger.debug("Thread %s: zipStream - done. %s entries, %s bytes", get_ident(), count, cdOffset + cdSize)
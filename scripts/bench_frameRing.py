@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+""" Benchmark for the MJPEG fan-out to multiple stream clients
+
+A publisher thread publishes synthetic JPEG frames at a fixed rate.
+N viewer threads consume the frames the way the streaming generators do
+and write them to /dev/null, standing in for the client socket.
+
+Two implementations are measured:
+- ring:   FrameRing with shared, prebuilt multipart chunks (current implementation)
+- legacy: CameraEvent with one threading.Event per client
+          and a multipart chunk concatenated per client (previous implementation)
+
+For each viewer count, the process CPU time per published frame is reported.
+
+Run from the repository root on the target device:
+    python scripts/bench_frameRing.py --viewers 1,2,4,6,8,10 --fps 30 --seconds 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from raspiCamSrv.camera_pi import FrameRing, CameraEvent
+
+
+def publisher(publish, frame: bytes, fps: float, seconds: float, stop: threading.Event) -> int:
+    """ Publish frame at the given rate. Returns the number of published frames
+    """
+    interval = 1 / fps
+    count = 0
+    start = time.perf_counter()
+    next = start
+    while time.perf_counter() - start < seconds:
+        publish(frame)
+        count += 1
+        next += interval
+        delay = next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    stop.set()
+    return count
+
+
+def ringViewer(ring: FrameRing, stop: threading.Event, delivered: list, idx: int):
+    sink = open(os.devnull, "wb", buffering=0)
+    seq = 0
+    try:
+        while not stop.is_set():
+            seq, chunk = ring.get(seq, timeout=0.5, latest=True)
+            if chunk is not None:
+                sink.write(memoryview(chunk))
+                delivered[idx] += 1
+    finally:
+        sink.close()
+
+
+def legacyViewer(event: CameraEvent, state: dict, stop: threading.Event, delivered: list, idx: int):
+    sink = open(os.devnull, "wb", buffering=0)
+    try:
+        while not stop.is_set():
+            event.wait()
+            if stop.is_set():
+                break
+            event.clear()
+            frame = state["frame"]
+            sink.write(b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n--frame\r\n")
+            delivered[idx] += 1
+    finally:
+        sink.close()
+
+
+def run(mode: str, viewers: int, frame: bytes, fps: float, seconds: float) -> tuple:
+    """ Run one measurement
+
+    Returns:
+        (published frames, CPU ms per frame, mean frames delivered per viewer)
+    """
+    stop = threading.Event()
+    delivered = [0] * viewers
+    if mode == "ring":
+        ring = FrameRing("bench")
+        publish = ring.publish
+        threads = [threading.Thread(target=ringViewer, args=(ring, stop, delivered, i)) for i in range(viewers)]
+        wake = ring.wakeup
+    else:
+        event = CameraEvent()
+        state = {"frame": None}
+        def publish(f):
+            state["frame"] = f
+            event.set()
+        threads = [threading.Thread(target=legacyViewer, args=(event, state, stop, delivered, i)) for i in range(viewers)]
+        wake = event.set
+    for t in threads:
+        t.start()
+    # Let the viewers register before measuring
+    time.sleep(0.2)
+    cpu0 = time.process_time()
+    published = publisher(publish, frame, fps, seconds, stop)
+    cpu1 = time.process_time()
+    wake()
+    for t in threads:
+        t.join(2)
+    cpuPerFrame = (cpu1 - cpu0) / published * 1000 if published else 0
+    return (published, cpuPerFrame, sum(delivered) / viewers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU per frame for MJPEG fan-out against viewer count")
+    parser.add_argument("--viewers", default="1,2,4,6,8,10", help="comma separated viewer counts")
+    parser.add_argument("--fps", type=float, default=30, help="published frames per second")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each measurement")
+    parser.add_argument("--size", type=int, default=150000, help="size of a JPEG frame in bytes")
+    parser.add_argument("--mode", choices=["ring", "legacy", "both"], default="both")
+    args = parser.parse_args()
+
+    frame = b"\xff\xd8" + os.urandom(args.size - 4) + b"\xff\xd9"
+    modes = ["ring", "legacy"] if args.mode == "both" else [args.mode]
+    print("%-7s %8s %10s %14s %18s" % ("mode", "viewers", "frames", "CPU ms/frame", "delivered/viewer"))
+    for viewers in [int(v) for v in args.viewers.split(",")]:
+        for mode in modes:
+            (published, cpuPerFrame, perViewer) = run(mode, viewers, frame, args.fps, args.seconds)
+            print("%-7s %8d %10d %14.3f %18.1f" % (mode, viewers, published, cpuPerFrame, perViewer))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+""" Benchmark and equivalence check for non-max suppression of motion detection
+
+The vectorized MotionDetectAlgoIB._non_max_suppression is compared with
+the previous implementation with scalar IoU per pair (legacy).
+
+Equivalence check:
+    For random sets of boxes and thresholds, the result must be identical to legacy.
+
+Benchmark:
+    Time per call for 10, 100 and 1000 synthetic boxes.
+
+Run from the repository root:
+    python scripts/bench_nms.py --trials 2000
+The exit code is 1 if the equivalence check fails.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from raspiCamSrv.motionAlgoIB import MotionDetectAlgoIB
+
+
+def legacyRemoveContained(boxes):
+    """ Previous MotionDetectAlgoIB._remove_contained_bboxes
+    """
+    check_array = np.array([True, True, False, False])
+    keep = list(range(0, len(boxes)))
+    for i in keep:
+        for j in range(0, len(boxes)):
+            # check if box j is completely contained in box i
+            if np.all((np.array(boxes[j]) >= np.array(boxes[i])) == check_array):
+                try:
+                    keep.remove(j)
+                except ValueError:
+                    continue
+    return keep
+
+
+def legacyNms(boxes, scores, threshold=1e-1):
+    """ Previous MotionDetectAlgoIB._non_max_suppression
+    """
+    boxes = boxes[np.argsort(scores)[::-1]]
+    order = legacyRemoveContained(boxes)
+    keep = []
+    while order:
+        i = order.pop(0)
+        keep.append(i)
+        for j in order:
+            intersection = max(0, min(boxes[i][2], boxes[j][2]) - max(boxes[i][0], boxes[j][0])) * \
+                        max(0, min(boxes[i][3], boxes[j][3]) - max(boxes[i][1], boxes[j][1]))
+            union = (boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]) + \
+                    (boxes[j][2] - boxes[j][0]) * (boxes[j][3] - boxes[j][1]) - intersection
+            iou = intersection / union
+            if iou > threshold:
+                order.remove(j)
+    return boxes[keep]
+
+
+def randomBoxes(rng, n: int, width: int = 640, height: int = 480) -> tuple:
+    """ Random boxes like contour detections: integer [x1, y1, x2, y2] in clusters, score = area
+    """
+    clusters = max(1, n // 8)
+    cx = rng.integers(0, width, clusters)
+    cy = rng.integers(0, height, clusters)
+    c = rng.integers(0, clusters, n)
+    x1 = np.clip(cx[c] + rng.integers(-60, 60, n), 0, width - 2)
+    y1 = np.clip(cy[c] + rng.integers(-60, 60, n), 0, height - 2)
+    x2 = np.minimum(x1 + rng.integers(1, 120, n), width - 1)
+    y2 = np.minimum(y1 + rng.integers(1, 120, n), height - 1)
+    boxes = np.stack([x1, y1, x2, y2], axis=1)
+    scores = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+    return boxes, scores
+
+
+def timeit(fn, boxes, scores, threshold: float, minTime: float = 0.5) -> float:
+    """ Mean time per call in ms
+    """
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        fn(boxes, scores, threshold)
+        calls += 1
+        t = time.perf_counter() - t0
+        if t >= minTime:
+            return t / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and equivalence check for non-max suppression")
+    parser.add_argument("--trials", type=int, default=2000, help="random box sets for the equivalence check")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated box counts for the benchmark")
+    parser.add_argument("--threshold", type=float, default=0.001, help="IoU threshold")
+    parser.add_argument("--legacy-max", type=int, default=1000, help="largest box count timed for the legacy implementations")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    algo = MotionDetectAlgoIB()
+
+    # Equivalence check
+    failed = 0
+    for t in range(args.trials):
+        n = int(rng.integers(1, 60))
+        threshold = float(rng.choice([args.threshold, 0.1, 0.3, 0.5]))
+        boxes, scores = randomBoxes(rng, n)
+        res = algo._non_max_suppression(boxes, scores, threshold)
+        ref = legacyNms(boxes, scores, threshold)
+        if not np.array_equal(res, ref):
+            failed += 1
+            if failed <= 5:
+                print("Mismatch for %s boxes, threshold %s:\nboxes=%s\nscores=%s\nresult=%s\nexpected=%s"
+                      % (n, threshold, boxes.tolist(), scores.tolist(), res.tolist(), ref.tolist()))
+    print("Equivalence check: %s random sets, %s mismatches" % (args.trials, failed))
+
+    # Benchmark
+    print("%8s %14s %14s %14s" % ("boxes", "current ms", "legacy ms", "speedup"))
+    for n in [int(s) for s in args.sizes.split(",")]:
+        boxes, scores = randomBoxes(rng, n)
+        cur = timeit(algo._non_max_suppression, boxes, scores, args.threshold)
+        if n <= args.legacy_max:
+            leg = timeit(legacyNms, boxes, scores, args.threshold)
+            print("%8d %14.3f %14.3f %13.1fx" % (n, cur, leg, leg / cur))
+        else:
+            print("%8d %14.3f %14s %14s" % (n, cur, "-", "-"))
+    sys.exit(1 if failed > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+""" Benchmark for the live view frame pipeline of USB cameras
+
+Camera.framesUsb is run for a number of frames for each of the following paths:
+- decode:                 camera delivers BGR frames which are encoded as JPEG
+- passthrough:            camera JPEG is passed through without decoding
+- decode+transform:       BGR frames are flipped before encoding
+- passthrough+transform:  camera JPEG is decoded at reduced size, flipped and encoded
+
+For each path, frame rate and process CPU time per frame are reported.
+With --raw, the time for decoding the raw frame on demand (as done for photos,
+videos and motion detection) and its size are reported as well.
+
+The benchmark uses the configuration of the installation with a USB camera as active camera.
+Stop the raspiCamSrv service before running it from the repository root on the target device:
+    python scripts/bench_usbFrames.py --frames 300 --raw
+The configuration is not saved.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from raspiCamSrv import create_app
+from raspiCamSrv.camCfg import CameraCfg
+from raspiCamSrv.camera_pi import Camera
+
+PATHS = (
+    ("decode", False, False),
+    ("passthrough", True, False),
+    ("decode+transform", False, True),
+    ("passthrough+transform", True, True),
+)
+
+
+def setFlip(cfg: CameraCfg, flip: bool):
+    """ Set hflip for all configurations, so that framesUsb applies the transform
+    """
+    for conf in (cfg.photoConfig, cfg.rawConfig, cfg.liveViewConfig, cfg.videoConfig):
+        conf.transform_hflip = flip
+
+
+def run(frames: int, warmup: int, raw: bool) -> tuple:
+    """ Time framesUsb for the given number of frames
+
+    Returns:
+        (fps, CPU ms per frame, raw decode ms per frame, raw frame size)
+    """
+    it = Camera.framesUsb()
+    try:
+        for i in range(warmup):
+            next(it)
+        rawTime = 0.0
+        rawSize = None
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        for i in range(frames):
+            frame, frameRaw = next(it)
+            if raw:
+                r0 = time.perf_counter()
+                if frameRaw is None:
+                    frameRaw = Camera.usbDecodeFrame(frame)
+                rawTime += time.perf_counter() - r0
+                rawSize = (frameRaw.shape[1], frameRaw.shape[0])
+        t1 = time.perf_counter()
+        cpu1 = time.process_time()
+    finally:
+        it.close()
+    return (frames / (t1 - t0), (cpu1 - cpu0) / frames * 1000, rawTime / frames * 1000, rawSize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame rate and CPU per frame of framesUsb")
+    parser.add_argument("--frames", type=int, default=300, help="measured frames per path")
+    parser.add_argument("--warmup", type=int, default=30, help="frames skipped before measuring")
+    parser.add_argument("--raw", action="store_true", help="also decode the raw frame of each frame")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        Camera()
+        if Camera.camIsUsb == False:
+            print("The active camera is not a USB camera")
+            return
+        cfg = CameraCfg()
+        sc = cfg.serverConfig
+        print("%-22s %8s %14s %12s %12s" % ("path", "fps", "CPU ms/frame", "raw ms", "raw size"))
+        for (name, passthrough, flip) in PATHS:
+            sc.usbMjpegPassthrough = passthrough
+            setFlip(cfg, flip)
+            Camera.usbDecodeCache = (None, None)
+            (fps, cpuPerFrame, rawPerFrame, rawSize) = run(args.frames, args.warmup, args.raw)
+            rawStr = "%.3f" % rawPerFrame if args.raw else "-"
+            sizeStr = "%sx%s" % rawSize if rawSize else "-"
+            print("%-22s %8.1f %14.3f %12s %12s" % (name, fps, cpuPerFrame, rawStr, sizeStr))
+
+
+if __name__ == "__main__":
+    main()